@@ -1,10 +1,9 @@
 """The ICA integration."""
 
-import datetime
 import logging
 
 from homeassistant.config_entries import ConfigEntry, ConfigType
-from homeassistant.const import Platform, CONF_SCAN_INTERVAL
+from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 
 from .icaapi_async import IcaAPIAsync
@@ -14,13 +13,12 @@ from .const import (
     DOMAIN,
     CONF_ICA_PIN,
     CONF_ICA_ID,
-    DEFAULT_SCAN_INTERVAL,
 )
 from .icatypes import AuthCredentials, AuthState
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS: list[Platform] = [Platform.TODO]
+PLATFORMS: list[Platform] = [Platform.TODO, Platform.SENSOR]
 
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
@@ -39,9 +37,8 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     uid = entry.data[CONF_ICA_ID]
     pin = entry.data[CONF_ICA_PIN]
-    update_interval = datetime.timedelta(
-        minutes=entry.data.get(CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL)
-    )
+    # Each dataset is refreshed on its own schedule (see `CONF_REFRESH_INTERVALS`)
+    update_interval = None
 
     credentials = AuthCredentials(username=uid, password=pin)
     auth_state: AuthState = entry.data.get("auth_state", {})
@@ -1,29 +1,118 @@
 import asyncio
+import heapq
+import itertools
 import logging
-from collections.abc import Callable
-from homeassistant.core import HomeAssistant
+from collections.abc import Awaitable, Callable
+from enum import IntEnum
+from typing import TypedDict
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.config_entries import ConfigEntry, ConfigEntryState
 from homeassistant.helpers.event import async_call_later
 
+from .const import (
+    BACKGROUND_JOBS_IDLE_RETRY_SECONDS,
+    BACKGROUND_JOBS_MAX_CONCURRENT,
+    DEFAULT_EVENT_QUEUE_POLICY,
+    DEFAULT_EVENT_QUEUE_SIZE,
+    DOMAIN,
+    EVENT_PAYLOAD_MAX_BYTES,
+    EventQueuePolicy,
+)
+from .event_outbox import EventOutbox
+from .utils import coalesce_events
+
 _LOGGER = logging.getLogger(__name__)
 
 
+class Priority(IntEnum):
+    """Order in which queued events are fired and jobs are run.
+
+    High priority events are never held back."""
+
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+
+
+class EventQueueMetrics(TypedDict):
+    queue_depth: int
+    max_queue_depth: int
+    queue_size: int
+    policy: str
+    fired: int
+    coalesced: int
+    dropped: int
+    blocked: int
+
+
+class JobMetrics(TypedDict):
+    pending: int
+    running: int
+    completed: int
+    failed: int
+    cancelled: int
+
+
 class BackgroundWorker:
-    """Handles a queue for sending Home Assistant events."""
+    """Handles a queue for sending Home Assistant events, and runs background jobs.
+
+    Events are fired on the event loop in batches. Events of the same type, about the
+    same shopping list, that are queued within the same batch are merged into one.
+    Events queued with a dedup key are kept in the outbox (if any) until fired, even
+    across a shutdown before the entry is loaded, and are never dropped from a full
+    queue.
+
+    Jobs are deferred work, such as enrichment of cached data, that is run with a
+    bounded concurrency in order of priority. Idle jobs wait until `is_idle` says
+    so, e.g. until no refresh is running. Jobs are cancelled on shutdown."""
 
     def __init__(
         self,
         hass: HomeAssistant,
         config_entry: ConfigEntry,
         send_interval: int = 60,
+        batch_window: float = 1,
+        max_queue_size: int = DEFAULT_EVENT_QUEUE_SIZE,
+        queue_policy: EventQueuePolicy = DEFAULT_EVENT_QUEUE_POLICY,
+        outbox: EventOutbox | None = None,
+        max_concurrent_jobs: int = BACKGROUND_JOBS_MAX_CONCURRENT,
+        is_idle: Callable[[], bool] | None = None,
     ) -> None:
         # Example: CacheEntry(hass, f"{self._config_entry.data[CONF_ICA_ID]}.baseitems")
         self._hass: HomeAssistant = hass
         self._send_interval: int = send_interval
+        self._batch_window: float = batch_window
         self._config_entry = config_entry
         self._shutdown: bool = False
-        self._queue: asyncio.Queue[tuple[str, dict[str, any]]] = asyncio.Queue()
+        # Heap of (priority, sequence, event_type, event_data)
+        self._queue: list[tuple[int, int, str, dict[str, any]]] = []
+        self._sequence = itertools.count()
+        self._max_queue_size = max_queue_size
+        self._queue_policy = queue_policy
+        self._outbox = outbox
+        self._queue_sent = asyncio.Event()
+        self._metrics = EventQueueMetrics(
+            queue_depth=0,
+            max_queue_depth=0,
+            queue_size=max_queue_size,
+            policy=str(queue_policy),
+            fired=0,
+            coalesced=0,
+            dropped=0,
+            blocked=0,
+        )
         self._queue_send_remover: Callable[[], None] | None = None
+        self._batch_send_remover: Callable[[], None] | None = None
+        # Heap of (priority, sequence, name, func, idle)
+        self._jobs: list[tuple[int, int, str, Callable[[], Awaitable], bool]] = []
+        self._job_names: set[str] = set()
+        self._running_jobs: dict[str, asyncio.Task] = {}
+        self._max_concurrent_jobs = max_concurrent_jobs
+        self._is_idle: Callable[[], bool] = is_idle or (lambda: True)
+        self._job_retry_remover: Callable[[], None] | None = None
+        self._job_metrics = JobMetrics(
+            pending=0, running=0, completed=0, failed=0, cancelled=0
+        )
         self._schedule_next_send()
 
     def _schedule_next_send(self) -> None:
@@ -35,61 +124,298 @@ class BackgroundWorker:
                 self._hass, self._send_interval, self._async_send_queue
             )
 
+    def _schedule_batch_send(self) -> None:
+        """Schedule sending the current batch, unless already scheduled."""
+        if not self._shutdown and not self._batch_send_remover:
+            self._batch_send_remover = async_call_later(
+                self._hass, self._batch_window, self._async_send_batch
+            )
+
     async def shutdown(self) -> None:
         """Stops the background worker."""
         _LOGGER.debug(
-            "ICA - SHUTDOWN QUEUE: empty=%s, loaded=%s",
-            self._queue.empty(),
+            "ICA - SHUTDOWN QUEUE: size=%s, loaded=%s",
+            len(self._queue),
             self._config_entry.state == ConfigEntryState.LOADED,
         )
         if self._queue_send_remover:
             self._queue_send_remover()
+        if self._batch_send_remover:
+            self._batch_send_remover()
+            self._batch_send_remover = None
         self._shutdown = True
-        await self._async_send_queue(None)
+        await self._async_cancel_jobs()
+        if self._outbox and self._config_entry.state != ConfigEntryState.LOADED:
+            # Not delivered, the durable events are replayed from the outbox instead
+            self._queue = [q for q in self._queue if "event_id" not in q[3]]
+            heapq.heapify(self._queue)
+        await self._async_mark_fired(self._send_queue())
+
+    async def async_replay_outbox(self) -> None:
+        """Queues the events in the outbox that were never fired, e.g. before a
+        restart."""
+        if not self._outbox:
+            return
+        for record in await self._outbox.async_load():
+            self._enqueue(
+                record["event_type"],
+                record["event_data"],
+                record.get("priority", Priority.NORMAL),
+            )
+        if self._queue and self._config_entry.state == ConfigEntryState.LOADED:
+            self._schedule_batch_send()
+
+    async def _async_mark_fired(self, event_ids: list[str]) -> None:
+        if self._outbox and event_ids:
+            await self._outbox.async_mark_fired(event_ids)
 
     async def _async_send_queue(self, _) -> None:
         """Sends the existing items in the queue."""
+        event_ids = self._send_queue()
+        self._schedule_next_send()
+        await self._async_mark_fired(event_ids)
+
+    async def _async_send_batch(self, _) -> None:
+        self._batch_send_remover = None
+        await self._async_mark_fired(self._send_queue())
+
+    def _send_queue(self) -> list[str]:
+        """Fires the queued events. Returns the ids of the fired durable events."""
         _LOGGER.debug(
-            "ICA - SENDING QUEUE: empty=%s, loaded=%s",
-            self._queue.empty(),
+            "ICA - SENDING QUEUE: size=%s, loaded=%s",
+            len(self._queue),
             self._config_entry.state == ConfigEntryState.LOADED,
         )
-        while not self._queue.empty():
-            (event_type, event_data) = self._queue.get_nowait()
+        queued = [heapq.heappop(self._queue) for _ in range(len(self._queue))]
+        events = coalesce_events(
+            [(event_type, event_data) for _, _, event_type, event_data in queued],
+            EVENT_PAYLOAD_MAX_BYTES,
+        )
+        if len(events) < len(queued):
             _LOGGER.debug(
-                "ICA - ADDING EXECUTOR JOB: %s, length=%s",
-                event_type,
-                len(str(event_data)),
+                "ICA - COALESCED %s queued events into %s", len(queued), len(events)
             )
-            await self._hass.async_add_executor_job(
-                self.fire_event, event_type, event_data
+            self._metrics["coalesced"] += len(queued) - len(events)
+        # Wake up any producers waiting for room in the queue
+        self._queue_sent.set()
+        self._queue_sent = asyncio.Event()
+        for event_type, event_data in events:
+            self.fire_event(event_type, event_data)
+        return [d["event_id"] for _, _, _, d in queued if "event_id" in d]
+
+    def schedule_job(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[bool | None]],
+        priority: Priority = Priority.LOW,
+        idle: bool = True,
+    ) -> bool:
+        """Schedules a job, unless a job with the same name is pending or running.
+
+        A job that returns True is scheduled again, e.g. to process the next page of
+        a larger piece of work. Returns whether the job was scheduled."""
+        if self._shutdown or name in self._job_names:
+            return False
+        self._job_names.add(name)
+        heapq.heappush(self._jobs, (priority, next(self._sequence), name, func, idle))
+        self._start_jobs()
+        return True
+
+    def _start_jobs(self) -> None:
+        deferred = []
+        while self._jobs and len(self._running_jobs) < self._max_concurrent_jobs:
+            job = heapq.heappop(self._jobs)
+            _, _, name, _, idle = job
+            if idle and not self._is_idle():
+                deferred.append(job)
+                continue
+            self._running_jobs[name] = self._hass.async_create_background_task(
+                self._async_run_job(job), f"{DOMAIN} job {name}"
             )
+        for job in deferred:
+            heapq.heappush(self._jobs, job)
+        if deferred and not self._job_retry_remover and not self._shutdown:
 
-            # self.fire_event(event_type, event_data)
-        self._schedule_next_send()
+            @callback
+            def retry(_) -> None:
+                self._job_retry_remover = None
+                self._start_jobs()
+
+            self._job_retry_remover = async_call_later(
+                self._hass, BACKGROUND_JOBS_IDLE_RETRY_SECONDS, retry
+            )
 
-    async def fire_or_queue_event(self, event_type, event_data) -> None:
-        """Queues or fires an event immediately as long as the integration is fully loaded."""
+    async def _async_run_job(self, job) -> None:
+        priority, _, name, func, idle = job
+        _LOGGER.debug("ICA - RUNNING JOB: %s", name)
+        run_again = False
+        try:
+            run_again = await func()
+            self._job_metrics["completed"] += 1
+        except asyncio.CancelledError:
+            self._job_metrics["cancelled"] += 1
+            raise
+        except Exception:
+            self._job_metrics["failed"] += 1
+            _LOGGER.exception("ICA - Background job '%s' failed", name)
+        finally:
+            self._running_jobs.pop(name, None)
+            self._job_names.discard(name)
+        if run_again:
+            self.schedule_job(name, func, priority, idle)
+        self._start_jobs()
+
+    async def _async_cancel_jobs(self) -> None:
+        if self._job_retry_remover:
+            self._job_retry_remover()
+            self._job_retry_remover = None
+        self._jobs.clear()
+        self._job_names.clear()
+        tasks = list(self._running_jobs.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def job_metrics(self) -> JobMetrics:
+        """Returns the counters of the background jobs."""
+        return {
+            **self._job_metrics,
+            "pending": len(self._jobs),
+            "running": len(self._running_jobs),
+        }
+
+    def metrics(self) -> EventQueueMetrics:
+        """Returns the counters of the event queue."""
+        return {**self._metrics, "queue_depth": len(self._queue)}
+
+    @staticmethod
+    def _event_key(event_type, event_data) -> tuple:
+        return (
+            event_type,
+            event_data.get("type"),
+            event_data.get("uid"),
+            event_data.get("shopping_list_id"),
+            event_data.get("part"),
+        )
+
+    def _select_dropped(self, event_type, event_data, priority: Priority) -> int | None:
+        """Selects which event to drop from a full queue, -1 is the new event.
+
+        Durable events (with an 'event_id') are never dropped, None means that only
+        durable events are involved."""
+        # (sequence, index, key) of the events that may be dropped
+        droppable = [
+            (sequence, i, self._event_key(t, d))
+            for i, (_, sequence, t, d) in enumerate(self._queue)
+            if "event_id" not in d
+        ]
+        new_is_droppable = "event_id" not in event_data
+        if self._queue_policy == EventQueuePolicy.DROP_DUPLICATES:
+            # The oldest event that is superseded by a newer event of the same kind
+            latest: dict[tuple, int] = {}
+            if new_is_droppable:
+                latest[self._event_key(event_type, event_data)] = next(self._sequence)
+            for sequence, _, key in droppable:
+                latest[key] = max(latest.get(key, sequence), sequence)
+            duplicates = [
+                (sequence, i)
+                for sequence, i, key in droppable
+                if latest[key] != sequence
+            ]
+            if duplicates:
+                return min(duplicates)[1]
+
+        if not droppable:
+            return -1 if new_is_droppable else None
+        # The oldest event of the lowest priority, unless the new event is lower
+        index = max(
+            (i for _, i, _ in droppable),
+            key=lambda i: (self._queue[i][0], -self._queue[i][1]),
+        )
+        return -1 if new_is_droppable and priority > self._queue[index][0] else index
+
+    async def _async_wait_for_room(self) -> None:
+        while (
+            self._queue_policy == EventQueuePolicy.BLOCK
+            and not self._shutdown
+            and len(self._queue) >= self._max_queue_size
+        ):
+            self._metrics["blocked"] += 1
+            await self._queue_sent.wait()
+
+    def _enqueue(self, event_type, event_data, priority: Priority) -> None:
+        """Queues an event. A full queue drops an event to make room, unless only
+        durable events are involved, which may exceed the size of the queue."""
+        if len(self._queue) >= self._max_queue_size:
+            index = self._select_dropped(event_type, event_data, priority)
+            if index == -1:
+                self._metrics["dropped"] += 1
+                _LOGGER.warning("ICA - Event queue is full, dropped: %s", event_type)
+                return
+            if index is not None:
+                self._metrics["dropped"] += 1
+                _, _, dropped_type, _ = self._queue[index]
+                _LOGGER.warning("ICA - Event queue is full, dropped: %s", dropped_type)
+                self._queue[index] = self._queue[-1]
+                self._queue.pop()
+                heapq.heapify(self._queue)
+        heapq.heappush(
+            self._queue, (priority, next(self._sequence), event_type, event_data)
+        )
+        self._metrics["max_queue_depth"] = max(
+            self._metrics["max_queue_depth"], len(self._queue)
+        )
+
+    async def fire_or_queue_event(
+        self,
+        event_type,
+        event_data,
+        priority: Priority = Priority.NORMAL,
+        dedup_key: str | None = None,
+    ) -> None:
+        """Fires an event as long as the integration is fully loaded, otherwise
+        queues it.
+
+        Unless of high priority, the event is fired together with other events in
+        the current batch. With a `dedup_key` the event is identified by an 'event_id',
+        kept in the outbox until fired, and dropped if it has already been queued."""
         _LOGGER.debug("ICA - FIRE/QUEUE: %s", event_type)
-        if self._config_entry.state == ConfigEntryState.LOADED:
+        if dedup_key:
+            event_data = {**event_data, "event_id": dedup_key}
+            if self._outbox and not await self._outbox.async_append(
+                dedup_key, event_type, event_data, priority
+            ):
+                return
+
+        if (
+            self._config_entry.state == ConfigEntryState.LOADED
+            and priority == Priority.HIGH
+        ):
             self.fire_event(event_type, event_data)
-        else:
-            await self._queue.put((event_type, event_data))
+            await self._async_mark_fired([dedup_key] if dedup_key else [])
+            return
+
+        await self._async_wait_for_room()
+        self._enqueue(event_type, event_data, priority)
+        if self._config_entry.state == ConfigEntryState.LOADED:
+            self._schedule_batch_send()
 
-    async def queue_event(self, event_type, event_data) -> None:
+    async def queue_event(
+        self, event_type, event_data, priority: Priority = Priority.NORMAL
+    ) -> None:
         """Queues a event to be fired in the next send interval."""
         _LOGGER.debug("ICA - QUEUING: %s", event_type)
-        await self._queue.put((event_type, event_data))
+        await self._async_wait_for_room()
+        self._enqueue(event_type, event_data, priority)
 
     def fire_event(self, event_type, event_data) -> None:
         """Immediately tells Home Assistant to fire an event."""
-        _LOGGER.info(
-            "ICA - FIRING EVENT: %s, len: %s",
-            event_type,
-            len(bytes(str(event_data), "utf-8")),
-        )
-        _LOGGER.warning("Event data: %s", str(event_data)[:100])
-        self._hass.bus.fire(
-            event_type,
-            event_data,
-        )
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            _LOGGER.debug(
+                "ICA - FIRING EVENT: %s, len: %s",
+                event_type,
+                len(bytes(str(event_data), "utf-8")),
+            )
+        self._hass.bus.async_fire(event_type, event_data)
+        self._metrics["fired"] += 1
@@ -1,17 +1,32 @@
 """Local storage for cached ICA data."""
 
 from pathlib import Path
+from collections.abc import Awaitable, Callable
+from functools import partial
 import asyncio
 import json
 import logging
+import random
+import time
 import datetime as dt
 from typing import Generic, Any, TypeVar, TypedDict
 
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.event import async_call_later
 from homeassistant.util import slugify
+from homeassistant.util.ulid import ulid_now
 
 from .utils import EmptyLogger
-from .const import CACHING_SECONDS_LONG_TERM
+from .const import (
+    CACHING_JITTER_RATIO,
+    CACHING_SECONDS_LONG_TERM,
+    CACHING_SECONDS_REFRESH_SPACING,
+    CACHING_SECONDS_RETRY,
+    CACHING_SECONDS_SHORT_TERM,
+    DATA_SHARED_CACHE,
+    EVENT_DATA_KEEP,
+)
+from .icatypes import OffersAndDiscountsForStore
 
 STORAGE_PATH = ".storage/ica.{key}.json"
 
@@ -29,6 +44,7 @@ class CacheEntry(Generic[_DataT]):
         expiry_seconds: int = CACHING_SECONDS_LONG_TERM,
         persist_to_file: bool = True,
         logger: logging.Logger = None,
+        jitter: float = CACHING_JITTER_RATIO,
     ) -> None:
         # Example: CacheEntry(hass, f"{self._config_entry.data[CONF_ICA_ID]}.baseitems")
         self._hass = hass
@@ -40,10 +56,78 @@ class CacheEntry(Generic[_DataT]):
         self._logger: logging.Logger = logger or EmptyLogger()
         self._timestamp: dt.datetime | None = None
         self._expiry_seconds: int = expiry_seconds
+        self._jitter: float = jitter
+        self._expires_at: dt.datetime | None = None
+        self._lock = asyncio.Lock()
+        self._listeners: list[Callable[[_DataT], None]] = []
+        self._metrics = CacheEntryMetrics(
+            hits=0,
+            misses=0,
+            file_loads=0,
+            refresh_count=0,
+            refresh_errors=0,
+            last_refresh_seconds=None,
+            serialized_size=None,
+            last_error=None,
+        )
 
         if persist_to_file:
             self._file = LocalFile(self._hass, self._path)
 
+    @property
+    def key(self) -> str:
+        """The key that identifies the cache entry."""
+        return self._key
+
+    @property
+    def expires_at(self) -> dt.datetime | None:
+        """When the current value expires. Includes a random jitter, so that entries
+        refreshed at the same time don't expire at the same time."""
+        return self._expires_at
+
+    def is_expired(self, now: dt.datetime | None = None) -> bool:
+        """Whether the current value has passed its expiry."""
+        now = now or dt.datetime.now(dt.timezone.utc)
+        return not self._expires_at or now > self._expires_at
+
+    def metrics(self) -> "CacheEntryMetrics":
+        """Returns counters for how the entry has been served, including its age."""
+        now = dt.datetime.now(dt.timezone.utc)
+        return CacheEntryMetrics(
+            **self._metrics,
+            age_seconds=(
+                round((now - self._timestamp).total_seconds())
+                if self._timestamp
+                else None
+            ),
+            expires_at=self._expires_at.isoformat() if self._expires_at else None,
+        )
+
+    def _update_expiry(self) -> None:
+        jitter = random.uniform(-self._jitter, self._jitter) if self._jitter else 0
+        self._expires_at = self._timestamp + dt.timedelta(
+            seconds=self._expiry_seconds * (1 + jitter)
+        )
+
+    def add_listener(self, listener: Callable[[_DataT], None]) -> Callable[[], None]:
+        """Adds a callback that is invoked with the new value, whenever it changes.
+
+        Returns a callback that removes the listener again."""
+        self._listeners.append(listener)
+
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    def _notify_listeners(self) -> None:
+        for listener in self._listeners:
+            try:
+                listener(self._value)
+            except Exception:
+                self._logger.exception("Cache listener failed for '%s'", self._key)
+
     def current_value(self) -> _DataT:
         """Gets the current value from state. Without checking file or API.
         This can be used where async/await is not possible"""
@@ -57,6 +141,8 @@ class CacheEntry(Generic[_DataT]):
             self._logger.debug(
                 "Loaded from file: %s = %s", self._path, str(content)[:100]
             )
+            if content is not None:
+                self._metrics["file_loads"] += 1
             if (
                 content
                 and isinstance(content, dict)
@@ -72,6 +158,7 @@ class CacheEntry(Generic[_DataT]):
                 self._timestamp = dt.datetime.fromisoformat(
                     info.get("timestamp")
                 ).replace(tzinfo=dt.timezone.utc)
+                self._update_expiry()
                 self._logger.debug(
                     "Loaded cache entry: %s = %s", self._path, str(self._value)[:100]
                 )
@@ -80,43 +167,59 @@ class CacheEntry(Generic[_DataT]):
                 self._logger.debug(
                     "Loaded raw content: %s = %s", self._path, str(self._value)[:100]
                 )
+            if self._value is not None:
+                self._notify_listeners()
         return self._value
 
     async def get_value(self, invalidate_cache: bool | None = None) -> _DataT:
         """Gets value from state, file or API"""
         now = dt.datetime.now(dt.timezone.utc)
 
-        if self._value is not None and self._file:
+        if self._value is None and self._file:
             await self.init_value()
 
-        # Auto invalidate if passed expiry
-        invalidate_cache = (
-            not self._timestamp
-            or now > (self._timestamp + dt.timedelta(seconds=self._expiry_seconds))
-            if invalidate_cache is None
-            else invalidate_cache
-        )
+        # Serialize refreshes, so that concurrent callers (possibly from different
+        # config entries sharing this entry) only trigger a single value_factory call
+        async with self._lock:
+            if invalidate_cache is None:
+                # Auto invalidate if passed expiry, unless refreshed by another
+                # caller while waiting for the lock
+                invalidate_cache = self.is_expired(now) and not (
+                    self._timestamp and self._timestamp > now
+                )
 
-        if invalidate_cache or self._value is None:
-            return await self.refresh()
-        return self._value
+            if invalidate_cache or self._value is None:
+                self._metrics["misses"] += 1
+                return await self.refresh()
+            self._metrics["hits"] += 1
+            return self._value
 
-    async def refresh(self) -> _DataT:
-        """Refreshes state using the value_factory"""
+    async def refresh(
+        self, value_factory: Callable[[], Awaitable[_DataT]] | None = None
+    ) -> _DataT:
+        """Refreshes state using the value_factory (or the one passed, such as the
+        value_factory with other arguments)"""
         # Invoke value factory (example: API)
         value: _DataT = None
+        start = time.monotonic()
         try:
-            value = await self._value_factory()
+            value = await (value_factory or self._value_factory)()
         except Exception as err:
             self._logger.error("Exception when refreshing data. Err: %s", err)
+            self._metrics["refresh_errors"] += 1
+            self._metrics["last_error"] = str(err) or type(err).__name__
             raise
         else:
+            self._metrics["refresh_count"] += 1
+            self._metrics["last_refresh_seconds"] = round(time.monotonic() - start, 3)
             return await self.set_value(value)
 
     async def set_value(self, value: _DataT) -> _DataT:
         """Sets the cached value (and persists to file)"""
         self._value = value
         self._timestamp = dt.datetime.now(dt.timezone.utc)
+        self._update_expiry()
+        self._notify_listeners()
         self._logger.debug(
             "Persisting value in cache entry: %s = %s", self._key, str(value)[:100]
         )
@@ -129,10 +232,299 @@ class CacheEntry(Generic[_DataT]):
                 "key": self._key,
                 "value": self._value,
             }
-            await self._file.async_store_json(info)
+            self._metrics["serialized_size"] = await self._file.async_store_json(info)
             self._logger.debug("Saved to file: %s = %s", self._path, str(info)[:100])
         return self._value
 
+    async def async_remove(self) -> None:
+        """Clears the cached value, and removes its file."""
+        self._value = None
+        self._timestamp = None
+        self._expires_at = None
+        if self._file:
+            await self._file.async_remove()
+
+
+class EventDataStore:
+    """Keeps the full data of fired events, each under a unique key.
+
+    Events reference their data by that key ('data_ref'), so that a queued or
+    coalesced event, or a consumer reading it later, still resolves to the data
+    of that very event. Only the latest `keep` are kept, older data is removed."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        key: str,
+        keep: int = EVENT_DATA_KEEP,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self._hass = hass
+        self._key = key
+        self._keep = keep
+        self._logger: logging.Logger = logger or EmptyLogger()
+        # Keys of the stored event data, oldest first
+        self._index = CacheEntry[list[str]](
+            hass, f"{key}.event_data", partial(self._get_keys), logger=logger
+        )
+
+    async def _get_keys(self) -> list[str]:
+        # Only changed as event data is stored, there is nothing to fetch
+        return self._index.current_value() or []
+
+    async def async_load(self) -> None:
+        """Loads the keys of the event data stored before a restart."""
+        await self._index.init_value()
+
+    async def async_store(self, name: str, event_data: dict) -> str:
+        """Stores the event data, and returns its unique key."""
+        entry = CacheEntry(
+            self._hass,
+            f"{self._key}.{name}.{ulid_now()}",
+            partial(lambda _: None),
+            logger=self._logger,
+        )
+        await entry.set_value(event_data)
+
+        keys = [*await self._get_keys(), entry.key]
+        removed, keys = keys[: -self._keep], keys[-self._keep :]
+        await self._index.set_value(keys)
+        for key in removed:
+            self._logger.debug("Removing old event data: %s", key)
+            await CacheEntry(self._hass, key, partial(lambda _: None)).async_remove()
+        return entry.key
+
+
+class CacheRefreshScheduler:
+    """Refreshes cache entries in the background, as they expire.
+
+    Entries that would be due at (nearly) the same time are spread out by at least
+    `spacing` seconds, so that Home Assistant sees a smooth load instead of spikes."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        refresh_callback: Callable[[CacheEntry], Awaitable[None]] | None = None,
+        spacing: int = CACHING_SECONDS_REFRESH_SPACING,
+        logger: logging.Logger | None = None,
+    ) -> None:
+        self._hass = hass
+        self._refresh_callback = refresh_callback or (lambda e: e.get_value())
+        self._spacing = dt.timedelta(seconds=spacing)
+        self._logger: logging.Logger = logger or EmptyLogger()
+        self._entries: dict[str, CacheEntry] = {}
+        self._due: dict[str, dt.datetime] = {}
+        self._removers: dict[str, Callable[[], None]] = {}
+        self._shutdown: bool = False
+
+    def add(self, *entries: CacheEntry) -> None:
+        """Adds entries to be refreshed by the scheduler."""
+        for entry in entries:
+            self._entries[entry.key] = entry
+
+    def schedule_all(self) -> None:
+        """(Re)schedules all entries according to their current expiry."""
+        for entry in self._entries.values():
+            self.schedule(entry)
+
+    def schedule(self, entry: CacheEntry, due: dt.datetime | None = None) -> None:
+        """Schedules the next refresh of an entry."""
+        if self._shutdown:
+            return
+        self._cancel(entry.key)
+        now = dt.datetime.now(dt.timezone.utc)
+        due = max(due or entry.expires_at or now, now)
+
+        # Find a free slot, not colliding with other scheduled refreshes
+        others = sorted(self._due.values())
+        for other in others:
+            if abs(other - due) < self._spacing:
+                due = other + self._spacing
+
+        self._due[entry.key] = due
+        self._removers[entry.key] = async_call_later(
+            self._hass,
+            (due - now).total_seconds(),
+            partial(self._async_refresh, entry),
+        )
+        self._logger.debug("Scheduled refresh of '%s' at %s", entry.key, due)
+
+    def _cancel(self, key: str) -> None:
+        if remover := self._removers.pop(key, None):
+            remover()
+        self._due.pop(key, None)
+
+    async def _async_refresh(self, entry: CacheEntry, _=None) -> None:
+        self._removers.pop(entry.key, None)
+        self._due.pop(entry.key, None)
+        retry_at = None
+        try:
+            await self._refresh_callback(entry)
+        except Exception as err:  # noqa: BLE001 - retried below
+            self._logger.warning("Scheduled refresh of '%s' failed: %s", entry.key, err)
+            retry_at = dt.datetime.now(dt.timezone.utc) + dt.timedelta(
+                seconds=CACHING_SECONDS_RETRY
+            )
+        self.schedule(entry, retry_at)
+
+    async def async_shutdown(self) -> None:
+        """Cancels all scheduled refreshes."""
+        self._shutdown = True
+        for key in list(self._removers):
+            self._cancel(key)
+
+
+class SharedCacheRegistry:
+    """Hands out one CacheEntry per global key, shared between config entries.
+
+    Account-independent data (such as articles, products and store offers) is only
+    refreshed and persisted once, regardless of how many ICA accounts are set up.
+    Each config entry registers its own value_factory, so that the entry keeps
+    working as long as any of its owners are still loaded."""
+
+    def __init__(
+        self, hass: HomeAssistant, logger: logging.Logger | None = None
+    ) -> None:
+        self._hass = hass
+        self._logger: logging.Logger = logger or EmptyLogger()
+        self._entries: dict[str, CacheEntry] = {}
+        self._factories: dict[str, dict[str, Callable[[], Awaitable[Any]]]] = {}
+        # Owner of each job over the shared entries that is pending or running
+        self._jobs: dict[str, str] = {}
+
+    def acquire(
+        self,
+        key: str,
+        owner_id: str,
+        value_factory: Callable[[], Awaitable[Any]],
+        **kwargs,
+    ) -> CacheEntry:
+        """Gets (or creates) the shared entry for `key`, referenced by `owner_id`."""
+        self._factories.setdefault(key, {})[owner_id] = value_factory
+        if (entry := self._entries.get(key)) is None:
+            entry = CacheEntry(
+                self._hass, key, partial(self._invoke_factory, key), **kwargs
+            )
+            self._entries[key] = entry
+            self._logger.debug("Created shared cache entry: %s", key)
+        return entry
+
+    def release(self, owner_id: str, keys: list[str] | None = None) -> None:
+        """Drops the references held by `owner_id`. Unreferenced entries are removed."""
+        if keys is None:
+            # The jobs of the owner are cancelled along with its worker
+            for name in [n for n, o in self._jobs.items() if o == owner_id]:
+                del self._jobs[name]
+        for key in list(self._factories if keys is None else keys):
+            factories = self._factories.get(key)
+            if factories is None:
+                continue
+            factories.pop(owner_id, None)
+            if not factories:
+                del self._factories[key]
+                self._entries.pop(key, None)
+                self._logger.debug("Removed unreferenced shared cache entry: %s", key)
+
+    def owned_keys(self, owner_id: str) -> list[str]:
+        """Returns the keys currently referenced by `owner_id`."""
+        return [key for key, f in self._factories.items() if owner_id in f]
+
+    def schedule_job(
+        self,
+        name: str,
+        owner_id: str,
+        schedule: Callable[[str, Callable[[], Awaitable[bool | None]]], bool],
+        func: Callable[[], Awaitable[bool | None]],
+    ) -> bool:
+        """Schedules a job over the shared entries, using the `schedule` of `owner_id`.
+
+        The job is skipped while any owner has it pending or running, so that it
+        only runs once per process instead of once per config entry. Returns whether
+        the job was scheduled."""
+        if name in self._jobs:
+            return False
+
+        async def run() -> bool | None:
+            run_again = False
+            try:
+                run_again = await func()
+            finally:
+                if not run_again and self._jobs.get(name) == owner_id:
+                    del self._jobs[name]
+            return run_again
+
+        self._jobs[name] = owner_id
+        if not schedule(name, run):
+            del self._jobs[name]
+            return False
+        return True
+
+    async def _invoke_factory(self, key: str) -> Any:
+        factories = self._factories.get(key)
+        if not factories:
+            raise RuntimeError(f"No value factory registered for shared key: {key}")
+        # Any of the owners can provide the value, use the one registered first
+        factory = next(iter(factories.values()))
+        return await factory()
+
+    async def async_get_store_offers(
+        self,
+        owner_id: str,
+        store_ids: list[str],
+        fetcher: Callable[[str], Awaitable[OffersAndDiscountsForStore]],
+        invalidate_cache: bool | None = None,
+    ) -> dict[str, OffersAndDiscountsForStore]:
+        """Gets offers per store. Each store is only fetched once, even if multiple
+        config entries follow the same store."""
+        keys = {str(store_id): f"store_offers.{store_id}" for store_id in store_ids}
+
+        # Release stores no longer followed by the owner
+        self.release(
+            owner_id,
+            [
+                k
+                for k in self.owned_keys(owner_id)
+                if k.startswith("store_offers.") and k not in keys.values()
+            ],
+        )
+
+        result: dict[str, OffersAndDiscountsForStore] = {}
+        for store_id, key in keys.items():
+            entry = self.acquire(
+                key,
+                owner_id,
+                partial(fetcher, store_id),
+                expiry_seconds=CACHING_SECONDS_SHORT_TERM,
+                persist_to_file=False,
+                logger=self._logger,
+            )
+            result[store_id] = await entry.get_value(invalidate_cache)
+        return result
+
+
+def get_shared_cache_registry(
+    hass: HomeAssistant, logger: logging.Logger | None = None
+) -> SharedCacheRegistry:
+    """Gets the process-wide registry of shared cache entries."""
+    if (registry := hass.data.get(DATA_SHARED_CACHE)) is None:
+        registry = hass.data[DATA_SHARED_CACHE] = SharedCacheRegistry(hass, logger)
+    return registry
+
+
+class CacheEntryMetrics(TypedDict):
+    """Counters describing how a cache entry has been served"""
+
+    hits: int  # Served from memory
+    misses: int  # Served by invoking the value_factory
+    file_loads: int  # Loaded from file
+    refresh_count: int
+    refresh_errors: int
+    last_refresh_seconds: float | None
+    serialized_size: int | None  # Bytes written to file
+    last_error: str | None
+    age_seconds: int | None
+    expires_at: str | None
+
 
 class CacheEntryInfo(TypedDict):
     """Cache entry metadata wrapper"""
@@ -177,11 +569,21 @@ class LocalFile:
         async with self._lock:
             await self._hass.async_add_executor_job(self._store, content)
 
-    async def async_store_json(self, obj: object) -> None:
-        """Persist JSON object as string content to file on disk."""
+    async def async_store_json(self, obj: object) -> int:
+        """Persist JSON object as string content to file on disk. Returns the size."""
         content = json.dumps(obj) if obj else ""
         await self.async_store(content)
+        return len(content)
 
     def _store(self, content: str) -> None:
         """Persist string to file on disk."""
         self._path.write_text(content)
+
+    async def async_remove(self) -> None:
+        """Remove the file from disk."""
+        async with self._lock:
+            await self._hass.async_add_executor_job(self._remove)
+
+    def _remove(self) -> None:
+        """Remove the file from disk, if it exists."""
+        self._path.unlink(missing_ok=True)
@@ -17,7 +17,7 @@ from homeassistant.const import CONF_SCAN_INTERVAL
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.helpers import selector
 
-from .coordinator import IcaCoordinator
+from .coordinator import IcaCoordinator, get_refresh_interval
 from .icatypes import AuthCredentials
 from .icaapi_async import IcaAPIAsync
 from .const import (
@@ -28,7 +28,20 @@ from .const import (
     CONF_ICA_PIN,
     CONF_SHOPPING_LISTS,
     CONF_JSON_DATA_IN_DESC,
+    CONF_REFRESH_INTERVALS,
+    CONF_SYNC_COALESCE_SECONDS,
+    CONF_EVENT_PAYLOAD,
+    CONF_DURABLE_EVENTS,
+    CONF_EVENT_QUEUE_SIZE,
+    CONF_EVENT_QUEUE_POLICY,
     DEFAULT_SCAN_INTERVAL,
+    DEFAULT_SYNC_COALESCE_SECONDS,
+    DEFAULT_EVENT_PAYLOAD,
+    DEFAULT_DURABLE_EVENTS,
+    DEFAULT_EVENT_QUEUE_SIZE,
+    DEFAULT_EVENT_QUEUE_POLICY,
+    EventPayload,
+    EventQueuePolicy,
 )
 
 _LOGGER = logging.getLogger(__name__)
@@ -152,12 +165,28 @@ class IcaOptionsFlowHandler(OptionsFlow):
         if user_input is not None:
             require_cache_invalidation = config_entry_data.get(CONF_DIRTY_CACHE, False)
 
-            config_entry_data[CONF_SCAN_INTERVAL] = user_input.get(
-                CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL
-            )
+            for dataset, conf_key in CONF_REFRESH_INTERVALS.items():
+                config_entry_data[conf_key] = user_input.get(
+                    conf_key, get_refresh_interval(config_entry_data, dataset)
+                )
             config_entry_data[CONF_JSON_DATA_IN_DESC] = user_input.get(
                 CONF_JSON_DATA_IN_DESC, False
             )
+            config_entry_data[CONF_SYNC_COALESCE_SECONDS] = user_input.get(
+                CONF_SYNC_COALESCE_SECONDS, DEFAULT_SYNC_COALESCE_SECONDS
+            )
+            config_entry_data[CONF_EVENT_PAYLOAD] = user_input.get(
+                CONF_EVENT_PAYLOAD, DEFAULT_EVENT_PAYLOAD
+            )
+            config_entry_data[CONF_DURABLE_EVENTS] = user_input.get(
+                CONF_DURABLE_EVENTS, DEFAULT_DURABLE_EVENTS
+            )
+            config_entry_data[CONF_EVENT_QUEUE_SIZE] = user_input.get(
+                CONF_EVENT_QUEUE_SIZE, DEFAULT_EVENT_QUEUE_SIZE
+            )
+            config_entry_data[CONF_EVENT_QUEUE_POLICY] = user_input.get(
+                CONF_EVENT_QUEUE_POLICY, DEFAULT_EVENT_QUEUE_POLICY
+            )
 
             pre = config_entry_data.get(CONF_SHOPPING_LISTS, []).copy()
             config_entry_data[CONF_SHOPPING_LISTS] = user_input.get(
@@ -185,17 +214,54 @@ class IcaOptionsFlowHandler(OptionsFlow):
         # Format form schema
         schema = vol.Schema(
             {
-                vol.Required(
-                    CONF_SCAN_INTERVAL,
-                    default=config_entry_data.get(
-                        CONF_SCAN_INTERVAL, DEFAULT_SCAN_INTERVAL
-                    ),
-                ): int,
+                **{
+                    # Refresh interval (in minutes) per dataset
+                    vol.Required(
+                        conf_key,
+                        default=get_refresh_interval(config_entry_data, dataset),
+                    ): vol.All(int, vol.Range(min=1))
+                    for dataset, conf_key in CONF_REFRESH_INTERVALS.items()
+                },
                 vol.Required(
                     CONF_JSON_DATA_IN_DESC,
                     default=config_entry_data.get(CONF_JSON_DATA_IN_DESC, False),
                     description="Whether to write extra information as JSON in the description field",
                 ): bool,
+                vol.Required(
+                    CONF_SYNC_COALESCE_SECONDS,
+                    default=config_entry_data.get(
+                        CONF_SYNC_COALESCE_SECONDS, DEFAULT_SYNC_COALESCE_SECONDS
+                    ),
+                    description="Seconds to batch changes to a shopping list",
+                ): vol.All(vol.Coerce(float), vol.Range(min=0)),
+                vol.Required(
+                    CONF_EVENT_PAYLOAD,
+                    default=config_entry_data.get(
+                        CONF_EVENT_PAYLOAD, DEFAULT_EVENT_PAYLOAD
+                    ),
+                    description="Summary or full diffs in change events",
+                ): vol.In([p.value for p in EventPayload]),
+                vol.Required(
+                    CONF_DURABLE_EVENTS,
+                    default=config_entry_data.get(
+                        CONF_DURABLE_EVENTS, DEFAULT_DURABLE_EVENTS
+                    ),
+                    description="Keep events, such as new offers, on disk until fired",
+                ): bool,
+                vol.Required(
+                    CONF_EVENT_QUEUE_SIZE,
+                    default=config_entry_data.get(
+                        CONF_EVENT_QUEUE_SIZE, DEFAULT_EVENT_QUEUE_SIZE
+                    ),
+                    description="Events kept while waiting to be fired",
+                ): vol.All(int, vol.Range(min=1)),
+                vol.Required(
+                    CONF_EVENT_QUEUE_POLICY,
+                    default=config_entry_data.get(
+                        CONF_EVENT_QUEUE_POLICY, DEFAULT_EVENT_QUEUE_POLICY
+                    ),
+                    description="What to do when the queue of events is full",
+                ): vol.In([p.value for p in EventQueuePolicy]),
             }
         ).extend(self.SHOPPING_LIST_SELECTOR_SCHEMA or {})
 
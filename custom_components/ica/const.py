@@ -3,6 +3,8 @@
 from typing import Final
 from enum import StrEnum
 
+from homeassistant.const import CONF_SCAN_INTERVAL
+
 CONF_EXTRA_PROJECTS: Final = "custom_projects"
 CONF_PROJECT_DUE_DATE: Final = "due_date_days"
 CONF_PROJECT_LABEL_WHITELIST: Final = "labels"
@@ -82,6 +84,9 @@ SERVICE_NEW_TASK: Final = "new_task"
 
 DOMAIN: Final = "ica"
 CONFIG_ENTRY_NAME: Final = "ICA - %s"
+DATA_SHARED_CACHE: Final = f"{DOMAIN}_shared_cache"
+DATA_OPEN_FOOD_FACTS_LIMITER: Final = f"{DOMAIN}_open_food_facts_limiter"
+DATA_PRODUCT_LOOKUP_MISSES: Final = f"{DOMAIN}_product_lookup_misses"
 CONF_ICA_ID: Final = "personal_id"
 CONF_ICA_PIN: Final = "pin_code"
 CONF_SHOPPING_LISTS: Final = "shopping_lists"
@@ -89,11 +94,87 @@ CONF_DIRTY_CACHE: Final = "dirty_cache"
 CONF_NUM_RECIPES: Final = "recipe_count"
 
 CONF_JSON_DATA_IN_DESC: Final = "json_data_in_desc"
+CONF_SYNC_COALESCE_SECONDS: Final = "sync_coalesce_seconds"
+CONF_EVENT_PAYLOAD: Final = "event_payload"
+CONF_DURABLE_EVENTS: Final = "durable_events"
+CONF_EVENT_QUEUE_SIZE: Final = "event_queue_size"
+CONF_EVENT_QUEUE_POLICY: Final = "event_queue_policy"
 CONF_MENU_MANAGE_SHOPPING_LISTS: Final = "manage_tracked_shopping_lists"
 
 DEFAULT_SCAN_INTERVAL: Final = 5
+DEFAULT_SYNC_COALESCE_SECONDS: Final = 2
+DEFAULT_DURABLE_EVENTS: Final = True
+
+
+class EventPayload(StrEnum):
+    """How much of a diff is sent in change events"""
+
+    SUMMARY = "summary"  # What changed, with a reference to the stored full diffs
+    FULL = "full"
+    JSON_PATCH = "json_patch"  # The changes as RFC 6902 JSON Patch operations
+
+
+DEFAULT_EVENT_PAYLOAD: Final = EventPayload.SUMMARY
+# Events larger than this are not stored by the recorder, and are split into parts
+EVENT_PAYLOAD_MAX_BYTES: Final = 32768
+# Full event data (referenced by events) kept per account, older data is removed
+EVENT_DATA_KEEP: Final = 100
+
+
+class EventQueuePolicy(StrEnum):
+    """What to do when the queue of events, waiting to be fired, is full"""
+
+    DROP_OLDEST = "drop_oldest"
+    # Drop the oldest event that a newer event, of the same kind, supersedes
+    DROP_DUPLICATES = "drop_duplicates"
+    BLOCK = "block"  # Wait until the queue has been sent
+
+
+DEFAULT_EVENT_QUEUE_SIZE: Final = 500
+DEFAULT_EVENT_QUEUE_POLICY: Final = EventQueuePolicy.DROP_DUPLICATES
+BACKGROUND_JOBS_MAX_CONCURRENT: Final = 2
+BACKGROUND_JOBS_IDLE_RETRY_SECONDS: Final = 30
+PRODUCT_LOOKUP_PAGE_SIZE: Final = 20
+# Outbox operations are given up after failing with a server error this many times,
+# or when they have not been replayed within the max age (even if ICA is unreachable)
+OUTBOX_MAX_ATTEMPTS: Final = 10
+OUTBOX_MAX_AGE_DAYS: Final = 7
+
+
+class IcaDataset(StrEnum):
+    """Datasets that are refreshed on their own schedule"""
+
+    ARTICLES = "articles"
+    BASEITEMS = "baseitems"
+    CURRENT_BONUS = "current_bonus"
+    SHOPPING_LISTS = "shopping_lists"
+    FAVORITE_STORES = "favorite_stores"
+    OFFERS = "offers"
+
+
+# Refresh interval (in minutes) per dataset, shopping lists use the scan interval
+CONF_REFRESH_INTERVALS: Final = {
+    IcaDataset.SHOPPING_LISTS: CONF_SCAN_INTERVAL,
+    IcaDataset.BASEITEMS: "baseitems_refresh_interval",
+    IcaDataset.OFFERS: "offers_refresh_interval",
+    IcaDataset.CURRENT_BONUS: "current_bonus_refresh_interval",
+    IcaDataset.FAVORITE_STORES: "favorite_stores_refresh_interval",
+    IcaDataset.ARTICLES: "articles_refresh_interval",
+}
+DEFAULT_REFRESH_INTERVALS: Final = {
+    IcaDataset.SHOPPING_LISTS: DEFAULT_SCAN_INTERVAL,
+    IcaDataset.BASEITEMS: 5,
+    IcaDataset.OFFERS: 1440,  # 24 hours
+    IcaDataset.CURRENT_BONUS: 1440,
+    IcaDataset.FAVORITE_STORES: 1440,
+    IcaDataset.ARTICLES: 1440,
+}
 CACHING_SECONDS_SHORT_TERM: Final = 300  # 5 minutes
 CACHING_SECONDS_LONG_TERM: Final = 86400  # 24 hours
+CACHING_SECONDS_RETRY: Final = 60  # 1 minute
+CACHING_SECONDS_REFRESH_SPACING: Final = 15
+CACHING_JITTER_RATIO: Final = 0.1  # +/- 10% of the expiry
+MAX_CONCURRENT_REQUESTS: Final = 4
 
 AUTH_TICKET: Final = "AuthenticationTicket"
 GET_LISTS: Final = "ShoppingLists"
@@ -203,6 +284,11 @@ RANDOM_RECIPES_ENDPOINT: Final = (
 
 class OpenFoodFacts:
     APIv2 = "https://world.openfoodfacts.org/api/v2/product/{}.json"
+    # OpenFoodFacts allows 100 product reads per minute, stay well below it
+    RATE_LIMIT_PER_MINUTE: Final = 50
+    ENRICHMENT_BATCH_SIZE: Final = 10
+    ENRICHMENT_TIMEOUT_SECONDS: Final = 5
+    ENRICHMENT_RETRY_MISSES_DAYS: Final = 30
     DEFAULT_FIELDS: Final = [
         "brand_owner",
         "brands",
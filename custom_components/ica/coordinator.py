@@ -1,13 +1,16 @@
 """DataUpdateCoordinator for the Todoist component."""
 
+import asyncio
 import logging
 import traceback
 import re
+from collections.abc import Container
 from typing import Optional
 import uuid
 from datetime import datetime, timedelta, timezone
 from functools import partial
 
+import aiohttp
 import requests
 import homeassistant.util.dt as dt_util
 from homeassistant.config_entries import ConfigEntry
@@ -15,20 +18,56 @@ from homeassistant.core import HomeAssistant
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
-from .background_worker import BackgroundWorker
-from .caching import CacheEntry
+from .background_worker import (
+    BackgroundWorker,
+    EventQueueMetrics,
+    JobMetrics,
+    Priority,
+)
+from .caching import (
+    CacheEntry,
+    CacheRefreshScheduler,
+    EventDataStore,
+    get_shared_cache_registry,
+)
 from .const import (
-    CACHING_SECONDS_SHORT_TERM,
     CONF_DIRTY_CACHE,
+    CONF_DURABLE_EVENTS,
+    CONF_EVENT_PAYLOAD,
+    CONF_EVENT_QUEUE_POLICY,
+    CONF_EVENT_QUEUE_SIZE,
     CONF_ICA_ID,
+    CONF_REFRESH_INTERVALS,
     CONF_SHOPPING_LISTS,
+    CONF_SYNC_COALESCE_SECONDS,
+    DATA_OPEN_FOOD_FACTS_LIMITER,
+    DATA_PRODUCT_LOOKUP_MISSES,
     DEFAULT_ARTICLE_GROUP_ID,
+    DEFAULT_DURABLE_EVENTS,
+    DEFAULT_EVENT_PAYLOAD,
+    DEFAULT_EVENT_QUEUE_POLICY,
+    DEFAULT_EVENT_QUEUE_SIZE,
+    DEFAULT_REFRESH_INTERVALS,
+    DEFAULT_SYNC_COALESCE_SECONDS,
     DOMAIN,
+    EVENT_PAYLOAD_MAX_BYTES,
+    MAX_CONCURRENT_REQUESTS,
+    PRODUCT_LOOKUP_PAGE_SIZE,
     ConflictMode,
+    EventPayload,
+    IcaDataset,
     IcaEvents,
     OpenFoodFacts,
 )
+from .event_outbox import EventOutbox
 from .icaapi_async import IcaAPIAsync
+from .outbox import MutationOutbox, OutboxOperation, is_connectivity_error
+from .rate_limiter import RateLimiter
+from .refresh_pipeline import (
+    RefreshPipeline,
+    RefreshPipelineResult,
+    RefreshStageResult,
+)
 from .icatypes import (
     ArticleInfo,
     AuthState,
@@ -47,12 +86,49 @@ from .icatypes import (
     IcaShoppingListSync,
     IcaStore,
     IcaStoreOffer,
+    OpenFoodFactsEnrichmentState,
     OpenFoodFactsProduct,
 )
-from .utils import get_diff_obj, get_diffs, index_of, trim_props, try_parse_int
+from .write_queue import ShoppingListWriteQueue
+from .utils import (
+    ArticleIndex,
+    ChangeTokens,
+    ExpiryIndex,
+    RowFingerprints,
+    ShoppingListIndex,
+    apply_shopping_list_sync,
+    canonicalize_lists,
+    chunk_event_payload,
+    compact_diffs,
+    fingerprint,
+    get_changed_offer_ids,
+    get_diff_obj,
+    get_diffs,
+    iter_diffs,
+    summarize_diffs,
+    trim_props,
+    try_parse_int,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+_SUMMARY_PATTERN = re.compile(
+    # r"^(?P<min_quantity>\d-)?(?P<quantity>[0-9,.]*)? ?(?P<unit>st|förp|kg|hg|g|l|dl|cl|ml|msk|tsk|krm)? ?(?P<name>.+)$",       v2
+    r"^(?P<a>((?P<min_quantity>\d-)?(?P<quantity>[0-9,.]*)? )|(?P<b>))(?P<unit>st|förp|kg|hg|g|l|dl|cl|ml|msk|tsk|krm)? ?(?P<name>.+)$"
+)
+
+# Datasets that has to be refreshed before another dataset
+REFRESH_DEPENDENCIES: dict[IcaDataset, list[IcaDataset]] = {
+    IcaDataset.OFFERS: [IcaDataset.FAVORITE_STORES],
+}
+
+
+def get_refresh_interval(entry_data: dict, dataset: IcaDataset) -> int:
+    """Returns the configured refresh interval of a dataset, in minutes."""
+    return entry_data.get(
+        CONF_REFRESH_INTERVALS[dataset], DEFAULT_REFRESH_INTERVALS[dataset]
+    )
+
 
 class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
     """Coordinator for updating task data from ICA."""
@@ -62,11 +138,13 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         hass: HomeAssistant,
         config_entry: ConfigEntry,
         logger: logging.Logger,
-        update_interval: timedelta,
+        update_interval: timedelta | None,
         api: IcaAPIAsync,
         nRecipes: int = 0,
     ) -> None:
-        """Initialize the ICA coordinator."""
+        """Initialize the ICA coordinator.
+        Each dataset is refreshed on its own schedule, a `update_interval` is only
+        needed to also do periodic full refreshes."""
         super().__init__(hass, logger, name="ICA", update_interval=update_interval)
         self.SCAN_INTERVAL = update_interval
         self._config_entry = config_entry
@@ -78,50 +156,192 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         self._productCategories: list[IcaProductCategory] | None = None
         self._icaBaseItems: list | None = None
         self._icaRecipes: list[IcaRecipe] | None = None
+        self.last_refresh: RefreshPipelineResult | None = None
+        self.refresh_stages: dict[str, RefreshStageResult] = {}
 
-        self._worker = BackgroundWorker(hass, config_entry)
+        # Events that must not be lost on restart are kept in an outbox until fired
+        event_outbox = (
+            EventOutbox(hass, f"{config_entry.data[CONF_ICA_ID]}.event_outbox", _LOGGER)
+            if config_entry.data.get(CONF_DURABLE_EVENTS, DEFAULT_DURABLE_EVENTS)
+            else None
+        )
+        self._refreshing: int = 0
+        self._worker = BackgroundWorker(
+            hass,
+            config_entry,
+            max_queue_size=config_entry.data.get(
+                CONF_EVENT_QUEUE_SIZE, DEFAULT_EVENT_QUEUE_SIZE
+            ),
+            queue_policy=config_entry.data.get(
+                CONF_EVENT_QUEUE_POLICY, DEFAULT_EVENT_QUEUE_POLICY
+            ),
+            outbox=event_outbox,
+            is_idle=lambda: not self._refreshing,
+        )
+        # Barcodes that ICA doesn't know of, these are not looked up again. Shared
+        # with the other accounts, as any of them may run the lookups
+        self._product_lookup_misses: set[str] = hass.data.setdefault(
+            DATA_PRODUCT_LOOKUP_MISSES, set()
+        )
         config_entry.async_on_unload(self._worker.shutdown)
+        # Full data of the fired events, referenced by the events
+        self._event_data = EventDataStore(
+            hass, config_entry.data[CONF_ICA_ID], logger=_LOGGER
+        )
+
+        # Mutations are batched per shopping list, before being submitted
+        self._write_queues: dict[str, ShoppingListWriteQueue] = {}
+        # Syncs applied locally, but not yet confirmed by ICA (per shopping list)
+        self._pending_syncs: dict[str, list[IcaShoppingListSync]] = {}
+        self._confirmed_shopping_lists: dict[str, IcaShoppingList] = {}
+        self._optimistic_shopping_lists: dict[str, IcaShoppingList] = {}
+        # Mutations made while ICA was unreachable, replayed on the next refresh
+        self._outbox = MutationOutbox(
+            hass, f"{config_entry.data[CONF_ICA_ID]}.outbox", _LOGGER
+        )
+        config_entry.async_on_unload(self._async_shutdown_write_queues)
 
         self._openFoodFactsSession = async_get_clientsession(self._hass)
+        # Shared by all accounts, as the limit applies to this Home Assistant instance
+        self._openFoodFactsLimiter: RateLimiter = hass.data.setdefault(
+            DATA_OPEN_FOOD_FACTS_LIMITER,
+            RateLimiter(OpenFoodFacts.RATE_LIMIT_PER_MINUTE, 60, burst=5),
+        )
         # config_entry.async_on_unload(self._openFoodFactsSession.close)
 
         config_entry_key = self._config_entry.data[CONF_ICA_ID]
 
-        self._ica_articles = CacheEntry[list[IcaArticle]](
-            hass, "articles", partial(self.api.get_articles)
+        # Account-independent data is shared with other config entries
+        self._shared_cache = get_shared_cache_registry(hass, _LOGGER)
+        config_entry.async_on_unload(
+            partial(self._shared_cache.release, config_entry.entry_id)
+        )
+
+        def expiry(dataset: IcaDataset) -> int:
+            return get_refresh_interval(config_entry.data, dataset) * 60
+
+        self._ica_articles: CacheEntry[list[IcaArticle]] = self._shared_cache.acquire(
+            "articles",
+            config_entry.entry_id,
+            partial(self.api.get_articles),
+            expiry_seconds=expiry(IcaDataset.ARTICLES),
         )
         self._ica_baseitems = CacheEntry[list[IcaBaseItem]](
             hass,
             f"{config_entry_key}.baseitems",
             partial(self.api.get_baseitems),
-            expiry_seconds=CACHING_SECONDS_SHORT_TERM,
+            expiry_seconds=expiry(IcaDataset.BASEITEMS),
         )
         self._ica_current_bonus = CacheEntry[IcaAccountCurrentBonus](
-            hass, f"{config_entry_key}.current_bonus", partial(self._get_current_bonus)
+            hass,
+            f"{config_entry_key}.current_bonus",
+            partial(self._get_current_bonus),
+            expiry_seconds=expiry(IcaDataset.CURRENT_BONUS),
         )
         self._ica_favorite_stores = CacheEntry[list[IcaStore]](
             hass,
             f"{config_entry_key}.favorite_stores",
             partial(self.api.get_favorite_stores),
+            expiry_seconds=expiry(IcaDataset.FAVORITE_STORES),
         )
         self._ica_shopping_lists = CacheEntry[list[IcaShoppingList]](
             hass,
             f"{config_entry_key}.shopping_lists",
             partial(self._async_update_tracked_shopping_lists),
-            expiry_seconds=CACHING_SECONDS_SHORT_TERM,
+            expiry_seconds=expiry(IcaDataset.SHOPPING_LISTS),
         )
         self._ica_offers = CacheEntry[dict[str, IcaOfferDetails]](
             hass,
             f"{config_entry_key}.offers",
             partial(self._update_offer_details),
-            # FOR-DEBUGGING: expiry_seconds=CACHING_SECONDS_SHORT_TERM,
+            expiry_seconds=expiry(IcaDataset.OFFERS),
         )
-        self._ica_products = CacheEntry[dict[str, IcaProduct]](
+        # Content hashes of the offers, computed as offers are ingested, so that
+        # diffing only has to compare the offers whose hash changed
+        self._ica_offer_fingerprints = CacheEntry[dict[str, str]](
             hass,
-            "products",
-            partial(self._update_products),
+            f"{config_entry_key}.offers.fingerprints",
+            partial(self._get_offer_fingerprints),
+        )
+        self._ica_products: CacheEntry[dict[str, IcaProduct]] = (
+            self._shared_cache.acquire(
+                "products", config_entry.entry_id, partial(self._update_products)
+            )
+        )
+        # Resume state of the enrichment of the (shared) products
+        self._open_food_facts_state: CacheEntry[OpenFoodFactsEnrichmentState] = (
+            self._shared_cache.acquire(
+                "open_food_facts_enrichment",
+                config_entry.entry_id,
+                partial(self._get_open_food_facts_state),
+            )
         )
 
+        # Store offers seen in the last offers refresh, to detect changed offers
+        self._previous_store_offers: dict[str, IcaStoreOffer] = {}
+        # Offer ids ordered by when they become obsolete
+        self._offer_expiry: ExpiryIndex | None = None
+        # Lookups of article groups by product name
+        self._article_index = ArticleIndex()
+        config_entry.async_on_unload(
+            self._ica_articles.add_listener(self._article_index.update)
+        )
+        # The shared articles may already have been loaded by another entry
+        self._article_index.update(self._ica_articles.current_value())
+
+        # Lookups by list/row offlineId, offerId and productEan
+        self.shopping_list_index = ShoppingListIndex()
+        self._ica_shopping_lists.add_listener(self._on_shopping_lists_changed)
+
+        # Versions of the data behind each entity, so unchanged entities skip updates
+        self._change_tokens = ChangeTokens()
+        self._ica_baseitems.add_listener(
+            partial(self._change_tokens.update, IcaDataset.BASEITEMS)
+        )
+        self._ica_offers.add_listener(
+            partial(self._change_tokens.update, IcaDataset.OFFERS)
+        )
+
+        # Datasets in refresh order, each is refreshed on its own schedule
+        self._datasets: dict[IcaDataset, CacheEntry] = {
+            IcaDataset.ARTICLES: self._ica_articles,
+            IcaDataset.BASEITEMS: self._ica_baseitems,
+            IcaDataset.CURRENT_BONUS: self._ica_current_bonus,
+            IcaDataset.SHOPPING_LISTS: self._ica_shopping_lists,
+            IcaDataset.FAVORITE_STORES: self._ica_favorite_stores,
+            IcaDataset.OFFERS: self._ica_offers,
+        }
+
+        # Refreshes the datasets as they expire, spread out over time
+        self._scheduler = CacheRefreshScheduler(
+            hass, partial(self._async_refresh_cache_entry), logger=_LOGGER
+        )
+        self._scheduler.add(*self._datasets.values())
+        config_entry.async_on_unload(self._scheduler.async_shutdown)
+
+    @property
+    def cache_entries(self) -> list[CacheEntry]:
+        """The cache entries used by the coordinator."""
+        return [
+            self._ica_articles,
+            self._ica_baseitems,
+            self._ica_current_bonus,
+            self._ica_favorite_stores,
+            self._ica_shopping_lists,
+            self._ica_offers,
+            self._ica_products,
+        ]
+
+    @property
+    def event_queue_metrics(self) -> EventQueueMetrics:
+        """The counters of the queue of events waiting to be fired."""
+        return self._worker.metrics()
+
+    @property
+    def background_job_metrics(self) -> JobMetrics:
+        """The counters of the deferred background jobs."""
+        return self._worker.job_metrics()
+
     async def init_cache(self) -> None:
         """Initializes the cache from local files."""
         try:
@@ -131,36 +351,112 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
             await self._ica_favorite_stores.init_value()
             await self._ica_shopping_lists.init_value()
             await self._ica_offers.init_value()
+            await self._ica_offer_fingerprints.init_value()
             await self._ica_products.init_value()
+            await self._open_food_facts_state.init_value()
+            await self._outbox.async_load()
+            await self._event_data.async_load()
+            await self._worker.async_replay_outbox()
         except Exception as e:
             _LOGGER.error("Cache initialization failed: %s", e)
             raise
+        # Resume where the product jobs left off before the restart
+        self._schedule_product_jobs()
 
     async def _get_tracked_shopping_lists(self) -> list[IcaShoppingList]:
         if not (list_ids := self._config_entry.data.get(CONF_SHOPPING_LISTS, [])):
             return None
-        lists: list[IcaShoppingList] = []
-        for offline_id in list_ids:
-            if not offline_id:
-                continue
-            shopping_list = await self.api.get_shopping_list(offline_id)
-            if shopping_list:
-                lists.append(shopping_list)
-        return lists
+        list_ids = [offline_id for offline_id in list_ids if offline_id]
+        cached = {
+            lst["offlineId"]: lst
+            for lst in self._ica_shopping_lists.current_value() or []
+        }
+
+        # Only download lists that have changed since they were cached
+        latest_changes = await self._get_shopping_list_latest_changes()
+        unchanged = [
+            offline_id
+            for offline_id in list_ids
+            if latest_changes is not None
+            and offline_id in cached
+            and offline_id in latest_changes
+            and latest_changes[offline_id] == cached[offline_id].get("latestChange")
+        ]
+        if unchanged:
+            _LOGGER.debug("Shopping lists unchanged since cached: %s", unchanged)
+
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        errors: list[Exception] = []
+
+        async def fetch(offline_id: str) -> IcaShoppingList | None:
+            if offline_id in unchanged:
+                return cached[offline_id]
+            async with semaphore:
+                try:
+                    return await self.api.get_shopping_list(offline_id)
+                except requests.exceptions.HTTPError as err:
+                    if err.response is not None and err.response.status_code == 401:
+                        # Let the coordinator refresh the login
+                        raise
+                    error = err
+                except (requests.exceptions.RequestException, TimeoutError) as err:
+                    error = err
+            errors.append(error)
+            # Keep the last known copy, instead of dropping the list
+            _LOGGER.warning(
+                "Failed to fetch shopping list '%s', keeping cached copy: %s",
+                offline_id,
+                error,
+            )
+            return cached.get(offline_id)
+
+        fetched = await asyncio.gather(*(fetch(offline_id) for offline_id in list_ids))
+        if errors and len(errors) == len(list_ids) - len(unchanged):
+            # Nothing could be fetched, report it as a failed refresh
+            raise errors[0]
+        return [shopping_list for shopping_list in fetched if shopping_list]
+
+    async def _get_shopping_list_latest_changes(self) -> dict[str, str] | None:
+        """Returns the `latestChange` per shopping list, without downloading the rows.
+        Returns None if the summary is unavailable."""
+        try:
+            data = await self.api.get_shopping_lists()
+        except requests.exceptions.HTTPError as err:
+            if err.response is not None and err.response.status_code == 401:
+                raise
+            _LOGGER.warning("Failed to get shopping list summary: %s", err)
+            return None
+        except (requests.exceptions.RequestException, TimeoutError) as err:
+            _LOGGER.warning("Failed to get shopping list summary: %s", err)
+            return None
+        if not data or "shoppingLists" not in data:
+            return None
+        return {
+            lst["offlineId"]: lst.get("latestChange")
+            for lst in data["shoppingLists"]
+            if lst.get("offlineId") and lst.get("latestChange")
+        }
+
+    def _on_shopping_lists_changed(self, shopping_lists: list[IcaShoppingList]):
+        for list_id in self.shopping_list_index.update(shopping_lists):
+            self._change_tokens.update(
+                f"{IcaDataset.SHOPPING_LISTS}.{list_id}",
+                self.shopping_list_index.get_list(list_id),
+            )
+
+    def get_change_token(self, dataset: IcaDataset, key: str | None = None) -> int:
+        """Returns a token that changes whenever the content of the dataset (or
+        the item with the given key, such as a shopping list) changes."""
+        return self._change_tokens.get(f"{dataset}.{key}" if key else dataset)
 
     def get_shopping_list(self, list_offline_id) -> IcaShoppingList | None:
-        selected_lists = self._ica_shopping_lists.current_value() or []
-        for x in filter(lambda x: x["offlineId"] == list_offline_id, selected_lists):
-            return x
-        return None
+        return self.shopping_list_index.get_list(list_offline_id)
 
     async def async_get_shopping_list(
         self, list_id, invalidate_cache: bool = False
     ) -> IcaShoppingList:
-        selected_lists = await self.async_get_shopping_lists(invalidate_cache) or []
-        for x in filter(lambda x: x["offlineId"] == list_id, selected_lists):
-            return x
-        return None
+        await self.async_get_shopping_lists(invalidate_cache)
+        return self.shopping_list_index.get_list(list_id)
 
     async def async_get_shopping_lists(
         self, invalidate_cache: bool = False
@@ -174,15 +470,8 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         return selected_lists
 
     def get_article_group(self, product_name) -> int:
-        articles = self._ica_articles.current_value() or []
-        if not articles:
-            return DEFAULT_ARTICLE_GROUP_ID  # Unspecified
-
-        product_name = product_name.casefold()
-        for x in filter(
-            lambda x: x.get("name", "").casefold() == product_name, articles
-        ):
-            return x.get("parentId") or DEFAULT_ARTICLE_GROUP_ID
+        if article := self._article_index.get_article(product_name):
+            return article.get("parentId") or DEFAULT_ARTICLE_GROUP_ID
         return DEFAULT_ARTICLE_GROUP_ID  # Unspecified
 
         # articleGroups = {
@@ -196,11 +485,7 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         # return articleGroups.get(str.lower(productName), DEFAULT_ARTICLE_GROUP_ID)
 
     def parse_summary(self, summary):
-        r = re.search(
-            # r"^(?P<min_quantity>\d-)?(?P<quantity>[0-9,.]*)? ?(?P<unit>st|förp|kg|hg|g|l|dl|cl|ml|msk|tsk|krm)? ?(?P<name>.+)$",       v2
-            r"^(?P<a>((?P<min_quantity>\d-)?(?P<quantity>[0-9,.]*)? )|(?P<b>))(?P<unit>st|förp|kg|hg|g|l|dl|cl|ml|msk|tsk|krm)? ?(?P<name>.+)$",
-            summary,
-        )
+        r = _SUMMARY_PATTERN.search(summary)
         quantity = r["quantity"]
         unit = r["unit"]
         productName = r["name"] or summary
@@ -229,8 +514,12 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         offers = self._ica_offers.current_value() or {}
         return offers.get(offer_id, None)
 
+    async def _get_offer_fingerprints(self) -> dict[str, str]:
+        # Only set as offers are ingested, there is nothing to fetch
+        return self._ica_offer_fingerprints.current_value() or {}
+
     async def _update_offer_details(
-        self, store_ids: list[str] = None
+        self, store_ids: list[str] | None = None, invalidate_cache: bool | None = None
     ) -> dict[str, IcaOfferDetails]:
         now = datetime.now()
         current = (
@@ -238,13 +527,22 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         )  # Get current value without refreshing. Possible infinite loop
         target = current.copy()
         pre_count = len(current)
+        # Also resumes the product jobs after a batch that failed, or that was run by
+        # an account that has since been unloaded
+        self._schedule_product_jobs()
 
         if not store_ids:
             # No passed store_ids then use the favorite stores
             stores = await self.async_get_favorite_stores()
             store_ids = [s["id"] for s in stores]
 
-        offers_per_store = await self.api.get_offers(store_ids)
+        # Stores followed by multiple accounts are only fetched once
+        offers_per_store = await self._shared_cache.async_get_store_offers(
+            self._config_entry.entry_id,
+            store_ids,
+            self.api.get_offers_for_store,
+            invalidate_cache,
+        )
         _LOGGER.debug("Fetched offers for stores: %s", store_ids)
 
         if not offers_per_store:
@@ -254,46 +552,59 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         product_registry = self._ica_products.current_value() or {}
         product_registry_old = product_registry.copy()
         product_count = len(product_registry)
+        fingerprints = RowFingerprints(self._ica_offer_fingerprints.current_value())
+        changed_offer_ids: set[str] = set()
+
+        if self._offer_expiry is None:
+            # First refresh since the offers were loaded, index them once
+            self._offer_expiry = ExpiryIndex()
+            for offer_id, offer in current.items():
+                # Offers cached before canonicalization was introduced
+                offer = canonicalize_lists(offer)
+                current[offer_id] = target[offer_id] = offer
+                self._offer_expiry.set(offer_id, self._get_offer_due(offer))
+                self._copy_offer_products_to_registry(offer, product_registry)
+                if offer_id not in fingerprints:
+                    # Offers cached before their hashes were kept
+                    fingerprints.ingest(offer_id, offer)
 
         # Remove obsolete offers... (+30 days from expiration)
-        for offer_id in list(current):
-            offer = current[offer_id]
-            self._copy_offer_products_to_registry(offer, product_registry)
-
-            offer_due = (
-                datetime.fromisoformat(offer["validTo"]) + timedelta(days=30)
-                if offer and offer.get("validTo")
-                else datetime.max
-            )
-            if offer_due < now:
+        for offer_id in self._offer_expiry.pop_expired(now):
+            if offer := target.pop(offer_id, None):
                 _LOGGER.warning("Removing obsolete offer: %s", offer)
-                del target[offer_id]
 
         # Look up the "active" offers that was retrieved
         store_ids = list(offers_per_store.keys())
-        offer_ids = []
         store_offers: dict[str, IcaStoreOffer] = {}
         for store_id in offers_per_store:
             store = offers_per_store[store_id]
-            oids = [
-                o["id"]
-                for o in store["offers"]
-                # if o and o.get("isUsed", None) is not True
-            ]
-            offer_ids = sorted(list(set(offer_ids)) + list(set(oids)))
             for o in store["offers"]:
+                # if o and o.get("isUsed", None) is not True
                 c = store_offers.get(o["id"]) or IcaStoreOffer()
                 c.update(o)
-                store_offers[o["id"]] = c
+                store_offers[o["id"]] = canonicalize_lists(c)
 
-        if not offer_ids:
+        if not store_offers:
             _LOGGER.warning("No offers to lookup, then avoid querying API")
-            return []
+            return target
 
-        full_offers = await self.api.search_offers(store_ids, offer_ids)
-        if not full_offers:
-            _LOGGER.warning("No existing offers found. Is this true??")
-            return []
+        # Only search for offers that are new, or have changed since last refresh
+        offer_ids = get_changed_offer_ids(
+            store_offers, target, self._previous_store_offers
+        )
+        _LOGGER.debug(
+            "Looking up %s new or changed offers out of %s",
+            len(offer_ids),
+            len(store_offers),
+        )
+
+        full_offers = []
+        if offer_ids:
+            full_offers = await self.api.search_offers(store_ids, offer_ids)
+            if not full_offers:
+                _LOGGER.warning("No existing offers found. Is this true??")
+                return target
+        self._previous_store_offers = store_offers
 
         new_offers: list[IcaOfferInfo] = []
         for f in full_offers:
@@ -303,7 +614,12 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
             offer = current_offer.copy()
             offer.update(store_offer)
             offer.update(f)
+            # Reordered lists, e.g. 'eans', should not show up as changes
+            offer = canonicalize_lists(offer)
             target[offer["id"]] = offer
+            if fingerprints.ingest(offer["id"], offer):
+                changed_offer_ids.add(offer["id"])
+            self._offer_expiry.set(offer["id"], self._get_offer_due(offer))
             if not current_offer:
                 offer_info = IcaOfferInfo.map_from_offer_details(offer)
                 new_offers.append(offer_info)
@@ -314,7 +630,9 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
                 "Persisting %s new products", new_product_count - product_count
             )
             await self._update_products(product_registry)
+            self._schedule_product_jobs()
 
+        # Products are never replaced, only added, so there's nothing to compare
         diffs = get_diffs(product_registry_old, product_registry, include_values=False)
         if diffs:
             event_data = {
@@ -325,11 +643,12 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
                 "post_count": new_product_count,
                 "diffs": diffs,
             }
-            await CacheEntry(
-                self._hass, "products_changed--diffs", partial(lambda _: None)
-            ).set_value(event_data)
-            await self._worker.fire_or_queue_event(
-                f"{DOMAIN}_product_event", event_data
+            await self._async_fire_diff_event(
+                f"{DOMAIN}_product_event",
+                event_data,
+                "products_changed--diffs",
+                product_registry_old,
+                product_registry,
             )
 
         # Prepare for publish of change event
@@ -343,7 +662,11 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
             }
         )
 
-        diffs = get_diffs(current, target, include_values=False)
+        fingerprints.retain(target)
+        await self._ica_offer_fingerprints.set_value(fingerprints.hashes)
+        diffs = get_diffs(
+            current, target, include_values=False, candidates=changed_offer_ids
+        )
         _LOGGER.debug("OFFERS DIFFS: %s", diffs)
         if diffs:
             event_data = {
@@ -354,10 +677,14 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
                 "post_count": len(target),
                 "diffs": diffs,
             }
-            await CacheEntry(
-                self._hass, "offers_changed--diffs", partial(lambda _: None)
-            ).set_value(event_data)
-            await self._worker.fire_or_queue_event(f"{DOMAIN}_event", event_data)
+            await self._async_fire_diff_event(
+                f"{DOMAIN}_event",
+                event_data,
+                "offers_changed--diffs",
+                current,
+                target,
+                candidates=changed_offer_ids,
+            )
 
         # Notify new offers
         if new_offers:
@@ -371,11 +698,13 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
             }
             # todo: notify: Auto add automation if new ean's have been added to an offer?
             # todo: ...and remove if no longer exists?
-            await self._worker.fire_or_queue_event(IcaEvents.NEW_OFFERS, event_data)
-            # print to file for debugging purposes
-            await CacheEntry(
-                self._hass, "offers_changed--new-offers", partial(lambda _: None)
-            ).set_value(event_data)
+            # The offer infos are already slim, so they are only split into parts
+            data_ref = await self._store_event_data(
+                "offers_changed--new-offers", event_data
+            )
+            await self._async_fire_event(
+                IcaEvents.NEW_OFFERS, event_data, "new_offers", data_ref, durable=True
+            )
 
         _LOGGER.warning(
             "Updated offer details! pre_count: %s, post_count: %s",
@@ -384,6 +713,83 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         )
         return target
 
+    async def _store_event_data(self, name: str, event_data: dict) -> str:
+        """Stores the full event data locally, and returns its unique cache key."""
+        return await self._event_data.async_store(name, event_data)
+
+    async def _async_fire_diff_event(
+        self,
+        event_type: str,
+        event_data: dict,
+        name: str,
+        old: dict | list,
+        new: dict | list,
+        candidates: Container | None = None,
+    ) -> None:
+        """Fires an event with diffs, according to the configured payload policy.
+
+        The full diffs are stored locally and referenced by 'data_ref'. Unless the
+        full payload is configured, the event only says what changed, or carries the
+        changes from `old` to `new` as JSON Patch operations."""
+        data_ref = await self._store_event_data(name, event_data)
+        policy = self._config_entry.data.get(CONF_EVENT_PAYLOAD, DEFAULT_EVENT_PAYLOAD)
+        if policy == EventPayload.JSON_PATCH:
+            event_data = {
+                **event_data,
+                "summary": summarize_diffs(event_data["diffs"]),
+                # Streamed from the rows, including the properties that were removed
+                "diffs": list(
+                    iter_diffs(old, new, candidates=candidates, json_patch=True)
+                ),
+            }
+        elif policy != EventPayload.FULL:
+            diffs = event_data["diffs"]
+            event_data = {
+                **event_data,
+                "summary": summarize_diffs(diffs),
+                "diffs": compact_diffs(diffs),
+            }
+        await self._async_fire_event(event_type, event_data, "diffs", data_ref)
+
+    async def _async_fire_event(
+        self,
+        event_type: str,
+        event_data: dict,
+        items_key: str,
+        data_ref: str | None = None,
+        durable: bool = False,
+    ) -> None:
+        """Fires an event, split into numbered parts if it exceeds the size limit.
+
+        Durable events are identified by the ids of their items, so that the same
+        items are never announced twice, and are kept until fired across restarts."""
+        if data_ref:
+            event_data = {**event_data, "data_ref": data_ref}
+        for part in chunk_event_payload(event_data, items_key, EVENT_PAYLOAD_MAX_BYTES):
+            dedup_key = None
+            if durable:
+                dedup_key = fingerprint(
+                    [
+                        event_type,
+                        part.get("type"),
+                        part.get("uid"),
+                        [
+                            item.get("id") if isinstance(item, dict) else item
+                            for item in part[items_key]
+                        ],
+                    ]
+                )
+            await self._worker.fire_or_queue_event(
+                event_type, part, dedup_key=dedup_key
+            )
+
+    @staticmethod
+    def _get_offer_due(offer: IcaOfferDetails) -> datetime | None:
+        """Gets when an offer is obsolete, 30 days after its expiration."""
+        if not offer or not offer.get("validTo"):
+            return None
+        return datetime.fromisoformat(offer["validTo"]) + timedelta(days=30)
+
     def _copy_offer_products_to_registry(
         self,
         offer: IcaOfferDetails,
@@ -428,6 +834,23 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
                 product["offers"][product_offer["id"]] = product_offer
                 product_registry[ean_id] = product
 
+    def _schedule_product_jobs(self) -> None:
+        """Schedules the lookups and enrichment of the products without details.
+        As this is not urgent, they're run in paged batches when idle. The products
+        are shared, so only one of the accounts runs each job at a time."""
+        self._shared_cache.schedule_job(
+            "product_lookups",
+            self._config_entry.entry_id,
+            self._worker.schedule_job,
+            self._async_lookup_products,
+        )
+        self._shared_cache.schedule_job(
+            "open_food_facts_enrichment",
+            self._config_entry.entry_id,
+            self._worker.schedule_job,
+            self._async_enrich_products,
+        )
+
     async def _update_products(
         self,
         new_products: dict[str, IcaProduct] | None = None,
@@ -435,14 +858,147 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         product_registry = self._ica_products.current_value() or {}
         if not new_products:
             # Ran through refresh loop
-            # todo: look up Products with an article.articleId and article.name ?
-            # todo: as this might not be urgent, partition lookups in paged-batches
             return product_registry
 
         product_registry.update(new_products)
         await self._ica_products.set_value(product_registry)
         return product_registry
 
+    async def _async_lookup_products(self) -> bool:
+        """Looks up the article of a page of products that are only known by offers.
+        Returns whether there are more products to look up."""
+        product_registry = self._ica_products.current_value() or {}
+        missing = [
+            ean_id
+            for ean_id, product in product_registry.items()
+            if not (product.get("article") or {}).get("articleId")
+            and ean_id not in self._product_lookup_misses
+        ]
+        page = missing[:PRODUCT_LOOKUP_PAGE_SIZE]
+        if not page:
+            return False
+
+        updated: dict[str, IcaProduct] = {}
+        for ean_id in page:
+            try:
+                lookup = await self.api.lookup_barcode(ean_id)
+            except Exception as err:
+                if is_connectivity_error(err):
+                    raise
+                _LOGGER.debug("Failed to look up product '%s': %s", ean_id, err)
+                lookup = None
+            if not lookup:
+                self._product_lookup_misses.add(ean_id)
+                continue
+            product = product_registry[ean_id].copy()
+            product["article"] = {**(product.get("article") or {}), **lookup}
+            updated[ean_id] = product
+
+        _LOGGER.debug(
+            "Looked up %s of %s products, %s remaining",
+            len(updated),
+            len(page),
+            len(missing) - len(page),
+        )
+        if updated:
+            # The registry may have changed while looking up
+            product_registry = self._ica_products.current_value() or {}
+            product_registry.update(updated)
+            await self._ica_products.set_value(product_registry)
+        return len(missing) > len(page)
+
+    async def _get_open_food_facts_state(self) -> OpenFoodFactsEnrichmentState:
+        # Only changed by the enrichment job, there is nothing to fetch
+        return self._open_food_facts_state.current_value() or (
+            OpenFoodFactsEnrichmentState(
+                cursor=None, misses={}, enriched=0, last_run=None
+            )
+        )
+
+    async def _async_enrich_products(self) -> bool:
+        """Enriches a batch of products with data from OpenFoodFacts.
+        Requests are made concurrently, within the shared rate limit, and the
+        progress is persisted so that a restart resumes where it left off.
+        Returns whether there are more products to enrich."""
+        state = await self._get_open_food_facts_state()
+        now = dt_util.utcnow()
+        retry_misses_after = now - timedelta(
+            days=OpenFoodFacts.ENRICHMENT_RETRY_MISSES_DAYS
+        )
+        misses = {
+            ean_id: looked_up
+            for ean_id, looked_up in state["misses"].items()
+            if (parsed := dt_util.parse_datetime(looked_up))
+            and parsed > retry_misses_after
+        }
+        product_registry = self._ica_products.current_value() or {}
+        missing = sorted(
+            ean_id
+            for ean_id, product in product_registry.items()
+            if not product.get("open_food_facts") and ean_id not in misses
+        )
+        if cursor := state["cursor"]:
+            # Resume after the last looked up product, then wrap around
+            missing = [e for e in missing if e > cursor] + [
+                e for e in missing if e <= cursor
+            ]
+        page = missing[: OpenFoodFacts.ENRICHMENT_BATCH_SIZE]
+        if not page:
+            return False
+
+        async def _lookup(ean_id: str) -> OpenFoodFactsProduct | None:
+            await self._openFoodFactsLimiter.acquire()
+            return await self.get_product_from_open_food_facts(
+                ean_id, timeout=OpenFoodFacts.ENRICHMENT_TIMEOUT_SECONDS
+            )
+
+        results = await asyncio.gather(
+            *(_lookup(ean_id) for ean_id in page), return_exceptions=True
+        )
+        updated: dict[str, IcaProduct] = {}
+        throttled = False
+        failed = 0
+        for ean_id, result in zip(page, results, strict=True):
+            if isinstance(result, BaseException):
+                if isinstance(result, aiohttp.ClientResponseError) and (
+                    result.status == 429
+                ):
+                    throttled = True
+                failed += 1
+                _LOGGER.debug("Failed to enrich product '%s': %s", ean_id, result)
+                continue
+            if not result:
+                misses[ean_id] = now.isoformat()
+                continue
+            product = product_registry[ean_id].copy()
+            product["open_food_facts"] = trim_props(result)
+            updated[ean_id] = product
+        if throttled:
+            _LOGGER.warning("Throttled by OpenFoodFacts, backing off for a minute")
+            self._openFoodFactsLimiter.delay(60)
+
+        _LOGGER.debug(
+            "Enriched %s of %s products from OpenFoodFacts, %s remaining",
+            len(updated),
+            len(page),
+            len(missing) - len(page),
+        )
+        if updated:
+            # The registry may have changed while looking up
+            product_registry = self._ica_products.current_value() or {}
+            product_registry.update(updated)
+            await self._ica_products.set_value(product_registry)
+        await self._open_food_facts_state.set_value(
+            OpenFoodFactsEnrichmentState(
+                cursor=page[-1],
+                # Forget misses of products that are no longer in the registry
+                misses={e: t for e, t in misses.items() if e in product_registry},
+                enriched=state["enriched"] + len(updated),
+                last_run=now.isoformat(),
+            )
+        )
+        return len(missing) > len(page) and not throttled and failed < len(page)
+
     def should_refresh_login(self):
         auth_state = self.api.get_authenticated_user()
         if not auth_state or not auth_state.get("token"):
@@ -462,23 +1018,82 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         expiry = expiry - timedelta(seconds=expiry_margin_seconds)
         return expiry < now
 
-    async def _refresh_data(self, invalidate_cache: bool | None = None) -> None:
-        # Get common ICA data first
-        await self._ica_articles.get_value(invalidate_cache)
-        await self._ica_baseitems.get_value(invalidate_cache)
+    async def _refresh_data(
+        self,
+        invalidate_cache: bool | None = None,
+        datasets: list[IcaDataset] | None = None,
+    ) -> None:
+        pipeline = RefreshPipeline(_LOGGER)
+        # Replay offline changes before fetching the data they apply to
+        outbox_datasets = [IcaDataset.SHOPPING_LISTS, IcaDataset.BASEITEMS]
+        replay_outbox = self._outbox.has_pending and (
+            not datasets or any(d in datasets for d in outbox_datasets)
+        )
+        if replay_outbox:
+            pipeline.add_stage("outbox", self._async_replay_outbox)
 
-        # Get user specific data
-        await self._ica_current_bonus.get_value(invalidate_cache)
-        await self._ica_shopping_lists.get_value(invalidate_cache)
+        for dataset, entry in self._datasets.items():
+            if datasets and dataset not in datasets:
+                continue
+            depends_on = [
+                d
+                for d in REFRESH_DEPENDENCIES.get(dataset, [])
+                if not datasets or d in datasets
+            ]
+            runs_after = []
+            if replay_outbox and dataset in outbox_datasets:
+                # Fetched after the replay, even if it failed, so that a change
+                # that can't be replayed never stops the refresh of its dataset
+                runs_after.append("outbox")
+            refresh = partial(entry.get_value, invalidate_cache)
+            if dataset == IcaDataset.OFFERS and invalidate_cache:
+                # Bypass the short-term cache of the offers per store as well
+                refresh = partial(
+                    entry.refresh,
+                    partial(self._update_offer_details, invalidate_cache=True),
+                )
+            pipeline.add_stage(dataset, refresh, depends_on, runs_after)
+        self._refreshing += 1
+        try:
+            await pipeline.async_run()
+        finally:
+            self._refreshing -= 1
+            if pipeline.result:
+                self.refresh_stages.update(pipeline.result["stages"])
+                if not datasets:
+                    self.last_refresh = pipeline.result
+
+    async def _async_replay_outbox(self) -> None:
+        async def submit_baseitems(items: list[IcaBaseItem]) -> None:
+            if response := await self.api.sync_baseitems(items):
+                await self._ica_baseitems.set_value(response)
+
+        async def on_rejected(operation: OutboxOperation, err: Exception) -> None:
+            await self._worker.fire_or_queue_event(
+                f"{DOMAIN}_event",
+                {
+                    "type": "outbox_operation_rejected",
+                    "uid": self._config_entry.data[CONF_ICA_ID],
+                    "operation": operation,
+                    "error": str(err),
+                },
+                Priority.HIGH,
+            )
 
-        # Get store offers
-        await self._ica_favorite_stores.get_value(invalidate_cache)
-        await self._ica_offers.get_value(invalidate_cache)
+        if await self._outbox.async_replay(
+            self._async_submit_shopping_list_sync, submit_baseitems, on_rejected
+        ):
+            self.async_update_listeners()
 
-    async def refresh_data(self, invalidate_cache: bool | None = None) -> None:
+    async def refresh_data(
+        self,
+        invalidate_cache: bool | None = None,
+        datasets: list[IcaDataset] | None = None,
+    ) -> None:
         """Fetch data from the ICA API (if necessary)."""
         new_auth_state = None
         dirty_cache = None
+        refreshed = False
         if self._auth_initialized is None:
             # Initialize Auth during first refresh
             new_auth_state = await self.api.ensure_login()
@@ -488,7 +1103,7 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
             new_auth_state = await self.api.ensure_login(refresh=True)
 
         try:
-            await self._refresh_data(invalidate_cache)
+            await self._refresh_data(invalidate_cache, datasets)
         except requests.exceptions.HTTPError as err:
             if err.response.status_code == 401:
                 # Initiate re-login
@@ -501,7 +1116,8 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
                 _LOGGER.info(
                     "Login seems to have been successfully refreshed, explicitly fetching new data..."
                 )
-                await self._refresh_data(invalidate_cache)
+                await self._refresh_data(invalidate_cache, datasets)
+                refreshed = True
                 # If cache was invalidated and successfully refreshed, then set dirty_cache flag to False
                 dirty_cache = False if invalidate_cache is True else None
                 return None
@@ -520,14 +1136,34 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
             # No exceptions during fetch, auth is valid
             if not self._auth_initialized:
                 self._auth_initialized = True
+            refreshed = True
             # If cache was invalidated and successfully refreshed, then set dirty_cache flag to False
             dirty_cache = False if invalidate_cache is True else None
         finally:
+            if refreshed:
+                # Schedule the next refresh of each dataset, by its new expiry
+                for dataset in datasets or self._datasets:
+                    self._scheduler.schedule(self._datasets[dataset])
             if new_auth_state or dirty_cache is not None:
                 self._try_persist_new_state(
                     self._config_entry, new_auth_state, dirty_cache
                 )
 
+    async def _async_refresh_cache_entry(self, entry: CacheEntry) -> None:
+        """Refreshes a single dataset, as scheduled by its expiry."""
+        if not entry.is_expired():
+            # Already refreshed, for instance by another config entry sharing it
+            return
+        dataset = next(d for d, e in self._datasets.items() if e is entry)
+        try:
+            await self.refresh_data(datasets=[dataset])
+        except Exception as err:
+            # Report like a failed coordinator update, then let the scheduler retry
+            self.async_set_update_error(err)
+            raise
+        # Marks a previously failed update as recovered, and informs listeners
+        self.async_set_updated_data(self.data)
+
     async def _async_setup(self) -> None:
         """Initialize coordinator."""
         await self.init_cache()
@@ -566,13 +1202,16 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         #     raise ValueError("Failed to get a valid shopping list from the API")
 
         for shopping_list in updated or []:
+            if any(shopping_list is lst for lst in current):
+                # Not downloaded, as it hasn't changed since cached
+                continue
             old_rows = next(
                 (lst["rows"] for lst in current if lst["id"] == shopping_list["id"]),
                 [],
             )
             new_rows = shopping_list["rows"]
             if diffs := get_diffs(old_rows, new_rows):
-                await self._worker.fire_or_queue_event(
+                await self._async_fire_diff_event(
                     f"{DOMAIN}_event",
                     {
                         "type": "shopping_list_updated",
@@ -581,6 +1220,9 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
                         "shopping_list_name": shopping_list["title"],
                         "diffs": diffs,
                     },
+                    f"shopping_list_updated--diffs.{shopping_list['id']}",
+                    old_rows,
+                    new_rows,
                 )
         return updated
 
@@ -590,25 +1232,128 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         conflict_mode: ConflictMode = ConflictMode.APPEND,
         instant_submit: bool = True,
     ) -> IcaShoppingList:
-        """Pushes the specified changes to ICA. Might apply some conflict logic on the before. In the future changes could be batched together before being sumbmitted."""
+        """Pushes the specified changes to ICA. Might apply some conflict logic before.
+        Without `instant_submit` (as used by the todo entities), changes are batched
+        together with other changes to the same list, within the configured window,
+        before being submitted."""
 
         # TODO: Ensure that one of the fields are set 'changedRows', 'createdRows', 'deletedRows'
         # TODO: Apply conflict_mode logic
-        # TODO: Batch changes before submitting after X seconds
         # TODO: Apply ordering
 
+        list_id = sync["offlineId"]
+        if list_id not in self._confirmed_shopping_lists and (
+            current := self.get_shopping_list(list_id)
+        ):
+            self._confirmed_shopping_lists[list_id] = current
+        optimistic = list_id in self._confirmed_shopping_lists
+        if optimistic:
+            # Reflect the change directly, before ICA has responded
+            self._pending_syncs.setdefault(list_id, []).append(sync)
+            await self._async_apply_pending_syncs(list_id)
+
+        try:
+            if instant_submit:
+                updated_list = await self._async_submit_shopping_list_sync(sync)
+            else:
+                updated_list = await self._get_write_queue(list_id).async_enqueue(sync)
+        except Exception as err:
+            if is_connectivity_error(err):
+                # Keep the (locally applied) change, replayed once ICA is reachable
+                _LOGGER.warning(
+                    "ICA unreachable, adding sync of '%s' to outbox: %s", list_id, err
+                )
+                await self._outbox.async_add_shopping_list_sync(sync)
+                if not optimistic:
+                    return None
+                self._confirmed_shopping_lists[list_id] = apply_shopping_list_sync(
+                    self._confirmed_shopping_lists[list_id], sync
+                )
+                self._pending_syncs[list_id].remove(sync)
+                return await self._async_apply_pending_syncs(list_id)
+            if optimistic:
+                _LOGGER.warning(
+                    "Failed to sync shopping list '%s', rolling back: %s", list_id, err
+                )
+                self._pending_syncs[list_id].remove(sync)
+                await self._async_apply_pending_syncs(list_id)
+            await self._worker.fire_or_queue_event(
+                f"{DOMAIN}_event",
+                {
+                    "type": "shopping_list_sync_failed",
+                    "uid": self._config_entry.data[CONF_ICA_ID],
+                    "shopping_list_id": list_id,
+                    "sync": sync,
+                    "error": str(err),
+                },
+                Priority.HIGH,
+            )
+            raise
+
+        if optimistic:
+            # Reconcile with the response from ICA
+            self._pending_syncs[list_id].remove(sync)
+            updated_list = await self._async_apply_pending_syncs(list_id)
+        return updated_list
+
+    async def _async_apply_pending_syncs(self, list_id: str) -> IcaShoppingList:
+        """Sets the cached shopping list to the latest state confirmed by ICA (either
+        by a sync response, or by a refresh of the cache), with the pending syncs
+        applied on top of it."""
+        shopping_list = self._confirmed_shopping_lists[list_id]
+        current = self.get_shopping_list(list_id)
+        if (
+            current is not None
+            and current is not self._optimistic_shopping_lists.get(list_id)
+            and (current.get("latestChange") or "")
+            > (shopping_list.get("latestChange") or "")
+        ):
+            # Refreshed while the syncs were in-flight, which is more recent
+            shopping_list = self._confirmed_shopping_lists[list_id] = current
+        pending = self._pending_syncs.get(list_id) or []
+        for sync in pending:
+            shopping_list = apply_shopping_list_sync(shopping_list, sync)
+        if pending:
+            self._optimistic_shopping_lists[list_id] = shopping_list
+        else:
+            # Nothing in-flight, the cache is the source of truth again
+            del self._confirmed_shopping_lists[list_id]
+            self._optimistic_shopping_lists.pop(list_id, None)
+        return await self._dynamically_update_shopping_list_cache(shopping_list)
+
+    def _get_write_queue(self, list_offline_id: str) -> ShoppingListWriteQueue:
+        if (queue := self._write_queues.get(list_offline_id)) is None:
+            queue = self._write_queues[list_offline_id] = ShoppingListWriteQueue(
+                self._hass,
+                self._async_submit_shopping_list_sync,
+                self._config_entry.data.get(
+                    CONF_SYNC_COALESCE_SECONDS, DEFAULT_SYNC_COALESCE_SECONDS
+                ),
+            )
+        return queue
+
+    async def _async_shutdown_write_queues(self) -> None:
+        for queue in self._write_queues.values():
+            await queue.async_shutdown()
+
+    async def _async_submit_shopping_list_sync(
+        self, sync: IcaShoppingListSync
+    ) -> IcaShoppingList:
         # Push sync to API
         updated_list = await self.api.sync_shopping_list(sync)
 
-        # todo: no need to await?, just queue it in background...
-        await self._dynamically_update_shopping_list_cache(updated_list)
+        if sync["offlineId"] in self._confirmed_shopping_lists:
+            # Applied locally already, reconciled once the callers have been resolved
+            self._confirmed_shopping_lists[sync["offlineId"]] = updated_list
+        else:
+            await self._dynamically_update_shopping_list_cache(updated_list)
         return updated_list
 
     async def _dynamically_update_shopping_list_cache(
         self, updated_list: IcaShoppingList
     ) -> IcaShoppingList:
-        state = self._ica_shopping_lists.current_value().copy()
-        index = index_of(state, "offlineId", updated_list["offlineId"])
+        state = (self._ica_shopping_lists.current_value() or []).copy()
+        index = self.shopping_list_index.position_of(updated_list["offlineId"])
         if index >= 0:
             state[index] = updated_list
             await self._ica_shopping_lists.set_value(state)
@@ -674,7 +1419,15 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
 
     async def sync_baseitems(self, items: list[IcaBaseItem]) -> list[IcaBaseItem]:
         """Updates the account baseitems."""
-        response = await self.api.sync_baseitems(items)
+        try:
+            response = await self.api.sync_baseitems(items)
+        except Exception as err:
+            if not is_connectivity_error(err):
+                raise
+            # Keep the change locally, to be replayed once ICA is reachable
+            _LOGGER.warning("ICA unreachable, adding baseitems to outbox: %s", err)
+            await self._outbox.async_set_baseitems(items)
+            response = items
         if response:
             await self._ica_baseitems.set_value(response)
             _LOGGER.info("Dynamically updated BaseItems cache")
@@ -707,6 +1460,7 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
                 "uid": self._config_entry.data[CONF_ICA_ID],
                 "data": current_bonus,
             },
+            Priority.LOW,
         )
         return current_bonus
 
@@ -773,6 +1527,7 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
         code: str,
         fields: Optional[list[str]] = None,
         raise_if_invalid: bool = False,
+        timeout: float = 10,
     ) -> Optional[OpenFoodFactsProduct]:
         """Return a product.
 
@@ -783,6 +1538,7 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
             returned.
         :param raise_if_invalid: if True, a ValueError is raised if the
             barcode is invalid, defaults to False.
+        :param timeout: seconds to wait for a response, defaults to 10.
         :return: the API response
         """
         if not code or not isinstance(code, str):
@@ -795,50 +1551,50 @@ class IcaCoordinator(DataUpdateCoordinator[list[IcaShoppingListEntry]]):
             # https://github.com/openfoodfacts/openfoodfacts-server/issues/1607
             url += f"?fields={','.join(fields)}"
 
-        response = await self._openFoodFactsSession.get(
+        # The response is released back to the pool once read, or on errors
+        async with self._openFoodFactsSession.get(
             url,
             headers={"User-Agent": "ha-ica-todo"},
-            timeout=10,
-        )
-
-        try:
-            if response.status == 404 and not raise_if_invalid:
-                return None
-            response.raise_for_status()
-        except BaseException as ex:
-            _LOGGER.error(
-                "Error getting info from OpenFoodFacts. HTTP [GET] Resp: %s -> %s",
-                response.status,
-                response.text,
-            )
-            raise ex
-        else:
-            resp = await response.json()
-            if resp is None:
-                # product not found
-                return None
-            if resp.get("status", None) is None:
-                raise ValueError(
-                    "Seems like the API call to OpenFoodFacts failed. HTTP [GET] Resp: %s -> %s",
+            timeout=aiohttp.ClientTimeout(total=timeout),
+        ) as response:
+            try:
+                if response.status == 404 and not raise_if_invalid:
+                    return None
+                response.raise_for_status()
+            except BaseException as ex:
+                _LOGGER.error(
+                    "Error getting info from OpenFoodFacts. HTTP [GET] Resp: %s -> %s",
                     response.status,
                     response.text,
                 )
-            if resp["status"] == 0:
-                # invalid barcode
-                if raise_if_invalid:
-                    raise ValueError(f"invalid barcode: {code}")
-                return None
-
-            p = resp["product"] if resp is not None else None
-            nutriments = p.get("nutriments", {})
-            return OpenFoodFactsProduct(
-                brand_owner=p.get("brand_owner"),
-                brands=p.get("brands"),
-                product_name=p.get("product_name"),
-                product_type=p.get("product_type"),
-                quantity=p.get("quantity"),
-                energy_kcal_value=nutriments.get(
-                    "energy-kcal_value", nutriments.get("energy-kcal_100g")
-                ),
-                categories=p.get("categories_hierarchy"),
-            )
+                raise ex
+            else:
+                resp = await response.json()
+                if resp is None:
+                    # product not found
+                    return None
+                if resp.get("status", None) is None:
+                    raise ValueError(
+                        "Seems like the API call to OpenFoodFacts failed. HTTP [GET] Resp: %s -> %s",
+                        response.status,
+                        response.text,
+                    )
+                if resp["status"] == 0:
+                    # invalid barcode
+                    if raise_if_invalid:
+                        raise ValueError(f"invalid barcode: {code}")
+                    return None
+
+                p = resp["product"] if resp is not None else None
+                nutriments = p.get("nutriments", {})
+                return OpenFoodFactsProduct(
+                    brand_owner=p.get("brand_owner"),
+                    brands=p.get("brands"),
+                    product_name=p.get("product_name"),
+                    product_type=p.get("product_type"),
+                    quantity=p.get("quantity"),
+                    energy_kcal_value=nutriments.get(
+                        "energy-kcal_value", nutriments.get("energy-kcal_100g")
+                    ),
+                    categories=p.get("categories_hierarchy"),
+                )
@@ -0,0 +1,115 @@
+"""Durable outbox of events that are waiting to be fired."""
+
+import json
+import logging
+from pathlib import Path
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import slugify
+
+from .utils import parse_event_journal
+
+_LOGGER = logging.getLogger(__name__)
+
+EVENT_OUTBOX_PATH = ".storage/ica.{key}.jsonl"
+# Number of fired keys that are remembered after compaction, to drop duplicates
+EVENT_OUTBOX_KEEP_FIRED = 500
+
+
+class EventOutbox:
+    """Append-only journal of queued events, so that they survive a restart.
+
+    Every queued event is appended with a dedup key, and a record is appended once
+    it has been fired. On startup the events that were never fired are replayed. The
+    journal is compacted once no events are pending."""
+
+    def __init__(
+        self, hass: HomeAssistant, key: str, logger: logging.Logger = _LOGGER
+    ) -> None:
+        self._hass = hass
+        self._path = Path(hass.config.path(EVENT_OUTBOX_PATH.format(key=slugify(key))))
+        self._logger = logger
+        self._pending: set[str] = set()
+        self._fired: set[str] = set()
+        self._appended_since_compaction: int = 0
+
+    def is_known(self, key: str) -> bool:
+        """Whether an event with the key is pending, or has been fired."""
+        return key in self._pending or key in self._fired
+
+    async def async_load(self) -> list[dict]:
+        """Loads the journal. Returns the events that were never fired."""
+        lines = await self._hass.async_add_executor_job(self._read_lines)
+        pending, fired = parse_event_journal(lines, EVENT_OUTBOX_KEEP_FIRED)
+        self._pending = {record["key"] for record in pending}
+        self._fired = set(fired)
+        if pending:
+            self._logger.info("Replaying %s events from the outbox", len(pending))
+        return pending
+
+    async def async_append(
+        self, key: str, event_type: str, event_data: dict, priority: int
+    ) -> bool:
+        """Appends an event to the journal. Returns False for a known key."""
+        if self.is_known(key):
+            self._logger.debug("Dropping duplicate event: %s (%s)", event_type, key)
+            return False
+        self._pending.add(key)
+        record = {
+            "key": key,
+            "event_type": event_type,
+            "event_data": event_data,
+            "priority": priority,
+        }
+        await self._async_append_lines([record])
+        return True
+
+    async def async_mark_fired(self, keys: list[str]) -> None:
+        """Records that the events have been fired (or dropped)."""
+        keys = [key for key in keys if key in self._pending]
+        if not keys:
+            return
+        self._pending.difference_update(keys)
+        self._fired.update(keys)
+        await self._async_append_lines([{"fired": key} for key in keys])
+        if not self._pending:
+            await self._async_compact()
+
+    async def _async_append_lines(self, records: list[dict]) -> None:
+        content = "".join(json.dumps(r, default=str) + "\n" for r in records)
+        try:
+            await self._hass.async_add_executor_job(self._append, content)
+            self._appended_since_compaction += len(records)
+        except OSError as err:
+            self._logger.warning(
+                "Failed to write event outbox '%s': %s", self._path, err
+            )
+
+    async def _async_compact(self) -> None:
+        """Rewrites the journal to only remember the most recently fired keys."""
+        if self._appended_since_compaction < EVENT_OUTBOX_KEEP_FIRED:
+            return
+        lines = await self._hass.async_add_executor_job(self._read_lines)
+        _, fired = parse_event_journal(lines, EVENT_OUTBOX_KEEP_FIRED)
+        self._fired = set(fired)
+        content = "".join(json.dumps({"fired": key}) + "\n" for key in fired)
+        try:
+            await self._hass.async_add_executor_job(self._path.write_text, content)
+            self._appended_since_compaction = 0
+        except OSError as err:
+            self._logger.warning(
+                "Failed to compact event outbox '%s': %s", self._path, err
+            )
+
+    def _read_lines(self) -> list[str]:
+        try:
+            return self._path.read_text().splitlines() if self._path.exists() else []
+        except OSError as err:
+            self._logger.warning(
+                "Failed to load event outbox '%s': %s", self._path, err
+            )
+            return []
+
+    def _append(self, content: str) -> None:
+        with self._path.open("a") as file:
+            file.write(content)
@@ -186,14 +186,12 @@ class IcaAPI:
         # new_rows = [x for x in data["rows"] if "sourceId" in x and x["sourceId"] == -1]
         # data = {"changedRows": new_rows}
 
-        if "deletedRows" in data:
-            sync_data = {"deletedRows": data["deletedRows"]}
-        elif "changedRows" in data:
-            sync_data = {"changedRows": data["changedRows"]}
-        elif "createdRows" in data:
-            sync_data = {"createdRows": data["createdRows"]}
-        else:
-            sync_data = data
+        # A (batched) sync can contain created, changed and deleted rows at once
+        sync_data = {
+            k: data[k]
+            for k in ("createdRows", "changedRows", "deletedRows")
+            if data.get(k)
+        } or data
 
         return post(self._session, url, self._auth_key, sync_data)
 
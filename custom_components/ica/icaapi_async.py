@@ -68,6 +68,9 @@ class IcaAPIAsync:
     async def get_product_categories(self) -> list[IcaProductCategory]:
         return await run_async(lambda: self._api.get_product_categories())
 
+    async def get_offers_for_store(self, store_id) -> OffersAndDiscountsForStore:
+        return await run_async(lambda: self._api.get_offers_for_store(store_id))
+
     async def get_offers(
         self, store_ids: list[int]
     ) -> dict[str, OffersAndDiscountsForStore]:
@@ -169,6 +169,15 @@ class OpenFoodFactsProduct(TypedDict):
     categories: list[str]
 
 
+class OpenFoodFactsEnrichmentState(TypedDict):
+    """Progress of the background enrichment of products from OpenFoodFacts"""
+
+    cursor: str | None  # Last looked up EAN, the next pass resumes after it
+    misses: dict[str, str]  # EANs unknown to OpenFoodFacts, and when looked up
+    enriched: int
+    last_run: str | None
+
+
 class IcaStore(TypedDict):
     id: int  # "storeId"
     marketingName: str | None
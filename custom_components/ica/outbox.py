@@ -0,0 +1,183 @@
+"""Durable outbox of mutations that couldn't be submitted to ICA."""
+
+import logging
+from collections.abc import Awaitable, Callable
+from datetime import timedelta
+from functools import partial
+from typing import Any, NotRequired, TypedDict
+
+import requests
+
+import homeassistant.util.dt as dt_util
+from homeassistant.core import HomeAssistant
+
+from .caching import CacheEntry
+from .const import OUTBOX_MAX_AGE_DAYS, OUTBOX_MAX_ATTEMPTS
+from .icatypes import IcaBaseItem, IcaShoppingListSync
+from .utils import merge_shopping_list_syncs
+
+_LOGGER = logging.getLogger(__name__)
+
+OUTBOX_SHOPPING_LIST: str = "shopping_list"
+OUTBOX_BASEITEMS: str = "baseitems"
+
+
+class OutboxOperation(TypedDict):
+    type: str  # OUTBOX_SHOPPING_LIST | OUTBOX_BASEITEMS
+    target: str  # offlineId of the shopping list, or "baseitems"
+    data: IcaShoppingListSync | list[IcaBaseItem]
+    created: NotRequired[str]  # When the (first merged) operation was added
+    attempts: NotRequired[int]  # Replays that failed with a server error
+
+
+def is_connectivity_error(err: BaseException) -> bool:
+    """Whether the error means that ICA is unreachable (rather than rejecting the
+    request)."""
+    if isinstance(err, requests.exceptions.HTTPError):
+        return err.response is not None and err.response.status_code >= 500
+    return isinstance(
+        err,
+        (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            TimeoutError,
+        ),
+    )
+
+
+class MutationOutbox:
+    """Keeps pending shopping list and baseitem syncs in `.storage`, until they can be
+    replayed. Redundant operations are compacted as they are added: syncs of the same
+    shopping list are merged (a created row that is deleted again cancels out) and
+    only the latest set of baseitems is kept."""
+
+    def __init__(
+        self, hass: HomeAssistant, key: str, logger: logging.Logger | None = None
+    ) -> None:
+        self._logger = logger or _LOGGER
+        self._storage = CacheEntry[list[OutboxOperation]](
+            hass, key, partial(self._current_operations), jitter=0
+        )
+
+    async def _current_operations(self) -> list[OutboxOperation]:
+        return self._storage.current_value() or []
+
+    @property
+    def has_pending(self) -> bool:
+        """Whether there are operations waiting to be replayed."""
+        return bool(self._storage.current_value())
+
+    async def async_load(self) -> None:
+        """Loads pending operations from file."""
+        await self._storage.init_value()
+        if self.has_pending:
+            self._logger.info(
+                "Loaded %s pending operations from outbox",
+                len(self._storage.current_value()),
+            )
+
+    async def _async_add(self, operation: OutboxOperation, merge: Callable) -> None:
+        operations = list(self._storage.current_value() or [])
+        for index, existing in enumerate(operations):
+            if (existing["type"], existing["target"]) == (
+                operation["type"],
+                operation["target"],
+            ):
+                operations[index] = {
+                    **existing,
+                    "data": merge(existing["data"], operation["data"]),
+                }
+                break
+        else:
+            operations.append(
+                {**operation, "created": dt_util.utcnow().isoformat(), "attempts": 0}
+            )
+        await self._storage.set_value(operations)
+
+    async def async_add_shopping_list_sync(self, sync: IcaShoppingListSync) -> None:
+        """Adds a shopping list sync, merged with earlier syncs of the same list."""
+        self._logger.info("Adding shopping list sync to outbox: %s", sync)
+        await self._async_add(
+            OutboxOperation(
+                type=OUTBOX_SHOPPING_LIST, target=sync["offlineId"], data=sync
+            ),
+            lambda old, new: merge_shopping_list_syncs([old, new]),
+        )
+
+    async def async_set_baseitems(self, items: list[IcaBaseItem]) -> None:
+        """Sets the baseitems to submit, replacing any earlier pending baseitems."""
+        self._logger.info("Adding baseitems sync to outbox")
+        await self._async_add(
+            OutboxOperation(type=OUTBOX_BASEITEMS, target=OUTBOX_BASEITEMS, data=items),
+            lambda old, new: new,
+        )
+
+    async def async_replay(
+        self,
+        submit_shopping_list_sync: Callable[[IcaShoppingListSync], Awaitable[Any]],
+        submit_baseitems: Callable[[list[IcaBaseItem]], Awaitable[Any]],
+        on_rejected: Callable[[OutboxOperation, Exception], Awaitable[None]]
+        | None = None,
+    ) -> int:
+        """Replays the pending operations in order. Stops (and raises) if ICA is
+        still unreachable. Operations rejected by ICA are dropped, as are operations
+        that keep failing with server errors or have grown too old. Returns the
+        number of replayed operations."""
+        replayed = 0
+        while operations := self._storage.current_value():
+            operation = operations[0]
+            if self._is_expired(operation):
+                err = TimeoutError(f"Not replayed within {OUTBOX_MAX_AGE_DAYS} days")
+                await self._async_drop(operation, err, on_rejected)
+                continue
+            try:
+                if operation["type"] == OUTBOX_SHOPPING_LIST:
+                    if any(
+                        operation["data"].get(k)
+                        for k in ("createdRows", "changedRows", "deletedRows")
+                    ):
+                        await submit_shopping_list_sync(operation["data"])
+                else:
+                    await submit_baseitems(operation["data"])
+            except Exception as err:
+                if is_connectivity_error(err):
+                    if isinstance(err, requests.exceptions.HTTPError):
+                        # ICA responded, but might keep failing on this operation
+                        operation = {
+                            **operation,
+                            "attempts": operation.get("attempts", 0) + 1,
+                        }
+                    if operation.get("attempts", 0) < OUTBOX_MAX_ATTEMPTS:
+                        self._logger.info(
+                            "ICA still unreachable, keeping outbox: %s", err
+                        )
+                        await self._storage.set_value([operation, *operations[1:]])
+                        raise
+                await self._async_drop(operation, err, on_rejected)
+            else:
+                replayed += 1
+                await self._storage.set_value(operations[1:])
+        if replayed:
+            self._logger.info("Replayed %s operations from outbox", replayed)
+        return replayed
+
+    def _is_expired(self, operation: OutboxOperation) -> bool:
+        created = dt_util.parse_datetime(operation.get("created") or "")
+        return created is not None and dt_util.utcnow() - created > timedelta(
+            days=OUTBOX_MAX_AGE_DAYS
+        )
+
+    async def _async_drop(
+        self,
+        operation: OutboxOperation,
+        err: Exception,
+        on_rejected: Callable[[OutboxOperation, Exception], Awaitable[None]] | None,
+    ) -> None:
+        self._logger.error(
+            "Dropping outbox operation that could not be replayed: %s. Err: %s",
+            operation,
+            err,
+        )
+        await self._storage.set_value(self._storage.current_value()[1:])
+        if on_rejected:
+            await on_rejected(operation, err)
@@ -0,0 +1,61 @@
+"""Rate limiting of requests to external services."""
+
+import asyncio
+import time
+from collections.abc import Callable
+from typing import Self
+
+
+class RateLimiter:
+    """Token bucket that allows `rate` acquisitions per `period` seconds.
+
+    Up to `burst` acquisitions (defaults to `rate`) are allowed at once, after which
+    callers wait for the bucket to refill. Waiting callers are served in order."""
+
+    def __init__(
+        self,
+        rate: int,
+        period: float,
+        burst: int | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if rate <= 0 or period <= 0:
+            raise ValueError("rate and period must be positive")
+        self._interval = period / rate
+        self._capacity = float(burst or rate)
+        self._tokens = self._capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        self._tokens = min(self._capacity, self._tokens + elapsed / self._interval)
+
+    def try_acquire(self) -> bool:
+        """Takes a token if one is available, without waiting."""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        """Waits until a token is available, and takes it."""
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep((1 - self._tokens) * self._interval)
+
+    def delay(self, seconds: float) -> None:
+        """Holds back further acquisitions, e.g. when the service asks to back off."""
+        self._refill()
+        self._tokens = min(self._tokens, 0) - seconds / self._interval
+
+    async def __aenter__(self) -> Self:
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
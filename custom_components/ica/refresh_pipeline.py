@@ -0,0 +1,115 @@
+"""Dependency-aware refresh of ICA data."""
+
+import asyncio
+import datetime as dt
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, TypedDict
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RefreshStageResult(TypedDict):
+    """Outcome of a single stage in a refresh"""
+
+    started: str | None
+    duration_seconds: float | None
+    error: str | None
+    skipped: bool
+
+
+class RefreshPipelineResult(TypedDict):
+    """Outcome of a full refresh"""
+
+    started: str
+    duration_seconds: float
+    stages: dict[str, RefreshStageResult]
+
+
+class RefreshPipeline:
+    """Runs refresh stages as a small dependency graph.
+
+    Every stage is started as soon as the stages it depends on have completed, so
+    independent stages run concurrently and a full refresh takes roughly the time
+    of its longest chain. Stages depending on a failed stage are skipped, while
+    stages that only run after another stage are started regardless of its outcome.
+    """
+
+    def __init__(self, logger: logging.Logger | None = None) -> None:
+        self._logger = logger or _LOGGER
+        self._stages: dict[
+            str, tuple[Callable[[], Awaitable[Any]], list[str], list[str]]
+        ] = {}
+        self.result: RefreshPipelineResult | None = None
+
+    def add_stage(
+        self,
+        name: str,
+        func: Callable[[], Awaitable[Any]],
+        depends_on: list[str] | None = None,
+        runs_after: list[str] | None = None,
+    ) -> None:
+        """Adds a stage. Dependencies have to be added before their dependents."""
+        if name in self._stages:
+            raise ValueError(f"Stage '{name}' has already been added")
+        depends_on = depends_on or []
+        runs_after = runs_after or []
+        for dependency in depends_on + runs_after:
+            if dependency not in self._stages:
+                raise ValueError(f"Stage '{name}' depends on unknown '{dependency}'")
+        self._stages[name] = (func, depends_on, runs_after)
+
+    async def async_run(self) -> RefreshPipelineResult:
+        """Runs all stages. Raises the first error (in the order the stages were
+        added) once every stage has completed or been skipped."""
+        started = dt.datetime.now(dt.timezone.utc)
+        start = time.monotonic()
+        results: dict[str, RefreshStageResult] = {}
+        errors: dict[str, BaseException] = {}
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_stage(name: str) -> bool:
+            func, depends_on, runs_after = self._stages[name]
+            await asyncio.gather(*(tasks[d] for d in runs_after))
+            dependencies_ok = all(await asyncio.gather(*(tasks[d] for d in depends_on)))
+            if not dependencies_ok:
+                self._logger.warning(
+                    "Skipping refresh of '%s' (dependency failed)", name
+                )
+                results[name] = RefreshStageResult(
+                    started=None, duration_seconds=None, error=None, skipped=True
+                )
+                return False
+
+            stage_started = dt.datetime.now(dt.timezone.utc)
+            stage_start = time.monotonic()
+            try:
+                await func()
+            except Exception as err:  # noqa: BLE001 - reported in the result
+                errors[name] = err
+                self._logger.warning("Refresh of '%s' failed: %s", name, err)
+            results[name] = RefreshStageResult(
+                started=stage_started.isoformat(),
+                duration_seconds=round(time.monotonic() - stage_start, 3),
+                error=(str(errors[name]) or type(errors[name]).__name__)
+                if name in errors
+                else None,
+                skipped=False,
+            )
+            return name not in errors
+
+        for name in self._stages:
+            tasks[name] = asyncio.ensure_future(run_stage(name))
+        await asyncio.gather(*tasks.values())
+
+        self.result = RefreshPipelineResult(
+            started=started.isoformat(),
+            duration_seconds=round(time.monotonic() - start, 3),
+            stages={name: results[name] for name in self._stages},
+        )
+        self._logger.debug("Refresh completed: %s", self.result)
+        for name in self._stages:
+            if name in errors:
+                raise errors[name]
+        return self.result
@@ -0,0 +1,135 @@
+"""Diagnostic sensors for the ICA integration."""
+
+import logging
+
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorStateClass,
+)
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.util import slugify
+
+from .caching import CacheEntry
+from .const import DOMAIN
+from .coordinator import IcaCoordinator
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+) -> None:
+    """Set up the ICA diagnostic sensors."""
+    coordinator: IcaCoordinator = hass.data[DOMAIN][entry.entry_id]
+    async_add_entities(
+        [
+            IcaRefreshSensor(coordinator, entry),
+            IcaEventQueueSensor(coordinator, entry),
+            *[
+                IcaCacheSensor(coordinator, entry, cache_entry)
+                for cache_entry in coordinator.cache_entries
+            ],
+        ]
+    )
+
+
+class IcaRefreshSensor(CoordinatorEntity[IcaCoordinator], SensorEntity):
+    """Exposes the timings of the latest full refresh. The state is its duration."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+    _attr_icon = "mdi:timer-sync-outline"
+
+    def __init__(self, coordinator: IcaCoordinator, config_entry: ConfigEntry) -> None:
+        """Initialize IcaRefreshSensor."""
+        super().__init__(coordinator=coordinator)
+        self._attr_unique_id = f"{config_entry.entry_id}-last-refresh"
+        self._attr_name = "ICA Last refresh"
+
+    @property
+    def native_value(self) -> float | None:
+        if last_refresh := self.coordinator.last_refresh:
+            return last_refresh["duration_seconds"]
+        return None
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        return {
+            **(self.coordinator.last_refresh or {}),
+            # Includes datasets refreshed on their own schedule since the full refresh
+            "stages": self.coordinator.refresh_stages,
+        }
+
+
+class IcaCacheSensor(CoordinatorEntity[IcaCoordinator], SensorEntity):
+    """Exposes the metrics of a cache entry, the state is the age of its value."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+    _attr_icon = "mdi:database-clock"
+
+    def __init__(
+        self,
+        coordinator: IcaCoordinator,
+        config_entry: ConfigEntry,
+        cache_entry: CacheEntry,
+    ) -> None:
+        """Initialize IcaCacheSensor."""
+        super().__init__(coordinator=coordinator)
+        self._cache_entry = cache_entry
+        self._attr_unique_id = (
+            f"{config_entry.entry_id}-cache-{slugify(cache_entry.key)}"
+        )
+        # Account specific keys are prefixed with the account id, omit it from the name
+        key = cache_entry.key.rsplit(".", 1)[-1]
+        self._attr_name = f"ICA Cache {key.replace('_', ' ')}"
+
+    @property
+    def native_value(self) -> int | None:
+        return self._cache_entry.metrics().get("age_seconds")
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        metrics = self._cache_entry.metrics()
+        hits = metrics["hits"]
+        misses = metrics["misses"]
+        return {
+            "key": self._cache_entry.key,
+            **metrics,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+
+
+class IcaEventQueueSensor(CoordinatorEntity[IcaCoordinator], SensorEntity):
+    """Exposes the counters of the event queue and background jobs. The state is the
+    number of queued events."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_icon = "mdi:tray-full"
+
+    def __init__(self, coordinator: IcaCoordinator, config_entry: ConfigEntry) -> None:
+        """Initialize IcaEventQueueSensor."""
+        super().__init__(coordinator=coordinator)
+        self._attr_unique_id = f"{config_entry.entry_id}-event-queue"
+        self._attr_name = "ICA Event queue"
+
+    @property
+    def native_value(self) -> int:
+        return self.coordinator.event_queue_metrics["queue_depth"]
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        return {
+            **self.coordinator.event_queue_metrics,
+            "jobs": self.coordinator.background_job_metrics,
+        }
@@ -30,6 +30,7 @@ from .const import (
     DEFAULT_ARTICLE_GROUP_ID,
     DOMAIN,
     ConflictMode,
+    IcaDataset,
     IcaServices,
 )
 from .coordinator import IcaCoordinator
@@ -39,7 +40,7 @@ from .icatypes import (
     IcaShoppingListSync,
     ServiceCallResponse,
 )
-from .utils import index_of, merge_shopping_list_entries, product_names_match
+from .utils import ShoppingListRowMatcher, index_of, merge_shopping_list_entries
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -274,14 +275,34 @@ class IcaShoppingListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
         self._attr_name = shopping_list_name
         self._attr_icon = "mdi:cart"
         self._attr_todo_items: list[TodoItem] | None = None
+        self._change_token: tuple | None = None
 
     @property
     def name(self):
         return f"ICA {self._attr_name}"
 
+    def _get_change_token(self) -> tuple:
+        shopping_list = self.coordinator.get_shopping_list(self._project_id)
+        has_offers = shopping_list and any(
+            row.get("offerId") for row in shopping_list["rows"]
+        )
+        return (
+            self.coordinator.last_update_success,
+            self.coordinator.get_change_token(
+                IcaDataset.SHOPPING_LISTS, self._project_id
+            ),
+            # Due dates of rows are taken from their offers
+            self.coordinator.get_change_token(IcaDataset.OFFERS) if has_offers else 0,
+        )
+
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
+        change_token = self._get_change_token()
+        if change_token == self._change_token:
+            # Neither the list nor its offers changed, skip rebuilding the items
+            return
+        self._change_token = change_token
         items = []
         if shopping_list := self.coordinator.get_shopping_list(self._project_id):
             _LOGGER.info("TODO list: %s", shopping_list)
@@ -355,11 +376,9 @@ class IcaShoppingListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
         )
 
         offer_id = row_item.get("offerId", None)
-        matches_by_offer_id = [
-            r
-            for r in shopping_list["rows"]
-            if offer_id and r.get("offerId", None) == offer_id
-        ]
+        matches_by_offer_id = self.coordinator.shopping_list_index.get_rows_by_offer(
+            self._project_id, offer_id
+        )
         # _LOGGER.fatal("MATCHES_OFFER: %s", matches_by_offer_id)
 
         has_conflict = matches_by_offer_id
@@ -388,12 +407,13 @@ class IcaShoppingListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
         ti["isStrikedOver"] = False
         ti["offlineId"] = str(uuid.uuid4())
         items = [IcaShoppingListEntry(ti)]
-        await self.async_create_shopping_list_items(items)
+        await self.async_create_shopping_list_items(items, instant_submit=False)
 
     async def async_create_shopping_list_items(
         self,
         items: list[IcaShoppingListEntry],
         conflict_mode: ConflictMode = ConflictMode.APPEND,
+        instant_submit: bool = True,
     ) -> IcaShoppingList:
         """A non HA-native function that batches together mutiple item creations"""
         sync = IcaShoppingListSync(
@@ -405,9 +425,37 @@ class IcaShoppingListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
             f"{datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat()}Z",
         )
         return await self.coordinator.sync_shopping_list(
-            sync, conflict_mode=conflict_mode
+            sync, conflict_mode=conflict_mode, instant_submit=instant_submit
         )
 
+    def _parse_row_input(self, row_input: str) -> IcaShoppingListEntry:
+        """Parses a row given as either a JSON object or a summary string."""
+        if row_input.lstrip().startswith("{"):
+            try:
+                row = json.loads(row_input, strict=False)
+                _LOGGER.warning("Parsing row as json: %s", row)
+                return row
+            except ValueError as e:
+                _LOGGER.debug(
+                    "Error parsing row as json: %s. Error: %s. "
+                    "Proceeding with parsing as string.",
+                    row_input,
+                    e,
+                )
+
+        # Not JSON
+        row: IcaShoppingListEntry = self.coordinator.parse_summary(row_input)
+        if (q := row.get("quantity")) and isinstance(q, str):
+            row["quantity"] = float(q)
+        if not row.get("unit"):
+            # Do like ICA, and assume "st" as default unit?
+            # TODO: Verify this is what we want..
+            row["unit"] = "st"
+        _LOGGER.warning("Parsing row as str: %s", row)
+        if "summary" in row:
+            del row["summary"]
+        return row
+
     async def async_generate_sync_request(
         self, rows: list[str], conflict_mode: ConflictMode
     ) -> IcaShoppingListSync:
@@ -416,10 +464,10 @@ class IcaShoppingListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
         if not persisted_list:
             raise ValueError("Could not find shopping_list")
 
-        persisted_rows = persisted_list.get("rows") or []
-        persisted_rows = sorted(
-            persisted_rows, key=lambda r: r.get("latestChange", ""), reverse=True
-        )  # Sort by 'latestChange' to find the most recent match in case of multiple matches
+        # Parse all rows up front, and index the persisted rows once for matching
+        parsed_rows = [self._parse_row_input(row_input) for row_input in rows]
+        matcher = ShoppingListRowMatcher(persisted_list.get("rows"))
+
         sync = IcaShoppingListSync(
             offlineId=self._project_id,
             changedShoppingListProperties={},
@@ -428,26 +476,7 @@ class IcaShoppingListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
             f"{datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat()}Z"
         )
 
-        for row_input in rows:
-            row: IcaShoppingListEntry = {}
-            try:
-                row = json.loads(row_input, strict=False)
-                _LOGGER.warning("Parsing row as json: %s", row)
-            except ValueError as e:
-                _LOGGER.debug("Error parsing row as json: %s. Error: %s. Proceeding with parsing as string.", row_input, e)
-                # Not JSON
-                ti = self.coordinator.parse_summary(row_input)
-                if (q := ti.get("quantity")) and isinstance(q, str):
-                    ti["quantity"] = float(q)
-                if not ti.get("unit"):
-                    # Do like ICA, and assume "st" as default unit?
-                    # TODO: Verify this is what we want..
-                    ti["unit"] = "st"
-                row.update(ti)
-                _LOGGER.warning("Parsing row as str: %s", row)
-                if "summary" in row:
-                    del row["summary"]
-
+        for row in parsed_rows:
             persisted_row: IcaShoppingListEntry | None = None
             if conflict_mode == ConflictMode.APPEND:
                 persisted_row = None
@@ -457,36 +486,12 @@ class IcaShoppingListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
             else:
                 # In other modes, we try to find a matching existing rows if applicable
                 # Matching is done based on 'offlineId', if present, otherwise 'productName'
-
-                # Fetch by 'offlineId' if available
-                if offline_id := row.get("offlineId"):
-                    persisted_row = next(
-                        (
-                            r
-                            for r in persisted_rows
-                            if r.get("offlineId", "").casefold()
-                            == offline_id.casefold()
-                        ),
-                        None,
-                    )
-                    if persisted_row:
-                        _LOGGER.info("Merging based on offlineId match: %s", offline_id)
-
-                if not persisted_row and (product_name := row.get("productName")):
-                    # If no match by 'offlineId', try matching by 'productName'
-                    # Handles pluralization in both English and Swedish
-                    persisted_row = next(
-                        (
-                            r
-                            for r in persisted_rows
-                            if product_names_match(r.get("productName"), product_name)
-                        ),
-                        None,
+                # Handles pluralization in both English and Swedish
+                persisted_row, matched_by = matcher.match(row)
+                if persisted_row:
+                    _LOGGER.info(
+                        "Merging based on %s match: %s", matched_by, persisted_row
                     )
-                    if persisted_row:
-                        _LOGGER.info(
-                            "Merging based on productName match: %s", persisted_row
-                        )
 
                 if persisted_row and conflict_mode == ConflictMode.MERGE:
                     row = merge_shopping_list_entries(base=persisted_row, other=row)
@@ -554,7 +559,7 @@ class IcaShoppingListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
         sync["latestChange"] = (
             f"{datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat()}Z",
         )
-        await self.coordinator.sync_shopping_list(sync)
+        await self.coordinator.sync_shopping_list(sync, instant_submit=False)
 
     async def async_delete_todo_items(self, uids: list[str]) -> None:
         """Delete a To-do item."""
@@ -562,7 +567,7 @@ class IcaShoppingListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
             offlineId=self._project_id,
             deletedRows=uids,
         )
-        await self.coordinator.sync_shopping_list(sync)
+        await self.coordinator.sync_shopping_list(sync, instant_submit=False)
 
     async def async_added_to_hass(self) -> None:
         """When entity is added to hass update state from existing coordinator data."""
@@ -596,6 +601,7 @@ class IcaBaseItemListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
         self._attr_name = "ICA Favorite Articles"
         self._attr_icon = "mdi:cart"
         self._attr_todo_items: list[TodoItem] | None = None
+        self._change_token: tuple | None = None
 
     @property
     def name(self):
@@ -604,6 +610,13 @@ class IcaBaseItemListEntity(CoordinatorEntity[IcaCoordinator], TodoListEntity):
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
+        change_token = (
+            self.coordinator.last_update_success,
+            self.coordinator.get_change_token(IcaDataset.BASEITEMS),
+        )
+        if change_token == self._change_token:
+            return
+        self._change_token = change_token
         items = [
             TodoItem(
                 summary=baseitem["text"],
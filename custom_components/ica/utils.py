@@ -1,5 +1,9 @@
+import hashlib
+import heapq
 import logging
 import json
+from datetime import datetime
+from collections.abc import Container, Iterator
 from typing import Any, TypeVar
 
 _DataT = TypeVar("_DataT", default=dict[Any, Any])
@@ -23,46 +27,374 @@ def to_dict(list_source, key: str = "id"):
     return {value[key]: value for value in list_source} if list_source else {}
 
 
-def get_diffs(a, b, key: str = "id", include_values: bool = True):
+# Ordering policy for list-valued properties that ICA sends in varying order.
+# Lists are sorted by the given item property (keyed lists), or by the items
+# themselves when None (set semantics).
+CANONICAL_LIST_ORDER: dict[str, str | None] = {
+    "eans": "id",
+    "stores": "id",
+    "StoreIds": None,
+}
+
+
+def _canonical_sort_key(item: Any) -> str:
+    return json.dumps(item, sort_keys=True, default=str, ensure_ascii=False)
+
+
+def canonicalize_lists(
+    obj: _DataT, policy: dict[str, str | None] | None = None
+) -> _DataT:
+    """Return *obj* with its list-valued properties in a canonical order.
+
+    Intended to run once when data is ingested, so that reordered but otherwise
+    equal data compares equal in diffs.  *obj* is returned as is when already
+    canonical, otherwise a shallow copy with the sorted lists is returned.
+    """
+    if not obj:
+        return obj
+    policy = CANONICAL_LIST_ORDER if policy is None else policy
+    result = obj
+    for prop, item_key in policy.items():
+        items = obj.get(prop)
+        if not isinstance(items, list) or len(items) < 2:
+            continue
+        if item_key is None:
+            ordered = sorted(items, key=_canonical_sort_key)
+        else:
+            ordered = sorted(
+                items,
+                key=lambda x, k=item_key: (
+                    str(x.get(k)) if isinstance(x, dict) else "",
+                    _canonical_sort_key(x),
+                ),
+            )
+        if ordered != items:
+            if result is obj:
+                result = obj.copy()
+            result[prop] = ordered
+    return result
+
+
+def fingerprint(value: Any) -> str:
+    """Return a stable content hash of a JSON-serializable value."""
+    content = json.dumps(value, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+class RowFingerprints:
+    """Content hashes of rows, kept (and persisted) next to the cached data they
+    describe.
+
+    A row is only hashed once, as it is ingested into the cached data. The rows
+    whose hash changed are the only ones that diffing has to compare.
+    """
+
+    def __init__(self, hashes: dict[str, str] | None = None) -> None:
+        self.hashes: dict[str, str] = dict(hashes or {})
+
+    def ingest(self, row_id: Any, row: Any) -> bool:
+        """Hash *row*, as it is ingested. Returns whether its content changed."""
+        value = fingerprint(row)
+        if self.hashes.get(row_id) == value:
+            return False
+        self.hashes[row_id] = value
+        return True
+
+    def __contains__(self, row_id: Any) -> bool:
+        return row_id in self.hashes
+
+    def retain(self, row_ids) -> None:
+        """Forget the hashes of rows that are not in *row_ids*."""
+        for row_id in [k for k in self.hashes if k not in row_ids]:
+            del self.hashes[row_id]
+
+
+class ChangeTokens:
+    """Versions of keyed values, that only change when their content changes.
+
+    Consumers remember the token they last rendered, and can skip their work
+    while it is unchanged, even if the value was replaced by an equal copy.
+    """
+
+    def __init__(self) -> None:
+        self._hashes: dict[str, str] = {}
+        self._tokens: dict[str, int] = {}
+        self._version = 0
+
+    def update(self, key: str, value: Any) -> bool:
+        """Set the content of *key*, ``None`` removes it. Returns whether it changed."""
+        if value is None:
+            if key not in self._hashes:
+                return False
+            del self._hashes[key]
+            del self._tokens[key]
+            return True
+        value_hash = fingerprint(value)
+        if self._hashes.get(key) == value_hash:
+            return False
+        self._version += 1
+        self._hashes[key] = value_hash
+        self._tokens[key] = self._version
+        return True
+
+    def get(self, key: str) -> int:
+        """Return the token of *key*, or 0 if it has no content."""
+        return self._tokens.get(key, 0)
+
+
+def _json_pointer_token(value: Any) -> str:
+    """Escape a value for use as a JSON Pointer (RFC 6901) reference token."""
+    return str(value).replace("~", "~0").replace("/", "~1")
+
+
+def iter_diffs(
+    a,
+    b,
+    key: str = "id",
+    include_values: bool = True,
+    candidates: Container | None = None,
+    json_patch: bool = False,
+) -> Iterator[dict]:
+    """Lazily yield the added, removed and changed rows between *a* and *b*.
+
+    Operations are yielded in the same order and form as ``get_diffs``, one at a
+    time, so that large diffs can be streamed, truncated or paged.  With
+    *json_patch*, RFC 6902 operations are yielded instead: ``add``/``remove`` per
+    row, and ``add``/``replace``/``remove`` per changed property.  Patch operations
+    always carry their values.  Only the patch removes the properties that are
+    missing from the new row; otherwise only the properties of the new row are
+    compared, so a property that is None in the old row and missing from the new
+    row is not a change.
+
+    With *candidates*, only the rows in it are compared, out of the rows in both
+    *a* and *b*, such as the rows whose ``RowFingerprints`` hash changed on ingest.
+    """
     if isinstance(a, list):
         a = to_dict(a, key)
     if isinstance(b, list):
         b = to_dict(b, key)
 
-    added = b.keys() - a.keys()
-    removed = a.keys() - b.keys()
-    diffs = [{"op": "+", key: row_id, "new": b[row_id]} for row_id in added]
-    diffs.extend([{"op": "-", key: row_id, "old": a[row_id]} for row_id in removed])
-
-    a_set = set(a)
-    # aa = {k: v for k,v in a.items()}
-    # aa_set = set(a.keys())
-    b_set = set(b)
-    # bb = {x[key]: x for x in b}
-    # bb = b.keys()
-    # bb_set = set(bb)
-    remaining = a_set.intersection(b_set)
-    # remaining = aa_set.intersection(bb_set)
-
-    for row_id in remaining:
+    for row_id in b.keys() - a.keys():
+        if json_patch:
+            path = f"/{_json_pointer_token(row_id)}"
+            yield {"op": "add", "path": path, "value": b[row_id]}
+        else:
+            yield {"op": "+", key: row_id, "new": b[row_id]}
+    for row_id in a.keys() - b.keys():
+        if json_patch:
+            yield {"op": "remove", "path": f"/{_json_pointer_token(row_id)}"}
+        else:
+            yield {"op": "-", key: row_id, "old": a[row_id]}
+
+    for row_id in a.keys() & b.keys():
         old = a[row_id]
         new = b[row_id]
-        props = []
-        for k in new:
-            d = new.get(k, None) != old.get(k, None)
-            # todo: ignore changes in ordering when list. ICA quite oftenly change or send inconsistent sorting in the Ean-property
-            if d:
-                props.append(k)
-        if props:
-            if include_values:
-                o = {value: old.get(value, None) for value in props}
-                n = {value: new.get(value, None) for value in props}
-                diffs.append(
-                    {"op": "~", key: row_id, "changed_props": props, "old": o, "new": n}
-                )
-            else:
-                diffs.append({"op": "~", key: row_id, "changed_props": props})
-    return diffs
+        if old is new:
+            continue
+        if candidates is not None and row_id not in candidates:
+            continue
+        # Lists that ICA sends in inconsistent order (e.g. 'eans') are expected
+        # to be ordered by `canonicalize_lists` at ingest
+        props = [k for k in new if new.get(k, None) != old.get(k, None)]
+        if json_patch:
+            # A patch also removes the properties that are missing from *new*
+            props.extend(k for k in old if k not in new)
+        if not props:
+            continue
+        if json_patch:
+            row_path = f"/{_json_pointer_token(row_id)}"
+            for k in props:
+                path = f"{row_path}/{_json_pointer_token(k)}"
+                if k not in new:
+                    yield {"op": "remove", "path": path}
+                elif k not in old:
+                    yield {"op": "add", "path": path, "value": new[k]}
+                else:
+                    yield {"op": "replace", "path": path, "value": new[k]}
+        elif include_values:
+            o = {value: old.get(value, None) for value in props}
+            n = {value: new.get(value, None) for value in props}
+            yield {
+                "op": "~",
+                key: row_id,
+                "changed_props": props,
+                "old": o,
+                "new": n,
+            }
+        else:
+            yield {"op": "~", key: row_id, "changed_props": props}
+
+
+def get_diffs(
+    a,
+    b,
+    key: str = "id",
+    include_values: bool = True,
+    candidates: Container | None = None,
+):
+    """Return the added, removed and changed rows between *a* and *b*.
+
+    See ``iter_diffs`` for a lazily evaluated variant.
+    """
+    return list(iter_diffs(a, b, key, include_values, candidates))
+
+
+def compact_diffs(diffs: list[dict]) -> list[dict]:
+    """Strip the old and new values from diff operations, keeping what changed."""
+    return [
+        {k: v for k, v in diff.items() if k not in ("old", "new", "value")}
+        for diff in diffs
+    ]
+
+
+def summarize_diffs(diffs: list[dict]) -> dict[str, int]:
+    """Count the diff operations by kind."""
+    summary = {"added": 0, "removed": 0, "changed": 0}
+    kinds = {
+        "+": "added",
+        "add": "added",
+        "-": "removed",
+        "remove": "removed",
+        "~": "changed",
+        "replace": "changed",
+    }
+    for diff in diffs:
+        if kind := kinds.get(diff.get("op")):
+            summary[kind] += 1
+    return summary
+
+
+def _payload_size(value: Any) -> int:
+    return len(json.dumps(value, default=str, ensure_ascii=False).encode())
+
+
+def chunk_event_payload(event_data: dict, items_key: str, max_bytes: int) -> list[dict]:
+    """Split an event payload into numbered parts, of at most *max_bytes* each.
+
+    The items under *items_key* are distributed over the parts, while the other
+    properties are repeated in every part.  Each part is marked with ``part``
+    (1-based) and ``parts``.  A payload within the limit is returned as is, and an
+    item that is larger than the limit on its own is sent in a part of its own.
+    """
+    items = event_data.get(items_key) or []
+    if _payload_size(event_data) <= max_bytes or len(items) < 2:
+        return [event_data]
+
+    base = {k: v for k, v in event_data.items() if k != items_key}
+    # Room for the items, with margin for the part numbering
+    budget = max_bytes - _payload_size({**base, items_key: []}) - 32
+    chunks: list[list] = [[]]
+    size = 0
+    for item in items:
+        item_size = _payload_size(item) + 2  # separator
+        if chunks[-1] and size + item_size > budget:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(item)
+        size += item_size
+    return [
+        {**base, items_key: chunk, "part": i, "parts": len(chunks)}
+        for i, chunk in enumerate(chunks, start=1)
+    ]
+
+
+def _data_refs(event_data: dict) -> list[str]:
+    ref = event_data.get("data_ref")
+    if ref is None:
+        return []
+    return list(ref) if isinstance(ref, list) else [ref]
+
+
+def _merge_event_data(first: dict, other: dict) -> dict:
+    merged = {**first, **other}
+    for k, v in first.items():
+        o = other.get(k)
+        if k == "data_ref":
+            continue
+        if isinstance(v, list) and isinstance(o, list):
+            merged[k] = v + o
+        elif isinstance(v, dict) and isinstance(o, dict) and k == "summary":
+            merged[k] = {n: v.get(n, 0) + o.get(n, 0) for n in {*v, *o}}
+        elif k == "pre_count":
+            merged[k] = v
+    if refs := _data_refs(first) + _data_refs(other):
+        # The data of every merged event stays reachable
+        merged["data_ref"] = list(dict.fromkeys(refs))
+    return merged
+
+
+def coalesce_events(
+    events: list[tuple[str, dict]], max_bytes: int | None = None
+) -> list[tuple[str, dict]]:
+    """Merge events of the same type, about the same account and shopping list.
+
+    Only events carrying list-valued properties (e.g. 'diffs' or 'new_offers') are
+    merged, by concatenating those lists.  Events that are parts of a larger
+    payload, or identified by an 'event_id', are never merged, nor are events that
+    would exceed *max_bytes* when merged.  The position of the first event is kept.
+    A merged event references the stored data of all its events, as a list of
+    'data_ref'.
+    """
+    result: list[tuple[str, dict]] = []
+    positions: dict[tuple, int] = {}
+    for event_type, event_data in events:
+        mergeable = (
+            "part" not in event_data
+            and "event_id" not in event_data
+            and any(isinstance(v, list) for v in event_data.values())
+        )
+        if not mergeable:
+            result.append((event_type, event_data))
+            continue
+        key = (
+            event_type,
+            event_data.get("type"),
+            event_data.get("uid"),
+            event_data.get("shopping_list_id"),
+        )
+        if (position := positions.get(key)) is not None:
+            merged = _merge_event_data(result[position][1], event_data)
+            if max_bytes is None or _payload_size(merged) <= max_bytes:
+                result[position] = (event_type, merged)
+                continue
+        positions[key] = len(result)
+        result.append((event_type, event_data))
+    return result
+
+
+def parse_event_journal(
+    lines: list[str], keep_fired: int | None = None
+) -> tuple[list[dict], list[str]]:
+    """Read an append-only journal of events.
+
+    The journal holds event records, with a dedup ``key``, and ``{"fired": key}``
+    records.  Returns the events not yet fired, in the order they were appended,
+    and the keys of the fired events (the last *keep_fired* of them, if given).
+    An event is only returned once per key, and never after it has been fired.
+    Malformed lines, e.g. from an interrupted write, are skipped.
+    """
+    pending: dict[str, dict] = {}
+    fired: dict[str, None] = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(record, dict):
+            continue
+        if (key := record.get("fired")) is not None:
+            pending.pop(key, None)
+            fired.pop(key, None)
+            fired[key] = None
+        elif (key := record.get("key")) is not None:
+            if key not in pending and key not in fired:
+                pending[key] = record
+    fired_keys = list(fired)
+    if keep_fired is not None:
+        fired_keys = fired_keys[-keep_fired:] if keep_fired else []
+    return list(pending.values()), fired_keys
 
 
 def get_diff_obj(old: dict, new: dict, key: str = "id", include_values: bool = True):
@@ -79,7 +411,8 @@ def get_diff_obj(old: dict, new: dict, key: str = "id", include_values: bool = T
     props = []
     for k in [*old, *new]:
         d = new.get(k, None) != old.get(k, None)
-        # todo: ignore changes in ordering when list. ICA quite oftenly change or send inconsistent sorting in the Ean-property
+        # Lists that ICA sends in inconsistent order (e.g. 'eans') are expected to
+        # be ordered by `canonicalize_lists` at ingest
         if d and k not in props:
             props.append(k)
 
@@ -486,6 +819,318 @@ def merge_shopping_list_entries(base: dict, other: dict) -> dict:
     return result
 
 
+# ---------------------------------------------------------------------------
+# Combining IcaShoppingListSync requests
+# ---------------------------------------------------------------------------
+
+
+def merge_shopping_list_syncs(syncs: list[dict]) -> dict | None:
+    """Merge ``IcaShoppingListSync`` requests for the same list into one request.
+
+    The requests are applied in order, matching rows on ``offlineId``:
+
+    * changing a row created earlier in the batch is folded into the created row
+    * multiple changes of the same row are combined, later values win
+    * deleting a row created earlier in the batch cancels out both operations
+    * deleting a row drops any earlier changes of it
+
+    Returns ``None`` when there is nothing to merge.  No input is mutated.
+    """
+    if not syncs:
+        return None
+    list_id = syncs[0].get("offlineId")
+    created: dict[Any, dict] = {}
+    changed: dict[Any, dict] = {}
+    deleted: list[str] = []
+    properties: dict = {}
+
+    for sync in syncs:
+        if sync.get("offlineId") != list_id:
+            raise ValueError(
+                "Cannot merge syncs of different lists: "
+                f"{list_id} / {sync.get('offlineId')}"
+            )
+        properties.update(sync.get("changedShoppingListProperties") or {})
+
+        for row in sync.get("createdRows") or []:
+            created[row.get("offlineId") or id(row)] = dict(row)
+
+        for row in sync.get("changedRows") or []:
+            row_id = row.get("offlineId") or id(row)
+            if row_id in created:
+                created[row_id] = {**created[row_id], **row}
+            else:
+                changed[row_id] = {**changed.get(row_id, {}), **row}
+
+        for row_id in sync.get("deletedRows") or []:
+            if row_id in created:
+                del created[row_id]
+                continue
+            changed.pop(row_id, None)
+            if row_id not in deleted:
+                deleted.append(row_id)
+
+    result = {"offlineId": list_id}
+    if properties:
+        result["changedShoppingListProperties"] = properties
+    if created:
+        result["createdRows"] = list(created.values())
+    if changed:
+        result["changedRows"] = list(changed.values())
+    if deleted:
+        result["deletedRows"] = deleted
+    return result
+
+
+def apply_shopping_list_sync(shopping_list: dict, sync: dict) -> dict:
+    """Apply the rows of a ``IcaShoppingListSync`` to a ``IcaShoppingList`` locally.
+
+    Deleted rows are removed, changed rows are updated and created rows are
+    appended, like ICA does when the sync is submitted.  Changes to rows that
+    don't exist are ignored, and a created row that already exists (the sync has
+    been applied before) replaces it, so applying a sync twice is harmless.
+    Returns a new dict, no input is mutated.
+    """
+    deleted = set(sync.get("deletedRows") or [])
+    changed = {row.get("offlineId"): row for row in sync.get("changedRows") or []}
+    created = {
+        row.get("offlineId"): row
+        for row in sync.get("createdRows") or []
+        if row.get("offlineId")
+    }
+
+    rows = []
+    for row in shopping_list.get("rows") or []:
+        row_id = row.get("offlineId")
+        if row_id in deleted:
+            continue
+        if row_id in created:
+            row = {**row, **created.pop(row_id)}
+        if row_id in changed:
+            row = {**row, **changed[row_id]}
+        rows.append(row)
+    rows.extend(
+        dict(row)
+        for row in sync.get("createdRows") or []
+        if not row.get("offlineId") or row.get("offlineId") in created
+    )
+    return {**shopping_list, "rows": rows}
+
+
+# ---------------------------------------------------------------------------
+# Indexes for cached data
+# ---------------------------------------------------------------------------
+
+
+class ShoppingListIndex:
+    """Constant time lookups of shopping lists and their rows.
+
+    Rows are indexed per list by ``offerId``; rows are resolved by
+    ``ShoppingListRowMatcher`` instead.  The index is updated incrementally: only
+    lists that have been replaced since the last update are re-indexed.
+    """
+
+    def __init__(self) -> None:
+        self._lists: dict[str, dict] = {}
+        self._positions: dict[str, int] = {}
+        self._rows_by_offer: dict[str, dict[str, list[dict]]] = {}
+
+    def update(self, shopping_lists: list[dict] | None) -> list[str]:
+        """Update the index to match *shopping_lists*.
+
+        Returns the ids of the lists that were (re-)indexed or removed.
+        """
+        changed = []
+        seen = set()
+        for position, shopping_list in enumerate(shopping_lists or []):
+            list_id = shopping_list.get("offlineId")
+            seen.add(list_id)
+            self._positions[list_id] = position
+            if self._lists.get(list_id) is shopping_list:
+                continue
+            self._index_list(list_id, shopping_list)
+            changed.append(list_id)
+        for list_id in [k for k in self._lists if k not in seen]:
+            for index in (self._lists, self._positions, self._rows_by_offer):
+                index.pop(list_id, None)
+            changed.append(list_id)
+        return changed
+
+    def _index_list(self, list_id: str, shopping_list: dict) -> None:
+        by_offer: dict[str, list[dict]] = {}
+        for row in shopping_list.get("rows") or []:
+            if offer_id := row.get("offerId"):
+                by_offer.setdefault(offer_id, []).append(row)
+        self._lists[list_id] = shopping_list
+        self._rows_by_offer[list_id] = by_offer
+
+    def get_list(self, list_id: str) -> dict | None:
+        """Return the shopping list with the given ``offlineId``."""
+        return self._lists.get(list_id)
+
+    def position_of(self, list_id: str) -> int:
+        """Return the position of the list in the indexed sequence, or -1."""
+        return self._positions.get(list_id, -1) if list_id in self._lists else -1
+
+    def get_rows_by_offer(self, list_id: str, offer_id: str | None) -> list[dict]:
+        """Return the rows referencing the given ``offerId``."""
+        return self._rows_by_offer.get(list_id, {}).get(offer_id, [])
+
+
+class ShoppingListRowMatcher:
+    """Resolves incoming rows against the persisted rows of a shopping list.
+
+    A row matches a persisted row by ``offlineId`` (case-insensitive) if present,
+    otherwise by ``productName`` using ``product_names_match`` semantics.  When
+    several persisted rows match, the most recently changed one wins.  The
+    persisted rows are indexed once, so matching a batch of n rows against m
+    persisted rows is O(n + m) instead of O(n·m).
+    """
+
+    def __init__(self, persisted_rows: list[dict] | None) -> None:
+        self._by_offline_id: dict[str, dict] = {}
+        self._by_name: dict[str, dict] = {}
+        rows = sorted(
+            persisted_rows or [],
+            key=lambda r: r.get("latestChange") or "",
+            reverse=True,
+        )
+        for row in rows:
+            if offline_id := row.get("offlineId"):
+                self._by_offline_id.setdefault(offline_id.casefold(), row)
+            self._by_name.setdefault(
+                normalize_product_name(row.get("productName")), row
+            )
+
+    def match(self, row: dict) -> tuple[dict | None, str | None]:
+        """Return the persisted row matching *row*, and what it was matched by."""
+        if (offline_id := row.get("offlineId")) and (
+            persisted_row := self._by_offline_id.get(offline_id.casefold())
+        ):
+            return persisted_row, "offlineId"
+        if (product_name := row.get("productName")) and (
+            persisted_row := self._by_name.get(normalize_product_name(product_name))
+        ):
+            return persisted_row, "productName"
+        return None, None
+
+
+class ArticleIndex:
+    """Constant time lookups of article groups by product name.
+
+    Articles are indexed by their casefolded ``name`` and ``pluralName``, and by
+    the ``normalize_product_name`` form of both, so that plural forms of a
+    product name resolve to the same article.
+    """
+
+    def __init__(self) -> None:
+        self._by_name: dict[str, dict] = {}
+        self._by_normalized_name: dict[str, dict] = {}
+
+    def update(self, articles: list[dict] | None) -> None:
+        """Rebuild the index from *articles*."""
+        by_name: dict[str, dict] = {}
+        by_normalized_name: dict[str, dict] = {}
+        articles = articles or []
+        # Every exact name is indexed before the plural forms, so that the plural
+        # of one article never shadows the name of another
+        for key in ("name", "pluralName"):
+            for article in articles:
+                if name := article.get(key):
+                    # The first article wins, same as a linear scan would
+                    by_name.setdefault(name.casefold(), article)
+                    by_normalized_name.setdefault(normalize_product_name(name), article)
+        self._by_name = by_name
+        self._by_normalized_name = by_normalized_name
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def get_article(self, product_name: str | None) -> dict | None:
+        """Return the article matching *product_name*, or None."""
+        if not product_name:
+            return None
+        if article := self._by_name.get(product_name.casefold()):
+            return article
+        return self._by_normalized_name.get(normalize_product_name(product_name))
+
+
+# ---------------------------------------------------------------------------
+# Incremental offer ingestion
+# ---------------------------------------------------------------------------
+
+
+def get_changed_offer_ids(
+    store_offers: dict[str, dict],
+    known_offers: dict[str, dict],
+    previous_store_offers: dict[str, dict] | None = None,
+) -> list[str]:
+    """Return the ids of the store offers that are new or have changed.
+
+    An offer has changed if its store offer differs from the one seen in the
+    previous refresh.  Without a previous store offer (e.g. after a restart) the
+    store offer is instead compared to the fields of the known offer details.
+    """
+    previous_store_offers = previous_store_offers or {}
+    changed = []
+    for offer_id, store_offer in store_offers.items():
+        known = known_offers.get(offer_id)
+        if not known:
+            changed.append(offer_id)
+        elif (previous := previous_store_offers.get(offer_id)) is not None:
+            if previous != store_offer:
+                changed.append(offer_id)
+        elif any(known.get(k) != v for k, v in store_offer.items()):
+            changed.append(offer_id)
+    return sorted(changed)
+
+
+class ExpiryIndex:
+    """Keys ordered by when they are due, so that expired keys can be popped
+    without visiting the ones that are not.
+
+    Backed by a heap; replaced or discarded keys are left in the heap and skipped
+    when popped, and the heap is compacted once mostly made up of such entries.
+    """
+
+    def __init__(self) -> None:
+        self._heap: list[tuple[datetime, str]] = []
+        self._due: dict[str, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._due
+
+    def set(self, key: str, due: datetime | None) -> None:
+        """Set when *key* is due. A due of None removes the key."""
+        if due is None:
+            self.discard(key)
+            return
+        if self._due.get(key) == due:
+            return
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, key))
+        if len(self._heap) > 2 * len(self._due) + 32:
+            self._heap = [(d, k) for k, d in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, key: str) -> None:
+        """Remove *key* from the index, if present."""
+        self._due.pop(key, None)
+
+    def pop_expired(self, now: datetime) -> list[str]:
+        """Remove and return the keys that are due before *now*."""
+        expired = []
+        while self._heap and self._heap[0][0] < now:
+            due, key = heapq.heappop(self._heap)
+            if self._due.get(key) == due:
+                del self._due[key]
+                expired.append(key)
+        return expired
+
+
 if __name__ == "__main__":
     print("Testing `get_diffs(old, new)`")
     # o = [{"id": 1, "name": "OLD"}, {"id": 3, "name": "gone!"}]
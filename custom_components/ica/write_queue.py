@@ -0,0 +1,79 @@
+"""Batching of shopping list mutations."""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.event import async_call_later
+
+from .icatypes import IcaShoppingList, IcaShoppingListSync
+from .utils import merge_shopping_list_syncs
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class ShoppingListWriteQueue:
+    """Coalesces mutations of a shopping list, within a time window, into one sync.
+
+    Every caller gets a future that is resolved (or failed) when the batch it was
+    part of has been committed to ICA."""
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        submit: Callable[[IcaShoppingListSync], Awaitable[IcaShoppingList]],
+        window_seconds: float,
+    ) -> None:
+        self._hass = hass
+        self._submit = submit
+        self._window_seconds = window_seconds
+        self._pending: list[tuple[IcaShoppingListSync, asyncio.Future]] = []
+        self._flush_remover: Callable[[], None] | None = None
+        self._lock = asyncio.Lock()
+
+    async def async_enqueue(self, sync: IcaShoppingListSync) -> IcaShoppingList:
+        """Queues a sync and waits for the batch containing it to be committed."""
+        future: asyncio.Future[IcaShoppingList] = self._hass.loop.create_future()
+        self._pending.append((sync, future))
+        if self._window_seconds <= 0:
+            await self.async_flush()
+        elif not self._flush_remover:
+            self._flush_remover = async_call_later(
+                self._hass, self._window_seconds, self._async_scheduled_flush
+            )
+        return await future
+
+    async def _async_scheduled_flush(self, _) -> None:
+        self._flush_remover = None
+        await self.async_flush()
+
+    async def async_flush(self) -> None:
+        """Submits everything queued so far, as a single sync."""
+        if self._flush_remover:
+            # Flushed before the window has passed
+            self._flush_remover()
+            self._flush_remover = None
+        async with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            futures = [future for (_, future) in pending]
+            try:
+                sync = merge_shopping_list_syncs([sync for (sync, _) in pending])
+                _LOGGER.debug(
+                    "Submitting %s queued syncs as one: %s", len(pending), sync
+                )
+                result = await self._submit(sync)
+            except Exception as err:  # noqa: BLE001 - forwarded to the callers
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(err)
+            else:
+                for future in futures:
+                    if not future.done():
+                        future.set_result(result)
+
+    async def async_shutdown(self) -> None:
+        """Submits any remaining mutations."""
+        await self.async_flush()
@@ -0,0 +1,12 @@
+"""Shared fixtures for the tests that run with Home Assistant."""
+
+import pytest
+
+
+@pytest.fixture
+def storage_dir(hass, tmp_path):
+    """Points the Home Assistant config to a temporary directory, for the files
+    persisted in `.storage`."""
+    hass.config.config_dir = str(tmp_path)
+    (tmp_path / ".storage").mkdir()
+    return tmp_path / ".storage"
@@ -0,0 +1,384 @@
+"""Tests for the event queue and background jobs of the BackgroundWorker."""
+
+import asyncio
+import datetime as dt
+import threading
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.config_entries import ConfigEntryState
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_capture_events,
+    async_fire_time_changed,
+)
+
+from custom_components.ica.background_worker import (
+    BackgroundWorker,
+    Priority,
+)
+from custom_components.ica.const import (
+    BACKGROUND_JOBS_IDLE_RETRY_SECONDS,
+    DOMAIN,
+    EventQueuePolicy,
+)
+from custom_components.ica.event_outbox import EventOutbox
+
+EVENT = f"{DOMAIN}_event"
+
+
+def _config_entry(hass, state=ConfigEntryState.LOADED) -> MockConfigEntry:
+    entry = MockConfigEntry(domain=DOMAIN, data={})
+    entry.add_to_hass(hass)
+    entry.mock_state(hass, state)
+    return entry
+
+
+def _event(list_id: str, *row_ids: str, **kwargs) -> dict:
+    return {
+        "type": "shopping_list_updated",
+        "uid": "u",
+        "shopping_list_id": list_id,
+        "diffs": [{"op": "+", "id": row_id} for row_id in row_ids],
+        **kwargs,
+    }
+
+
+async def _fire_time_changed(hass, seconds: float) -> None:
+    async_fire_time_changed(hass, dt_util.utcnow() + dt.timedelta(seconds=seconds))
+    await hass.async_block_till_done()
+
+
+# ---------------------------------------------------------------------------
+# Events
+# ---------------------------------------------------------------------------
+
+
+class TestEvents:
+    async def test_high_priority_is_fired_immediately(self, hass):
+        events = async_capture_events(hass, EVENT)
+        worker = BackgroundWorker(hass, _config_entry(hass))
+
+        await worker.fire_or_queue_event(EVENT, _event("a", "1"), Priority.HIGH)
+        await hass.async_block_till_done()
+        assert len(events) == 1
+        await worker.shutdown()
+
+    async def test_batch_is_coalesced(self, hass):
+        events = async_capture_events(hass, EVENT)
+        worker = BackgroundWorker(hass, _config_entry(hass), batch_window=1)
+
+        await worker.fire_or_queue_event(EVENT, _event("a", "1"))
+        await worker.fire_or_queue_event(EVENT, _event("a", "2"))
+        await hass.async_block_till_done()
+        assert events == []
+
+        await _fire_time_changed(hass, 2)
+        assert [event.data["diffs"] for event in events] == [
+            [{"op": "+", "id": "1"}, {"op": "+", "id": "2"}]
+        ]
+        assert worker.metrics()["coalesced"] == 1
+        await worker.shutdown()
+
+    async def test_queued_until_loaded(self, hass):
+        events = async_capture_events(hass, EVENT)
+        entry = _config_entry(hass, ConfigEntryState.SETUP_IN_PROGRESS)
+        worker = BackgroundWorker(hass, entry, send_interval=60)
+
+        await worker.fire_or_queue_event(EVENT, _event("a", "1"), Priority.HIGH)
+        await _fire_time_changed(hass, 2)
+        assert events == []
+
+        entry.mock_state(hass, ConfigEntryState.LOADED)
+        await _fire_time_changed(hass, 61)
+        assert len(events) == 1
+        await worker.shutdown()
+
+    async def test_queue_is_sent_on_shutdown(self, hass):
+        events = async_capture_events(hass, EVENT)
+        worker = BackgroundWorker(hass, _config_entry(hass))
+
+        await worker.queue_event(EVENT, _event("a", "1"))
+        await worker.shutdown()
+        await hass.async_block_till_done()
+        assert len(events) == 1
+
+
+# ---------------------------------------------------------------------------
+# Bounded event queue
+# ---------------------------------------------------------------------------
+
+
+class TestEventQueuePolicy:
+    async def test_drop_oldest_of_lowest_priority(self, hass):
+        worker = BackgroundWorker(
+            hass,
+            _config_entry(hass),
+            max_queue_size=2,
+            queue_policy=EventQueuePolicy.DROP_OLDEST,
+        )
+        await worker.queue_event(EVENT, _event("a", "1"), Priority.LOW)
+        await worker.queue_event(EVENT, _event("b", "2"), Priority.NORMAL)
+        await worker.queue_event(EVENT, _event("c", "3"), Priority.NORMAL)
+
+        assert sorted(d["shopping_list_id"] for *_, d in worker._queue) == ["b", "c"]
+        assert worker.metrics()["dropped"] == 1
+        await worker.shutdown()
+
+    async def test_drop_new_event_of_lower_priority(self, hass):
+        worker = BackgroundWorker(
+            hass,
+            _config_entry(hass),
+            max_queue_size=1,
+            queue_policy=EventQueuePolicy.DROP_OLDEST,
+        )
+        await worker.queue_event(EVENT, _event("a", "1"), Priority.NORMAL)
+        await worker.queue_event(EVENT, _event("b", "2"), Priority.LOW)
+
+        assert [d["shopping_list_id"] for *_, d in worker._queue] == ["a"]
+        await worker.shutdown()
+
+    async def test_drop_superseded_duplicate(self, hass):
+        worker = BackgroundWorker(
+            hass,
+            _config_entry(hass),
+            max_queue_size=2,
+            queue_policy=EventQueuePolicy.DROP_DUPLICATES,
+        )
+        await worker.queue_event(EVENT, _event("a", "1"))
+        await worker.queue_event(EVENT, _event("b", "2"))
+        await worker.queue_event(EVENT, _event("a", "3"))
+
+        assert sorted(d["diffs"][0]["id"] for *_, d in worker._queue) == ["2", "3"]
+        await worker.shutdown()
+
+    async def test_parts_of_an_event_are_not_duplicates(self, hass):
+        worker = BackgroundWorker(
+            hass,
+            _config_entry(hass),
+            max_queue_size=3,
+            queue_policy=EventQueuePolicy.DROP_DUPLICATES,
+        )
+        await worker.queue_event(EVENT, _event("a", "1", part=1, parts=2))
+        await worker.queue_event(EVENT, _event("a", "2", part=2, parts=2))
+        await worker.queue_event(EVENT, _event("b", "3"))
+        await worker.queue_event(EVENT, _event("b", "4"))
+
+        assert sorted(d["diffs"][0]["id"] for *_, d in worker._queue) == ["1", "2", "4"]
+        await worker.shutdown()
+
+    @pytest.mark.parametrize(
+        "policy", [EventQueuePolicy.DROP_OLDEST, EventQueuePolicy.DROP_DUPLICATES]
+    )
+    async def test_durable_events_are_never_dropped(self, hass, storage_dir, policy):
+        events = async_capture_events(hass, EVENT)
+        outbox = EventOutbox(hass, "test.events")
+        worker = BackgroundWorker(
+            hass,
+            _config_entry(hass),
+            max_queue_size=2,
+            queue_policy=policy,
+            outbox=outbox,
+        )
+        offers = {"type": "new_offers", "uid": "u"}
+        for key in ("k1", "k2", "k3"):
+            await worker.fire_or_queue_event(EVENT, offers, dedup_key=key)
+        await worker.queue_event(EVENT, _event("a", "1"))
+
+        assert [d["event_id"] for *_, d in sorted(worker._queue)] == ["k1", "k2", "k3"]
+        assert worker.metrics()["dropped"] == 1
+        assert all(outbox.is_known(key) for key in ("k1", "k2", "k3"))
+
+        await worker.shutdown()
+        await hass.async_block_till_done()
+        assert [event.data["event_id"] for event in events] == ["k1", "k2", "k3"]
+
+    async def test_block_waits_for_room(self, hass):
+        worker = BackgroundWorker(
+            hass,
+            _config_entry(hass),
+            max_queue_size=1,
+            queue_policy=EventQueuePolicy.BLOCK,
+        )
+        await worker.queue_event(EVENT, _event("a", "1"))
+        blocked = hass.async_create_task(worker.queue_event(EVENT, _event("b", "2")))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        assert worker.metrics()["blocked"] == 1
+
+        await _fire_time_changed(hass, 61)
+        await blocked
+        assert [d["shopping_list_id"] for *_, d in worker._queue] == ["b"]
+        assert worker.metrics()["dropped"] == 0
+        await worker.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# Durable events
+# ---------------------------------------------------------------------------
+
+
+class TestDurableEvents:
+    async def test_duplicate_is_fired_once(self, hass, storage_dir):
+        events = async_capture_events(hass, EVENT)
+        outbox = EventOutbox(hass, "test.events")
+        worker = BackgroundWorker(hass, _config_entry(hass), outbox=outbox)
+
+        for _ in range(2):
+            await worker.fire_or_queue_event(EVENT, _event("a", "1"), dedup_key="k")
+            await _fire_time_changed(hass, 2)
+        assert [event.data["event_id"] for event in events] == ["k"]
+        await worker.shutdown()
+
+    async def test_unfired_events_are_replayed(self, hass, storage_dir):
+        entry = _config_entry(hass, ConfigEntryState.SETUP_IN_PROGRESS)
+        worker = BackgroundWorker(hass, entry, outbox=EventOutbox(hass, "test.events"))
+        events = async_capture_events(hass, EVENT)
+        await worker.fire_or_queue_event(EVENT, _event("a", "1"), dedup_key="k")
+        await worker.fire_or_queue_event(EVENT, _event("b", "2"))
+        # Stopped before the integration loaded, only the other event is fired
+        await worker.shutdown()
+        assert [event.data["shopping_list_id"] for event in events] == ["b"]
+
+        events.clear()
+        worker = BackgroundWorker(
+            hass, _config_entry(hass), outbox=EventOutbox(hass, "test.events")
+        )
+        await worker.async_replay_outbox()
+        await _fire_time_changed(hass, 2)
+        assert [event.data["event_id"] for event in events] == ["k"]
+        await worker.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# Background jobs
+# ---------------------------------------------------------------------------
+
+
+class _Job:
+    def __init__(self, log: list, name: str, runs: int = 1, error=None) -> None:
+        self.log = log
+        self.name = name
+        self.runs = runs
+        self.error = error
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self) -> bool:
+        self.log.append(self.name)
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        self.runs -= 1
+        return self.runs > 0
+
+
+class TestBackgroundJobs:
+    async def test_jobs_run_in_priority_order(self, hass):
+        log = []
+        worker = BackgroundWorker(hass, _config_entry(hass), max_concurrent_jobs=1)
+        blocker = _Job(log, "blocker")
+        blocker.release.clear()
+        worker.schedule_job("blocker", blocker)
+        worker.schedule_job("low", _Job(log, "low"), Priority.LOW)
+        worker.schedule_job("high", _Job(log, "high"), Priority.HIGH)
+        await asyncio.sleep(0)
+        assert worker.job_metrics()["pending"] == 2
+
+        blocker.release.set()
+        await hass.async_block_till_done()
+        assert log == ["blocker", "high", "low"]
+        assert worker.job_metrics()["completed"] == 3
+        await worker.shutdown()
+
+    async def test_concurrency_is_bounded(self, hass):
+        log = []
+        worker = BackgroundWorker(hass, _config_entry(hass), max_concurrent_jobs=2)
+        jobs = [_Job(log, str(i)) for i in range(3)]
+        for job in jobs:
+            job.release.clear()
+            worker.schedule_job(job.name, job)
+        await asyncio.sleep(0)
+        assert worker.job_metrics()["running"] == 2
+        assert worker.job_metrics()["pending"] == 1
+
+        for job in jobs:
+            job.release.set()
+        await hass.async_block_till_done()
+        assert sorted(log) == ["0", "1", "2"]
+        await worker.shutdown()
+
+    async def test_job_is_scheduled_once_per_name(self, hass):
+        worker = BackgroundWorker(hass, _config_entry(hass))
+        job = _Job([], "job")
+        job.release.clear()
+        assert worker.schedule_job("job", job)
+        assert not worker.schedule_job("job", job)
+
+        job.release.set()
+        await hass.async_block_till_done()
+        assert worker.schedule_job("job", job)
+        await worker.shutdown()
+
+    async def test_job_runs_again_until_done(self, hass):
+        log = []
+        worker = BackgroundWorker(hass, _config_entry(hass))
+        worker.schedule_job("pages", _Job(log, "pages", runs=3))
+        await hass.async_block_till_done()
+        assert log == ["pages"] * 3
+        await worker.shutdown()
+
+    async def test_failed_job_is_counted(self, hass):
+        worker = BackgroundWorker(hass, _config_entry(hass))
+        worker.schedule_job("job", _Job([], "job", error=ValueError("boom")))
+        await hass.async_block_till_done()
+        assert worker.job_metrics()["failed"] == 1
+        await worker.shutdown()
+
+    async def test_idle_job_waits_for_running_refresh(self, hass):
+        log = []
+        refreshing = True
+        threads = set()
+
+        def is_idle() -> bool:
+            threads.add(threading.get_ident())
+            return not refreshing
+
+        worker = BackgroundWorker(hass, _config_entry(hass), is_idle=is_idle)
+        worker.schedule_job("idle", _Job(log, "idle"))
+        worker.schedule_job("urgent", _Job(log, "urgent"), idle=False)
+        await hass.async_block_till_done()
+        assert log == ["urgent"]
+        assert worker.job_metrics()["pending"] == 1
+
+        # Still refreshing when retried, deferred again
+        await _fire_time_changed(hass, BACKGROUND_JOBS_IDLE_RETRY_SECONDS + 1)
+        assert log == ["urgent"]
+
+        refreshing = False
+        await _fire_time_changed(hass, 2 * BACKGROUND_JOBS_IDLE_RETRY_SECONDS + 2)
+        assert log == ["urgent", "idle"]
+        assert worker.job_metrics()["pending"] == 0
+        # The retries are run on the event loop, not in the executor
+        assert threads == {threading.get_ident()}
+        await worker.shutdown()
+
+    async def test_shutdown_cancels_jobs(self, hass):
+        worker = BackgroundWorker(hass, _config_entry(hass), max_concurrent_jobs=1)
+        running, pending = _Job([], "running"), _Job([], "pending")
+        running.release.clear()
+        worker.schedule_job("running", running)
+        worker.schedule_job("pending", pending)
+        await asyncio.sleep(0)
+
+        await worker.shutdown()
+        metrics = worker.job_metrics()
+        assert (metrics["cancelled"], metrics["running"], metrics["pending"]) == (
+            1,
+            0,
+            0,
+        )
+        assert not worker.schedule_job("pending", pending)
@@ -0,0 +1,352 @@
+"""Tests for the cache entries, their refresh scheduling and sharing."""
+
+import asyncio
+import datetime as dt
+from itertools import pairwise
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import (
+    async_fire_time_changed,
+)
+
+from custom_components.ica.caching import (
+    CacheEntry,
+    CacheRefreshScheduler,
+    EventDataStore,
+    get_shared_cache_registry,
+)
+
+
+class _Factory:
+    """Value factory that counts its calls, and returns the next value."""
+
+    def __init__(self, *values, delay: float = 0) -> None:
+        self.values = list(values)
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        value = self.values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+# ---------------------------------------------------------------------------
+# CacheEntry
+# ---------------------------------------------------------------------------
+
+
+class TestCacheEntry:
+    async def test_value_is_cached_until_invalidated(self, hass):
+        factory = _Factory({"v": 1}, {"v": 2})
+        entry = CacheEntry(hass, "test.cached", factory, persist_to_file=False)
+
+        assert await entry.get_value() == {"v": 1}
+        assert await entry.get_value() == {"v": 1}
+        assert await entry.get_value(invalidate_cache=True) == {"v": 2}
+        assert factory.calls == 2
+        metrics = entry.metrics()
+        assert (metrics["hits"], metrics["misses"]) == (1, 2)
+        assert metrics["refresh_count"] == 2
+
+    async def test_concurrent_callers_share_one_refresh(self, hass):
+        factory = _Factory({"v": 1}, delay=0.01)
+        entry = CacheEntry(hass, "test.concurrent", factory, persist_to_file=False)
+
+        results = await asyncio.gather(*(entry.get_value() for _ in range(3)))
+        assert results == [{"v": 1}] * 3
+        assert factory.calls == 1
+
+    async def test_explicit_invalidation_is_not_skipped_while_waiting(self, hass):
+        factory = _Factory({"v": 1}, {"v": 2}, delay=0.01)
+        entry = CacheEntry(hass, "test.invalidate", factory, persist_to_file=False)
+
+        results = await asyncio.gather(
+            entry.get_value(), entry.get_value(invalidate_cache=True)
+        )
+        assert results == [{"v": 1}, {"v": 2}]
+        assert factory.calls == 2
+
+    async def test_refresh_with_other_value_factory(self, hass):
+        factory = _Factory({"v": 1})
+        entry = CacheEntry(hass, "test.other", factory, persist_to_file=False)
+
+        assert await entry.refresh(_Factory({"v": "other"})) == {"v": "other"}
+        assert entry.current_value() == {"v": "other"}
+        assert factory.calls == 0
+
+    async def test_expiry_is_jittered_within_ratio(self, hass):
+        expiries = set()
+        for _ in range(20):
+            entry = CacheEntry(
+                hass,
+                "test.jitter",
+                _Factory({}),
+                expiry_seconds=1000,
+                persist_to_file=False,
+                jitter=0.1,
+            )
+            await entry.set_value({"v": 1})
+            seconds = (entry.expires_at - dt_util.utcnow()).total_seconds()
+            assert 895 <= seconds <= 1100
+            expiries.add(round(seconds))
+        assert len(expiries) > 1
+
+    async def test_failed_refresh_is_counted_and_raised(self, hass):
+        entry = CacheEntry(
+            hass, "test.error", _Factory(ValueError("boom")), persist_to_file=False
+        )
+        with pytest.raises(ValueError, match="boom"):
+            await entry.get_value()
+        metrics = entry.metrics()
+        assert metrics["refresh_errors"] == 1
+        assert metrics["last_error"] == "boom"
+
+    async def test_value_is_persisted_and_loaded(self, hass, storage_dir):
+        entry = CacheEntry(hass, "test.persisted", _Factory({"v": 1}))
+        await entry.get_value()
+
+        factory = _Factory({"v": 2})
+        loaded = CacheEntry(hass, "test.persisted", factory)
+        assert await loaded.get_value() == {"v": 1}
+        assert factory.calls == 0
+        assert loaded.metrics()["file_loads"] == 1
+        assert not loaded.is_expired()
+        assert (storage_dir / "ica.test_persisted.json").exists()
+
+    async def test_listeners_are_notified_until_removed(self, hass):
+        entry = CacheEntry(hass, "test.listeners", _Factory(), persist_to_file=False)
+        values = []
+        remove = entry.add_listener(values.append)
+
+        await entry.set_value([1])
+        remove()
+        await entry.set_value([2])
+        assert values == [[1]]
+
+    async def test_removed_with_its_file(self, hass, storage_dir):
+        entry = CacheEntry(hass, "test.removed", _Factory())
+        await entry.set_value({"v": 1})
+        await entry.async_remove()
+        assert entry.current_value() is None
+        assert not (storage_dir / "ica.test_removed.json").exists()
+
+
+# ---------------------------------------------------------------------------
+# EventDataStore
+# ---------------------------------------------------------------------------
+
+
+async def _load_event_data(hass, key: str):
+    return await CacheEntry(hass, key, _Factory()).init_value()
+
+
+class TestEventDataStore:
+    async def test_each_event_has_its_own_data(self, hass, storage_dir):
+        store = EventDataStore(hass, "1")
+        first = await store.async_store("offers_changed--diffs", {"diffs": [1]})
+        second = await store.async_store("offers_changed--diffs", {"diffs": [2]})
+
+        assert first != second
+        assert await _load_event_data(hass, first) == {"diffs": [1]}
+        assert await _load_event_data(hass, second) == {"diffs": [2]}
+
+    async def test_only_latest_data_is_kept(self, hass, storage_dir):
+        store = EventDataStore(hass, "1", keep=2)
+        keys = [await store.async_store("diffs", {"diffs": [i]}) for i in range(3)]
+
+        assert await _load_event_data(hass, keys[0]) is None
+        assert await _load_event_data(hass, keys[2]) == {"diffs": [2]}
+
+        # Still removed in order after a restart
+        store = EventDataStore(hass, "1", keep=2)
+        await store.async_load()
+        await store.async_store("diffs", {"diffs": [3]})
+        assert await _load_event_data(hass, keys[1]) is None
+        assert await _load_event_data(hass, keys[2]) == {"diffs": [2]}
+
+
+# ---------------------------------------------------------------------------
+# SharedCacheRegistry
+# ---------------------------------------------------------------------------
+
+
+class TestSharedCacheRegistry:
+    async def test_registry_is_shared_per_process(self, hass):
+        assert get_shared_cache_registry(hass) is get_shared_cache_registry(hass)
+
+    async def test_owners_share_one_entry(self, hass):
+        registry = get_shared_cache_registry(hass)
+        first, second = _Factory([1]), _Factory([2])
+        entry = registry.acquire("articles", "a", first, persist_to_file=False)
+        assert registry.acquire("articles", "b", second) is entry
+
+        assert await entry.get_value() == [1]
+        assert (first.calls, second.calls) == (1, 0)
+
+    async def test_entry_kept_while_referenced(self, hass):
+        registry = get_shared_cache_registry(hass)
+        entry = registry.acquire("articles", "a", _Factory([1]), persist_to_file=False)
+        registry.acquire("articles", "b", _Factory([2]))
+
+        registry.release("a")
+        assert registry.owned_keys("b") == ["articles"]
+        assert await entry.get_value() == [2]
+
+        registry.release("b")
+        assert registry.owned_keys("b") == []
+        assert registry.acquire("articles", "c", _Factory([3])) is not entry
+
+    async def test_store_offers_fetched_once_per_store(self, hass):
+        registry = get_shared_cache_registry(hass)
+        fetched = []
+
+        async def fetcher(store_id):
+            fetched.append(store_id)
+            return {"store": store_id}
+
+        offers = await registry.async_get_store_offers("a", ["1", "2"], fetcher)
+        await registry.async_get_store_offers("b", ["2"], fetcher)
+        assert offers == {"1": {"store": "1"}, "2": {"store": "2"}}
+        assert fetched == ["1", "2"]
+
+        await registry.async_get_store_offers("b", ["2"], fetcher, True)
+        assert fetched == ["1", "2", "2"]
+
+    async def test_unfollowed_stores_are_released(self, hass):
+        registry = get_shared_cache_registry(hass)
+
+        async def fetcher(store_id):
+            return {"store": store_id}
+
+        await registry.async_get_store_offers("a", ["1", "2"], fetcher)
+        await registry.async_get_store_offers("a", ["2"], fetcher)
+        assert registry.owned_keys("a") == ["store_offers.2"]
+
+    async def test_job_runs_once_per_process(self, hass):
+        registry = get_shared_cache_registry(hass)
+        scheduled, runs = [], []
+
+        def schedule(name, func):
+            scheduled.append(func)
+            return True
+
+        async def job():
+            runs.append(len(runs))
+            return len(runs) < 2
+
+        assert registry.schedule_job("lookups", "a", schedule, job)
+        assert not registry.schedule_job("lookups", "b", schedule, job)
+
+        # Held until the job reports that it's done
+        assert await scheduled[0]() is True
+        assert not registry.schedule_job("lookups", "b", schedule, job)
+        assert await scheduled[0]() is False
+        assert registry.schedule_job("lookups", "b", schedule, job)
+        assert len(scheduled) == 2
+
+    async def test_job_of_released_owner_can_be_scheduled(self, hass):
+        registry = get_shared_cache_registry(hass)
+
+        def schedule(name, func):
+            return True
+
+        async def job():
+            return False
+
+        registry.schedule_job("lookups", "a", schedule, job)
+        registry.release("a")
+        assert registry.schedule_job("lookups", "b", schedule, job)
+
+
+# ---------------------------------------------------------------------------
+# CacheRefreshScheduler
+# ---------------------------------------------------------------------------
+
+
+def _expiring_entry(hass, key: str, seconds: int) -> CacheEntry:
+    entry = CacheEntry(
+        hass, key, _Factory(), expiry_seconds=seconds, persist_to_file=False, jitter=0
+    )
+    entry._timestamp = dt_util.utcnow()
+    entry._update_expiry()
+    return entry
+
+
+class TestCacheRefreshScheduler:
+    async def test_entries_refreshed_when_due(self, hass):
+        refreshed = []
+
+        async def refresh(entry):
+            refreshed.append(entry.key)
+
+        scheduler = CacheRefreshScheduler(hass, refresh, spacing=15)
+        scheduler.add(_expiring_entry(hass, "a", 60))
+        scheduler.schedule_all()
+
+        async_fire_time_changed(hass, dt_util.utcnow() + dt.timedelta(seconds=30))
+        await hass.async_block_till_done()
+        assert refreshed == []
+
+        async_fire_time_changed(hass, dt_util.utcnow() + dt.timedelta(seconds=61))
+        await hass.async_block_till_done()
+        assert refreshed == ["a"]
+        await scheduler.async_shutdown()
+
+    async def test_refreshes_due_together_are_spread_out(self, hass):
+        scheduler = CacheRefreshScheduler(hass, spacing=15)
+        entries = [_expiring_entry(hass, key, 60) for key in ("a", "b", "c")]
+        scheduler.add(*entries)
+        scheduler.schedule_all()
+
+        due = sorted(scheduler._due.values())
+        assert [(b - a).total_seconds() for a, b in pairwise(due)] == [15, 15]
+        await scheduler.async_shutdown()
+
+    async def test_failed_refresh_is_retried(self, hass):
+        attempts = []
+
+        async def refresh(entry):
+            attempts.append(entry.key)
+            if len(attempts) == 1:
+                raise ValueError("boom")
+            await entry.set_value({"v": 1})
+
+        scheduler = CacheRefreshScheduler(hass, refresh)
+        entry = _expiring_entry(hass, "a", 10)
+        scheduler.add(entry)
+        scheduler.schedule_all()
+
+        async_fire_time_changed(hass, dt_util.utcnow() + dt.timedelta(seconds=11))
+        await hass.async_block_till_done()
+        assert attempts == ["a"]
+
+        # Retried a minute later, then scheduled by the new expiry
+        async_fire_time_changed(hass, dt_util.utcnow() + dt.timedelta(seconds=61))
+        await hass.async_block_till_done()
+        assert attempts == ["a", "a"]
+        assert scheduler._due["a"] == entry.expires_at
+        await scheduler.async_shutdown()
+
+    async def test_shutdown_cancels_refreshes(self, hass):
+        refreshed = []
+
+        async def refresh(entry):
+            refreshed.append(entry.key)
+
+        scheduler = CacheRefreshScheduler(hass, refresh)
+        scheduler.add(_expiring_entry(hass, "a", 10))
+        scheduler.schedule_all()
+        await scheduler.async_shutdown()
+
+        async_fire_time_changed(hass, dt_util.utcnow() + dt.timedelta(seconds=11))
+        await hass.async_block_till_done()
+        assert refreshed == []
+        assert scheduler._due == {}
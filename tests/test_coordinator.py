@@ -0,0 +1,421 @@
+"""Tests for the refreshes of the ICA coordinator."""
+
+import asyncio
+import datetime as dt
+import logging
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+import requests
+from homeassistant.util import dt as dt_util
+from homeassistant.config_entries import ConfigEntryState
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_capture_events,
+    async_fire_time_changed,
+)
+
+from custom_components.ica.const import (
+    CONF_DURABLE_EVENTS,
+    CONF_EVENT_PAYLOAD,
+    CONF_ICA_ID,
+    CONF_SHOPPING_LISTS,
+    DOMAIN,
+    MAX_CONCURRENT_REQUESTS,
+    EventPayload,
+    IcaDataset,
+    OpenFoodFacts,
+)
+from custom_components.ica.coordinator import IcaCoordinator
+from custom_components.ica.utils import get_diffs
+
+
+def _http_error(status_code: int) -> requests.exceptions.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(response=response)
+
+
+def _shopping_list(offline_id: str, latest_change: str = "2024-01-01") -> dict:
+    return {
+        "id": offline_id,
+        "offlineId": offline_id,
+        "title": offline_id,
+        "latestChange": latest_change,
+        "rows": [],
+    }
+
+
+class _Api:
+    """Stands in for IcaAPIAsync, serving the lists and baseitems it's given."""
+
+    def __init__(self) -> None:
+        self.shopping_lists: dict[str, dict | Exception] = {}
+        self.summary: dict | Exception | None = None
+        self.baseitems: list | Exception = []
+        self.downloaded: list[str] = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+
+    async def ensure_login(self, refresh=None):
+        return None
+
+    def get_authenticated_user(self):
+        return {"token": {"expiry": "2999-01-01T00:00:00+00:00"}}
+
+    async def get_shopping_lists(self):
+        if isinstance(self.summary, Exception):
+            raise self.summary
+        return self.summary
+
+    async def get_shopping_list(self, list_id: str):
+        self.downloaded.append(list_id)
+        self.concurrent += 1
+        self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        try:
+            await asyncio.sleep(0.01)
+        finally:
+            self.concurrent -= 1
+        result = self.shopping_lists[list_id]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def get_baseitems(self):
+        if isinstance(self.baseitems, Exception):
+            raise self.baseitems
+        return self.baseitems
+
+    async def get_articles(self):
+        return []
+
+    async def get_favorite_stores(self):
+        return []
+
+
+@pytest.fixture
+async def api():
+    return _Api()
+
+
+@pytest.fixture
+async def coordinator(hass, storage_dir, aioclient_mock, api):
+    entry = MockConfigEntry(
+        domain=DOMAIN,
+        data={
+            CONF_ICA_ID: "1",
+            CONF_SHOPPING_LISTS: ["a", "b"],
+            CONF_DURABLE_EVENTS: False,
+        },
+    )
+    entry.add_to_hass(hass)
+    coordinator = IcaCoordinator(hass, entry, logging.getLogger(__name__), None, api)
+    yield coordinator
+    await coordinator._worker.shutdown()
+    await coordinator._scheduler.async_shutdown()
+
+
+# ---------------------------------------------------------------------------
+# Tracked shopping lists
+# ---------------------------------------------------------------------------
+
+
+class TestTrackedShoppingLists:
+    async def test_only_changed_lists_are_downloaded(self, coordinator, api):
+        cached = [_shopping_list("a"), _shopping_list("b")]
+        await coordinator._ica_shopping_lists.set_value(cached)
+        api.summary = {
+            "shoppingLists": [
+                {"offlineId": "a", "latestChange": "2024-01-01"},
+                {"offlineId": "b", "latestChange": "2024-02-01"},
+            ]
+        }
+        api.shopping_lists["b"] = _shopping_list("b", "2024-02-01")
+
+        lists = await coordinator._get_tracked_shopping_lists()
+        assert api.downloaded == ["b"]
+        assert lists[0] is cached[0]
+        assert lists[1]["latestChange"] == "2024-02-01"
+
+    async def test_all_lists_downloaded_without_summary(self, coordinator, api):
+        await coordinator._ica_shopping_lists.set_value([_shopping_list("a")])
+        api.summary = _http_error(500)
+        api.shopping_lists = {"a": _shopping_list("a"), "b": _shopping_list("b")}
+
+        await coordinator._get_tracked_shopping_lists()
+        assert sorted(api.downloaded) == ["a", "b"]
+
+    async def test_lists_are_downloaded_concurrently(self, hass, coordinator, api):
+        list_ids = [str(i) for i in range(MAX_CONCURRENT_REQUESTS + 2)]
+        entry = coordinator._config_entry
+        hass.config_entries.async_update_entry(
+            entry, data={**entry.data, CONF_SHOPPING_LISTS: list_ids}
+        )
+        api.shopping_lists = {list_id: _shopping_list(list_id) for list_id in list_ids}
+
+        lists = await coordinator._get_tracked_shopping_lists()
+        assert [lst["offlineId"] for lst in lists] == list_ids
+        assert api.max_concurrent == MAX_CONCURRENT_REQUESTS
+
+    async def test_failed_list_keeps_cached_copy(self, coordinator, api):
+        cached = [_shopping_list("a"), _shopping_list("b")]
+        await coordinator._ica_shopping_lists.set_value(cached)
+        api.shopping_lists = {
+            "a": _http_error(500),
+            "b": _shopping_list("b", "2024-02-01"),
+        }
+
+        lists = await coordinator._get_tracked_shopping_lists()
+        assert lists[0] is cached[0]
+        assert lists[1]["latestChange"] == "2024-02-01"
+
+    async def test_raises_when_no_list_could_be_fetched(self, coordinator, api):
+        api.shopping_lists = {
+            "a": requests.exceptions.ConnectionError("offline"),
+            "b": _http_error(500),
+        }
+
+        with pytest.raises(requests.exceptions.ConnectionError):
+            await coordinator._get_tracked_shopping_lists()
+
+    async def test_unauthorized_is_raised_to_refresh_login(self, coordinator, api):
+        api.shopping_lists = {"a": _http_error(401), "b": _shopping_list("b")}
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            await coordinator._get_tracked_shopping_lists()
+
+
+# ---------------------------------------------------------------------------
+# Scheduled refreshes
+# ---------------------------------------------------------------------------
+
+
+class TestScheduledRefresh:
+    async def test_failure_is_reported_and_recovers(self, coordinator, api):
+        entry = coordinator._datasets[IcaDataset.BASEITEMS]
+        api.baseitems = _http_error(500)
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            await coordinator._async_refresh_cache_entry(entry)
+        assert not coordinator.last_update_success
+        assert entry.key not in coordinator._scheduler._due
+
+        api.baseitems = [{"id": 1}]
+        await coordinator._async_refresh_cache_entry(entry)
+        assert coordinator.last_update_success
+        assert coordinator._scheduler._due[entry.key] == entry.expires_at
+        assert coordinator.refresh_stages[IcaDataset.BASEITEMS]["error"] is None
+
+    async def test_fresh_entry_is_not_refreshed_again(self, coordinator, api):
+        entry = coordinator._datasets[IcaDataset.BASEITEMS]
+        await entry.set_value([{"id": 1}])
+        api.baseitems = _http_error(500)
+
+        await coordinator._async_refresh_cache_entry(entry)
+        assert entry.current_value() == [{"id": 1}]
+
+
+# ---------------------------------------------------------------------------
+# Change events
+# ---------------------------------------------------------------------------
+
+
+class TestChangeEvents:
+    @pytest.mark.parametrize(
+        ("payload", "diffs"),
+        [
+            (EventPayload.SUMMARY, [{"op": "~", "id": "1", "changed_props": ["n"]}]),
+            (
+                EventPayload.JSON_PATCH,
+                [
+                    {"op": "replace", "path": "/1/n", "value": 2},
+                    {"op": "remove", "path": "/1/x"},
+                ],
+            ),
+        ],
+    )
+    async def test_payload_policy(self, hass, coordinator, payload, diffs):
+        entry = coordinator._config_entry
+        hass.config_entries.async_update_entry(
+            entry, data={**entry.data, CONF_EVENT_PAYLOAD: payload}
+        )
+        entry.mock_state(hass, ConfigEntryState.LOADED)
+        events = async_capture_events(hass, f"{DOMAIN}_event")
+        old = [{"id": "1", "n": 1, "x": "a"}]
+        new = [{"id": "1", "n": 2}]
+
+        full = {"type": "shopping_list_updated", "diffs": get_diffs(old, new)}
+        await coordinator._async_fire_diff_event(
+            f"{DOMAIN}_event", full, "diffs", old, new
+        )
+        async_fire_time_changed(hass, dt_util.utcnow() + dt.timedelta(seconds=2))
+        await hass.async_block_till_done()
+
+        [event] = events
+        assert event.data["diffs"] == diffs
+        assert event.data["summary"] == {"added": 0, "removed": 0, "changed": 1}
+        assert event.data["data_ref"]
+
+
+# ---------------------------------------------------------------------------
+# Products
+# ---------------------------------------------------------------------------
+
+
+class TestProducts:
+    async def test_jobs_run_once_for_all_accounts(self, hass, coordinator, api):
+        entry = MockConfigEntry(
+            domain=DOMAIN,
+            data={
+                CONF_ICA_ID: "2",
+                CONF_SHOPPING_LISTS: [],
+                CONF_DURABLE_EVENTS: False,
+            },
+        )
+        entry.add_to_hass(hass)
+        other = IcaCoordinator(hass, entry, logging.getLogger(__name__), None, api)
+        runs = []
+        for account in (coordinator, other):
+
+            async def job(account=account):
+                await asyncio.sleep(0)
+                runs.append(account._config_entry.data[CONF_ICA_ID])
+
+            account._async_lookup_products = account._async_enrich_products = job
+        try:
+            coordinator._schedule_product_jobs()
+            other._schedule_product_jobs()
+            await hass.async_block_till_done()
+            assert runs == ["1", "1"]
+
+            # Any account can run the jobs once they are done
+            other._schedule_product_jobs()
+            await hass.async_block_till_done()
+            assert runs == ["1", "1", "2", "2"]
+        finally:
+            await other._worker.shutdown()
+            await other._scheduler.async_shutdown()
+
+    async def test_jobs_resume_at_setup(self, hass, coordinator):
+        runs = []
+
+        async def lookup():
+            runs.append("lookup")
+
+        async def enrich():
+            runs.append("enrich")
+
+        coordinator._async_lookup_products = lookup
+        coordinator._async_enrich_products = enrich
+        await coordinator.init_cache()
+        await hass.async_block_till_done()
+        assert runs == ["lookup", "enrich"]
+
+    async def test_open_food_facts_product(self, coordinator, aioclient_mock):
+        aioclient_mock.get(
+            OpenFoodFacts.APIv2.format("123"),
+            json={
+                "status": 1,
+                "product": {
+                    "product_name": "Milk",
+                    "nutriments": {"energy-kcal_100g": 64},
+                },
+            },
+        )
+        aioclient_mock.get(OpenFoodFacts.APIv2.format("404"), status=404)
+
+        product = await coordinator.get_product_from_open_food_facts("123")
+        assert product["product_name"] == "Milk"
+        assert product["energy_kcal_value"] == 64
+        assert await coordinator.get_product_from_open_food_facts("404") is None
+
+
+class _Limiter:
+    """Stands in for the shared rate limiter, recording the back offs."""
+
+    def __init__(self) -> None:
+        self.delays = []
+
+    async def acquire(self) -> None:
+        return None
+
+    def delay(self, seconds: float) -> None:
+        self.delays.append(seconds)
+
+
+def _off_product(name: str) -> dict:
+    return {"status": 1, "product": {"product_name": name}}
+
+
+class TestOpenFoodFactsEnrichment:
+    @pytest.fixture
+    async def products(self, coordinator, monkeypatch):
+        monkeypatch.setattr(OpenFoodFacts, "ENRICHMENT_BATCH_SIZE", 2)
+        coordinator._openFoodFactsLimiter = _Limiter()
+        await coordinator._ica_products.set_value(
+            {ean: {"ean_id": ean} for ean in ("1", "2", "3", "4")}
+        )
+        return coordinator._ica_products
+
+    async def test_resumes_after_cursor(self, coordinator, aioclient_mock, products):
+        await coordinator._open_food_facts_state.set_value(
+            {"cursor": "2", "misses": {}, "enriched": 0, "last_run": None}
+        )
+        for ean in ("1", "2", "3", "4"):
+            aioclient_mock.get(OpenFoodFacts.APIv2.format(ean), json=_off_product(ean))
+
+        assert await coordinator._async_enrich_products() is True
+        assert [
+            ean
+            for ean, p in products.current_value().items()
+            if p.get("open_food_facts")
+        ] == ["3", "4"]
+        assert coordinator._open_food_facts_state.current_value()["cursor"] == "4"
+
+        # Wraps around to the products before the cursor
+        assert await coordinator._async_enrich_products() is False
+        state = coordinator._open_food_facts_state.current_value()
+        assert (state["cursor"], state["enriched"]) == ("2", 4)
+
+    async def test_misses_are_not_looked_up_again(
+        self, coordinator, aioclient_mock, products
+    ):
+        old = dt_util.utcnow() - dt.timedelta(
+            days=OpenFoodFacts.ENRICHMENT_RETRY_MISSES_DAYS + 1
+        )
+        await coordinator._open_food_facts_state.set_value(
+            {
+                "cursor": None,
+                # Looked up recently, and so long ago that it's looked up again
+                "misses": {"1": dt_util.utcnow().isoformat(), "2": old.isoformat()},
+                "enriched": 0,
+                "last_run": None,
+            }
+        )
+        aioclient_mock.get(OpenFoodFacts.APIv2.format("2"), status=404)
+        aioclient_mock.get(OpenFoodFacts.APIv2.format("3"), json=_off_product("3"))
+
+        assert await coordinator._async_enrich_products() is True
+        state = coordinator._open_food_facts_state.current_value()
+        assert sorted(state["misses"]) == ["1", "2"]
+        assert state["misses"]["2"] != old.isoformat()
+        assert [call[1].path for call in aioclient_mock.mock_calls] == [
+            "/api/v2/product/2.json",
+            "/api/v2/product/3.json",
+        ]
+
+    async def test_backs_off_when_throttled(
+        self, coordinator, aioclient_mock, products
+    ):
+        aioclient_mock.get(OpenFoodFacts.APIv2.format("1"), status=429)
+        aioclient_mock.get(OpenFoodFacts.APIv2.format("2"), json=_off_product("2"))
+
+        assert await coordinator._async_enrich_products() is False
+        assert coordinator._openFoodFactsLimiter.delays == [60]
+        state = coordinator._open_food_facts_state.current_value()
+        # Throttled products are neither enriched nor remembered as misses
+        assert state["misses"] == {}
+        assert not products.current_value()["1"].get("open_food_facts")
+        assert products.current_value()["2"]["open_food_facts"]
@@ -0,0 +1,162 @@
+"""Tests for the outbox of mutations that are replayed once ICA is reachable."""
+
+import datetime as dt
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+import requests
+from freezegun import freeze_time
+from homeassistant.util import dt as dt_util
+
+from custom_components.ica.const import OUTBOX_MAX_ATTEMPTS
+from custom_components.ica.outbox import (
+    MutationOutbox,
+    is_connectivity_error,
+)
+
+
+def _http_error(status_code: int) -> requests.exceptions.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(response=response)
+
+
+def _sync(list_id: str, *changed: str) -> dict:
+    return {
+        "offlineId": list_id,
+        "changedRows": [
+            {"offlineId": row_id, "isStrikedOver": True} for row_id in changed
+        ],
+    }
+
+
+class _Submitter:
+    """Records submitted data, raising the queued errors first."""
+
+    def __init__(self, *errors: Exception) -> None:
+        self.errors = list(errors)
+        self.submitted = []
+
+    async def __call__(self, data) -> None:
+        if self.errors:
+            raise self.errors.pop(0)
+        self.submitted.append(data)
+
+
+# ---------------------------------------------------------------------------
+# is_connectivity_error
+# ---------------------------------------------------------------------------
+
+
+class TestIsConnectivityError:
+    def test_server_errors_and_timeouts(self):
+        assert is_connectivity_error(_http_error(503))
+        assert is_connectivity_error(requests.exceptions.ConnectionError())
+        assert is_connectivity_error(TimeoutError())
+
+    def test_rejections(self):
+        assert not is_connectivity_error(_http_error(400))
+        assert not is_connectivity_error(ValueError())
+
+
+# ---------------------------------------------------------------------------
+# MutationOutbox
+# ---------------------------------------------------------------------------
+
+
+class TestMutationOutbox:
+    async def test_syncs_of_same_list_are_merged(self, hass, storage_dir):
+        outbox = MutationOutbox(hass, "test.outbox")
+        await outbox.async_add_shopping_list_sync(_sync("L", "a"))
+        await outbox.async_add_shopping_list_sync(_sync("L", "b"))
+        await outbox.async_set_baseitems([{"id": 1}])
+        await outbox.async_set_baseitems([{"id": 2}])
+
+        submit_sync, submit_baseitems = _Submitter(), _Submitter()
+        assert await outbox.async_replay(submit_sync, submit_baseitems) == 2
+        assert [
+            [row["offlineId"] for row in sync["changedRows"]]
+            for sync in submit_sync.submitted
+        ] == [["a", "b"]]
+        assert submit_baseitems.submitted == [[{"id": 2}]]
+        assert not outbox.has_pending
+
+    async def test_operations_survive_a_restart(self, hass, storage_dir):
+        await MutationOutbox(hass, "test.outbox").async_add_shopping_list_sync(
+            _sync("L", "a")
+        )
+
+        outbox = MutationOutbox(hass, "test.outbox")
+        await outbox.async_load()
+        assert outbox.has_pending
+
+    async def test_kept_while_unreachable(self, hass, storage_dir):
+        outbox = MutationOutbox(hass, "test.outbox")
+        await outbox.async_add_shopping_list_sync(_sync("L", "a"))
+
+        submit = _Submitter(requests.exceptions.ConnectionError("offline"))
+        with pytest.raises(requests.exceptions.ConnectionError):
+            await outbox.async_replay(submit, _Submitter())
+        assert outbox.has_pending
+
+        assert await outbox.async_replay(submit, _Submitter()) == 1
+        assert not outbox.has_pending
+
+    async def test_rejected_operation_is_dropped(self, hass, storage_dir):
+        outbox = MutationOutbox(hass, "test.outbox")
+        await outbox.async_add_shopping_list_sync(_sync("L", "a"))
+        await outbox.async_add_shopping_list_sync(_sync("M", "b"))
+        rejected = []
+
+        async def on_rejected(operation, err):
+            rejected.append(operation["target"])
+
+        submit = _Submitter(_http_error(400))
+        assert await outbox.async_replay(submit, _Submitter(), on_rejected) == 1
+        assert rejected == ["L"]
+        assert [sync["offlineId"] for sync in submit.submitted] == ["M"]
+
+    async def test_dropped_after_repeated_server_errors(self, hass, storage_dir):
+        outbox = MutationOutbox(hass, "test.outbox")
+        await outbox.async_add_shopping_list_sync(_sync("L", "a"))
+        rejected = []
+
+        async def on_rejected(operation, err):
+            rejected.append(operation["attempts"])
+
+        submit = _Submitter(*(_http_error(500) for _ in range(OUTBOX_MAX_ATTEMPTS)))
+        for _ in range(OUTBOX_MAX_ATTEMPTS - 1):
+            with pytest.raises(requests.exceptions.HTTPError):
+                await outbox.async_replay(submit, _Submitter(), on_rejected)
+        assert outbox.has_pending
+
+        assert await outbox.async_replay(submit, _Submitter(), on_rejected) == 0
+        assert rejected == [OUTBOX_MAX_ATTEMPTS]
+        assert not outbox.has_pending
+
+    async def test_connection_errors_are_not_counted(self, hass, storage_dir):
+        outbox = MutationOutbox(hass, "test.outbox")
+        await outbox.async_add_shopping_list_sync(_sync("L", "a"))
+
+        for _ in range(OUTBOX_MAX_ATTEMPTS + 1):
+            submit = _Submitter(requests.exceptions.ConnectionError("offline"))
+            with pytest.raises(requests.exceptions.ConnectionError):
+                await outbox.async_replay(submit, _Submitter())
+        assert outbox.has_pending
+
+    async def test_old_operations_are_dropped(self, hass, storage_dir):
+        outbox = MutationOutbox(hass, "test.outbox")
+        with freeze_time(dt_util.utcnow() - dt.timedelta(days=8)):
+            await outbox.async_add_shopping_list_sync(_sync("L", "a"))
+        await outbox.async_add_shopping_list_sync(_sync("M", "b"))
+        rejected = []
+
+        async def on_rejected(operation, err):
+            rejected.append(operation["target"])
+
+        submit = _Submitter()
+        assert await outbox.async_replay(submit, _Submitter(), on_rejected) == 1
+        assert rejected == ["L"]
+        assert [sync["offlineId"] for sync in submit.submitted] == ["M"]
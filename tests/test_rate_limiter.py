@@ -0,0 +1,85 @@
+"""Tests for the token bucket rate limiter."""
+
+import asyncio
+import importlib.util
+import os
+
+import pytest
+
+# Import rate_limiter.py directly to avoid pulling in the full ica package
+# (which depends on homeassistant).
+_limiter_path = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "custom_components",
+    "ica",
+    "rate_limiter.py",
+)
+_spec = importlib.util.spec_from_file_location("ica_rate_limiter", _limiter_path)
+_limiter = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_limiter)
+
+RateLimiter = _limiter.RateLimiter
+
+
+def _run(coro):
+    # Not asyncio.run(), which unsets the current event loop of the test session
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestRateLimiter:
+    def test_burst_then_refill(self):
+        clock = _Clock()
+        limiter = RateLimiter(2, 1, clock=clock)
+        assert limiter.try_acquire()
+        assert limiter.try_acquire()
+        assert not limiter.try_acquire()
+
+        clock.now = 0.5
+        assert limiter.try_acquire()
+        assert not limiter.try_acquire()
+
+    def test_refill_is_capped_by_burst(self):
+        clock = _Clock()
+        limiter = RateLimiter(10, 1, burst=1, clock=clock)
+        clock.now = 100
+        assert limiter.try_acquire()
+        assert not limiter.try_acquire()
+
+    def test_delay_holds_back_acquisitions(self):
+        clock = _Clock()
+        limiter = RateLimiter(1, 1, clock=clock)
+        limiter.delay(5)
+        clock.now = 5.5
+        assert not limiter.try_acquire()
+        clock.now = 6
+        assert limiter.try_acquire()
+
+    def test_acquire_waits_for_tokens(self):
+        async def run():
+            limiter = RateLimiter(50, 1, burst=1)
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            for _ in range(4):
+                async with limiter:
+                    pass
+            return loop.time() - started
+
+        # 3 of the acquisitions have to wait 1/50 s each
+        assert _run(run()) >= 0.05
+
+    def test_invalid_rate(self):
+        with pytest.raises(ValueError):
+            RateLimiter(0, 1)
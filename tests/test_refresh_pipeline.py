@@ -0,0 +1,104 @@
+"""Tests for the dependency-aware refresh pipeline."""
+
+import asyncio
+import importlib.util
+import os
+
+import pytest
+
+# Import refresh_pipeline.py directly to avoid pulling in the full ica package
+# (which depends on homeassistant).
+_pipeline_path = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "custom_components",
+    "ica",
+    "refresh_pipeline.py",
+)
+_spec = importlib.util.spec_from_file_location("ica_refresh_pipeline", _pipeline_path)
+_pipeline = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_pipeline)
+
+RefreshPipeline = _pipeline.RefreshPipeline
+
+
+def _run(coro):
+    # Not asyncio.run(), which unsets the current event loop of the test session
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def _stage(log: list, name: str, delay: float = 0, error: Exception | None = None):
+    async def run():
+        log.append(f"start:{name}")
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        log.append(f"end:{name}")
+
+    return run
+
+
+class TestRefreshPipeline:
+    def test_independent_stages_run_concurrently(self):
+        log = []
+        pipeline = RefreshPipeline()
+        pipeline.add_stage("a", _stage(log, "a", 0.01))
+        pipeline.add_stage("b", _stage(log, "b", 0.01))
+        _run(pipeline.async_run())
+        assert log[:2] == ["start:a", "start:b"]
+
+    def test_dependent_stage_waits_for_dependency(self):
+        log = []
+        pipeline = RefreshPipeline()
+        pipeline.add_stage("stores", _stage(log, "stores", 0.01))
+        pipeline.add_stage("offers", _stage(log, "offers"), depends_on=["stores"])
+        result = _run(pipeline.async_run())
+        assert log.index("end:stores") < log.index("start:offers")
+        assert set(result["stages"]) == {"stores", "offers"}
+        assert result["stages"]["offers"]["duration_seconds"] is not None
+
+    def test_failed_dependency_skips_dependents_and_raises(self):
+        log = []
+        pipeline = RefreshPipeline()
+        pipeline.add_stage("stores", _stage(log, "stores", error=ValueError("boom")))
+        pipeline.add_stage("offers", _stage(log, "offers"), depends_on=["stores"])
+        pipeline.add_stage("lists", _stage(log, "lists"))
+        with pytest.raises(ValueError, match="boom"):
+            _run(pipeline.async_run())
+        stages = pipeline.result["stages"]
+        assert stages["stores"]["error"] == "boom"
+        assert stages["offers"]["skipped"] is True
+        assert "end:lists" in log
+        assert "start:offers" not in log
+
+    def test_stage_running_after_a_failed_stage_is_not_skipped(self):
+        log = []
+        pipeline = RefreshPipeline()
+        pipeline.add_stage("outbox", _stage(log, "outbox", 0.01, ValueError("500")))
+        pipeline.add_stage("lists", _stage(log, "lists"), runs_after=["outbox"])
+        with pytest.raises(ValueError, match="500"):
+            _run(pipeline.async_run())
+        assert log == ["start:outbox", "start:lists", "end:lists"]
+        assert pipeline.result["stages"]["lists"]["skipped"] is False
+
+    def test_first_error_in_stage_order_is_raised(self):
+        pipeline = RefreshPipeline()
+        pipeline.add_stage("a", _stage([], "a", 0.01, error=KeyError("a")))
+        pipeline.add_stage("b", _stage([], "b", error=ValueError("b")))
+        with pytest.raises(KeyError):
+            _run(pipeline.async_run())
+
+    def test_unknown_dependency_is_rejected(self):
+        pipeline = RefreshPipeline()
+        with pytest.raises(ValueError):
+            pipeline.add_stage("offers", _stage([], "offers"), depends_on=["stores"])
+
+    def test_duplicate_stage_is_rejected(self):
+        pipeline = RefreshPipeline()
+        pipeline.add_stage("a", _stage([], "a"))
+        with pytest.raises(ValueError):
+            pipeline.add_stage("a", _stage([], "a"))
@@ -0,0 +1,46 @@
+"""Tests for the content-based change tokens of keyed values."""
+
+import importlib.util
+import os
+
+# Import utils.py directly to avoid pulling in the full ica package
+# (which depends on homeassistant).
+_utils_path = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "custom_components",
+    "ica",
+    "utils.py",
+)
+_spec = importlib.util.spec_from_file_location("ica_utils", _utils_path)
+_utils = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_utils)
+
+ChangeTokens = _utils.ChangeTokens
+
+
+# ---------------------------------------------------------------------------
+# ChangeTokens
+# ---------------------------------------------------------------------------
+
+
+class TestChangeTokens:
+    def test_only_change_with_content(self):
+        tokens = ChangeTokens()
+        assert tokens.get("a") == 0
+        assert tokens.update("a", {"rows": [1]})
+        token = tokens.get("a")
+        assert not tokens.update("a", {"rows": [1]})
+        assert tokens.get("a") == token
+        assert tokens.update("a", {"rows": [1, 2]})
+        assert tokens.get("a") > token
+
+    def test_removed_and_readded_keys(self):
+        tokens = ChangeTokens()
+        tokens.update("a", [1])
+        token = tokens.get("a")
+        assert tokens.update("a", None)
+        assert tokens.get("a") == 0
+        assert not tokens.update("a", None)
+        tokens.update("a", [1])
+        assert tokens.get("a") not in (0, token)
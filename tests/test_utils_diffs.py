@@ -0,0 +1,236 @@
+"""Tests for diffing cached data with and without row fingerprints."""
+
+import importlib.util
+import os
+
+# Import utils.py directly to avoid pulling in the full ica package
+# (which depends on homeassistant).
+_utils_path = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "custom_components",
+    "ica",
+    "utils.py",
+)
+_spec = importlib.util.spec_from_file_location("ica_utils", _utils_path)
+_utils = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_utils)
+
+RowFingerprints = _utils.RowFingerprints
+canonicalize_lists = _utils.canonicalize_lists
+compact_diffs = _utils.compact_diffs
+fingerprint = _utils.fingerprint
+get_diffs = _utils.get_diffs
+iter_diffs = _utils.iter_diffs
+summarize_diffs = _utils.summarize_diffs
+
+
+# ---------------------------------------------------------------------------
+# fingerprint
+# ---------------------------------------------------------------------------
+
+
+def _offer(offer_id, **kwargs):
+    return {"id": offer_id, "eans": [{"id": "731"}], **kwargs}
+
+
+def _sorted(diffs):
+    return sorted(diffs, key=lambda d: (d["op"], d["id"]))
+
+
+class TestFingerprint:
+    def test_independent_of_key_order(self):
+        assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+
+    def test_detects_nested_changes(self):
+        assert fingerprint(_offer("1")) != fingerprint(
+            {"id": "1", "eans": [{"id": "732"}]}
+        )
+
+
+# ---------------------------------------------------------------------------
+# get_diffs
+# ---------------------------------------------------------------------------
+
+
+class TestGetDiffs:
+    def test_added_removed_changed(self):
+        a = {"1": _offer("1"), "2": _offer("2", name="Old")}
+        b = {"2": _offer("2", name="New"), "3": _offer("3")}
+        diffs = _sorted(get_diffs(a, b, include_values=False))
+        assert diffs == [
+            {"op": "+", "id": "3", "new": b["3"]},
+            {"op": "-", "id": "1", "old": a["1"]},
+            {"op": "~", "id": "2", "changed_props": ["name"]},
+        ]
+
+    def test_from_lists(self):
+        diffs = get_diffs([_offer("1", name="A")], [_offer("1", name="B")])
+        assert diffs == [
+            {
+                "op": "~",
+                "id": "1",
+                "changed_props": ["name"],
+                "old": {"name": "A"},
+                "new": {"name": "B"},
+            }
+        ]
+
+    def test_only_properties_of_new_row_are_compared(self):
+        a = {"1": _offer("1", brand="ICA", price="10:-", note=None)}
+        b = {"1": _offer("1", price=None)}
+        # The missing 'brand' and 'note' are not changes, the nulled 'price' is
+        assert get_diffs(a, b) == [
+            {
+                "op": "~",
+                "id": "1",
+                "changed_props": ["price"],
+                "old": {"price": "10:-"},
+                "new": {"price": None},
+            }
+        ]
+        del a["1"]["brand"], a["1"]["price"]
+        assert get_diffs(a, {"1": _offer("1")}) == []
+
+
+# ---------------------------------------------------------------------------
+# RowFingerprints
+# ---------------------------------------------------------------------------
+
+
+class TestRowFingerprints:
+    def test_report_changed_rows_on_ingest(self):
+        fingerprints = RowFingerprints()
+        assert fingerprints.ingest("1", _offer("1"))
+        assert not fingerprints.ingest("1", dict(_offer("1")))
+        assert fingerprints.ingest("1", _offer("1", name="New"))
+
+    def test_restored_from_persisted_hashes(self):
+        fingerprints = RowFingerprints()
+        fingerprints.ingest("1", _offer("1"))
+        restored = RowFingerprints(fingerprints.hashes)
+        assert "1" in restored
+        assert not restored.ingest("1", _offer("1"))
+
+    def test_retain_only_current_rows(self):
+        fingerprints = RowFingerprints()
+        fingerprints.ingest("1", _offer("1"))
+        fingerprints.ingest("2", _offer("2"))
+        fingerprints.retain({"2": _offer("2")})
+        assert fingerprints.hashes.keys() == {"2"}
+
+    def test_candidate_diffs_match_plain_diffs(self):
+        fingerprints = RowFingerprints()
+        a = {str(i): _offer(str(i), name=f"Offer {i}") for i in range(10)}
+        for row_id, row in a.items():
+            fingerprints.ingest(row_id, row)
+        b = {k: dict(v) for k, v in a.items()}
+        b["3"]["name"] = "Changed"
+        b["4"]["eans"] = [{"id": "999"}]
+        del b["5"]
+        b["10"] = _offer("10")
+        changed = {k for k, v in b.items() if fingerprints.ingest(k, v)}
+
+        assert changed == {"3", "4", "10"}
+        expected = _sorted(get_diffs(a, b))
+        assert _sorted(get_diffs(a, b, candidates=changed)) == expected
+
+    def test_candidate_diffs_skip_unchanged_rows(self):
+        a = {"1": _offer("1"), "2": _offer("2")}
+        b = {"1": _offer("1", name="Not compared"), "2": _offer("2", name="New")}
+        diffs = get_diffs(a, b, include_values=False, candidates={"2"})
+        assert diffs == [{"op": "~", "id": "2", "changed_props": ["name"]}]
+
+
+# ---------------------------------------------------------------------------
+# canonicalize_lists
+# ---------------------------------------------------------------------------
+
+
+class TestCanonicalizeLists:
+    def test_keyed_lists(self):
+        offer = {"id": "1", "eans": [{"id": "2"}, {"id": "1"}], "stores": [{"id": "b"}]}
+        result = canonicalize_lists(offer)
+        assert result["eans"] == [{"id": "1"}, {"id": "2"}]
+        assert result["stores"] == [{"id": "b"}]
+        # The input is left untouched
+        assert offer["eans"] == [{"id": "2"}, {"id": "1"}]
+
+    def test_set_lists(self):
+        assert canonicalize_lists({"StoreIds": [3, 1, 2]})["StoreIds"] == [1, 2, 3]
+
+    def test_returns_same_object_when_canonical(self):
+        offer = {"id": "1", "eans": [{"id": "1"}, {"id": "2"}], "name": "X"}
+        assert canonicalize_lists(offer) is offer
+        assert canonicalize_lists(None) is None
+
+    def test_custom_policy(self):
+        row = {"tags": ["b", "a"], "eans": [{"id": "2"}, {"id": "1"}]}
+        result = canonicalize_lists(row, {"tags": None})
+        assert result["tags"] == ["a", "b"]
+        assert result["eans"] == [{"id": "2"}, {"id": "1"}]
+
+    def test_reordered_lists_do_not_show_up_in_diffs(self):
+        a = {"1": canonicalize_lists(_offer("1", eans=[{"id": "1"}, {"id": "2"}]))}
+        b = {"1": canonicalize_lists(_offer("1", eans=[{"id": "2"}, {"id": "1"}]))}
+        assert get_diffs(a, b) == []
+
+
+# ---------------------------------------------------------------------------
+# compact_diffs / summarize_diffs
+# ---------------------------------------------------------------------------
+
+
+class TestSummarizeDiffs:
+    def test_compact_and_summarize(self):
+        a = {"1": _offer("1"), "2": _offer("2", name="Old")}
+        b = {"2": _offer("2", name="New"), "3": _offer("3")}
+        diffs = get_diffs(a, b)
+        assert _sorted(compact_diffs(diffs)) == [
+            {"op": "+", "id": "3"},
+            {"op": "-", "id": "1"},
+            {"op": "~", "id": "2", "changed_props": ["name"]},
+        ]
+        assert summarize_diffs(diffs) == {"added": 1, "removed": 1, "changed": 1}
+        patch = list(_utils.iter_diffs(a, b, json_patch=True))
+        assert summarize_diffs(patch) == {"added": 1, "removed": 1, "changed": 1}
+
+
+# ---------------------------------------------------------------------------
+# iter_diffs
+# ---------------------------------------------------------------------------
+
+
+class TestIterDiffs:
+    def test_is_lazy(self):
+        a = {str(i): _offer(str(i)) for i in range(5)}
+        b = {}
+        diffs = iter_diffs(a, b)
+        first = next(diffs)
+        assert first["op"] == "-"
+        assert len(list(diffs)) == 4
+
+    def test_matches_get_diffs(self):
+        a = {"1": _offer("1"), "2": _offer("2", name="Old")}
+        b = {"2": _offer("2", name="New"), "3": _offer("3")}
+        assert _sorted(iter_diffs(a, b)) == _sorted(get_diffs(a, b))
+
+    def test_json_patch(self):
+        a = {"1": _offer("1"), "2": _offer("2", name="Old"), "a/b": _offer("a/b")}
+        b = {"2": _offer("2", name="New", brand="ICA"), "3": _offer("3")}
+        patch = sorted(iter_diffs(a, b, json_patch=True), key=lambda op: op["path"])
+        assert patch == [
+            {"op": "remove", "path": "/1"},
+            {"op": "add", "path": "/2/brand", "value": "ICA"},
+            {"op": "replace", "path": "/2/name", "value": "New"},
+            {"op": "add", "path": "/3", "value": b["3"]},
+            {"op": "remove", "path": "/a~1b"},
+        ]
+
+    def test_json_patch_removes_properties(self):
+        a = {"1": _offer("1", brand="ICA", price="10:-")}
+        b = {"1": _offer("1", price=None)}
+        assert list(iter_diffs(a, b, json_patch=True)) == [
+            {"op": "replace", "path": "/1/price", "value": None},
+            {"op": "remove", "path": "/1/brand"},
+        ]
@@ -0,0 +1,168 @@
+"""Tests for event payloads: chunking, coalescing and the event journal."""
+
+import importlib.util
+import json
+import os
+
+# Import utils.py directly to avoid pulling in the full ica package
+# (which depends on homeassistant).
+_utils_path = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "custom_components",
+    "ica",
+    "utils.py",
+)
+_spec = importlib.util.spec_from_file_location("ica_utils", _utils_path)
+_utils = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_utils)
+
+chunk_event_payload = _utils.chunk_event_payload
+coalesce_events = _utils.coalesce_events
+parse_event_journal = _utils.parse_event_journal
+
+
+# ---------------------------------------------------------------------------
+# chunk_event_payload
+# ---------------------------------------------------------------------------
+
+
+class TestChunkEventPayload:
+    def test_small_payload_is_not_chunked(self):
+        event_data = {"type": "x", "diffs": [{"op": "+", "id": "1"}]}
+        assert chunk_event_payload(event_data, "diffs", 1024) == [event_data]
+
+    def test_large_payload_is_chunked_into_numbered_parts(self):
+        diffs = [{"op": "+", "id": str(i), "new": "x" * 100} for i in range(50)]
+        event_data = {"type": "offers_changed", "uid": "u", "diffs": diffs}
+        parts = chunk_event_payload(event_data, "diffs", 1024)
+
+        assert len(parts) > 1
+        assert [p["part"] for p in parts] == list(range(1, len(parts) + 1))
+        assert all(p["parts"] == len(parts) for p in parts)
+        assert all(p["type"] == "offers_changed" and p["uid"] == "u" for p in parts)
+        assert all(len(json.dumps(p).encode()) <= 1024 for p in parts)
+        assert [d for p in parts for d in p["diffs"]] == diffs
+
+    def test_oversized_item_gets_its_own_part(self):
+        diffs = [{"id": "1"}, {"id": "2", "new": "x" * 2048}, {"id": "3"}]
+        parts = chunk_event_payload({"diffs": diffs}, "diffs", 1024)
+        assert [[d["id"] for d in p["diffs"]] for p in parts] == [["1"], ["2"], ["3"]]
+
+
+# ---------------------------------------------------------------------------
+# coalesce_events
+# ---------------------------------------------------------------------------
+
+
+def _list_event(list_id, *diffs, **kwargs):
+    return {
+        "type": "shopping_list_updated",
+        "uid": "u",
+        "shopping_list_id": list_id,
+        "diffs": list(diffs),
+        **kwargs,
+    }
+
+
+class TestCoalesceEvents:
+    def test_merges_same_type_and_list(self):
+        events = [
+            ("ica_event", _list_event("a", {"op": "+", "id": "1"})),
+            ("ica_event", _list_event("b", {"op": "+", "id": "2"})),
+            ("ica_event", _list_event("a", {"op": "-", "id": "3"})),
+        ]
+        result = coalesce_events(events)
+        assert [(t, d["shopping_list_id"]) for t, d in result] == [
+            ("ica_event", "a"),
+            ("ica_event", "b"),
+        ]
+        assert result[0][1]["diffs"] == [{"op": "+", "id": "1"}, {"op": "-", "id": "3"}]
+
+    def test_merges_counts_and_summaries(self):
+        first = _list_event("a", pre_count=1, post_count=2, summary={"added": 1})
+        second = _list_event("a", pre_count=2, post_count=4, summary={"added": 2})
+        [(_, merged)] = coalesce_events([("ica_event", first), ("ica_event", second)])
+        assert merged["pre_count"] == 1
+        assert merged["post_count"] == 4
+        assert merged["summary"] == {"added": 3}
+
+    def test_keeps_every_data_ref(self):
+        events = [
+            ("ica_event", _list_event("a", {"op": "+", "id": "1"}, data_ref="r1")),
+            ("ica_event", _list_event("a", {"op": "+", "id": "2"}, data_ref="r2")),
+            ("ica_event", _list_event("a", {"op": "+", "id": "3"}, data_ref="r3")),
+        ]
+        [(_, merged)] = coalesce_events(events)
+        assert merged["data_ref"] == ["r1", "r2", "r3"]
+
+    def test_keeps_other_events_apart(self):
+        bonus = {"type": "current_bonus_loaded", "uid": "u", "data": {}}
+        part = _list_event("a", part=1, parts=2)
+        events = [
+            ("ica_event", bonus),
+            ("ica_event", dict(bonus)),
+            ("ica_event", part),
+            ("ica_event", _list_event("a")),
+            ("ica_product_event", _list_event("a")),
+        ]
+        assert len(coalesce_events(events)) == 5
+
+    def test_keeps_identified_events_apart(self):
+        events = [
+            (
+                "ica_new_offers",
+                {"type": "new_offers", "event_id": "a", "new_offers": [1]},
+            ),
+            (
+                "ica_new_offers",
+                {"type": "new_offers", "event_id": "b", "new_offers": [2]},
+            ),
+        ]
+        assert len(coalesce_events(events)) == 2
+
+    def test_respects_size_limit(self):
+        diff = {"op": "+", "id": "1", "new": "x" * 600}
+        events = [
+            ("ica_event", _list_event("a", diff)),
+            ("ica_event", _list_event("a", diff)),
+        ]
+        assert len(coalesce_events(events, max_bytes=1024)) == 2
+        assert len(coalesce_events(events)) == 1
+
+
+# ---------------------------------------------------------------------------
+# parse_event_journal
+# ---------------------------------------------------------------------------
+
+
+def _record(key, **kwargs):
+    return json.dumps({"key": key, "event_type": "ica_new_offers", **kwargs})
+
+
+def _fired(key):
+    return json.dumps({"fired": key})
+
+
+class TestParseEventJournal:
+    def test_returns_unfired_events_in_order(self):
+        lines = [_record("a"), _record("b"), _fired("a"), _record("c")]
+        pending, fired = parse_event_journal(lines)
+        assert [r["key"] for r in pending] == ["b", "c"]
+        assert fired == ["a"]
+
+    def test_drops_duplicate_keys(self):
+        lines = [_record("a", n=1), _record("a", n=2), _fired("b"), _record("b")]
+        pending, fired = parse_event_journal(lines)
+        assert [(r["key"], r["n"]) for r in pending] == [("a", 1)]
+        assert fired == ["b"]
+
+    def test_skips_malformed_lines(self):
+        lines = [_record("a"), '{"key": "b", "event_', "", "[1, 2]", _record("c")]
+        pending, _ = parse_event_journal(lines)
+        assert [r["key"] for r in pending] == ["a", "c"]
+
+    def test_keeps_most_recently_fired(self):
+        lines = [_fired(str(i)) for i in range(5)] + [_fired("1")]
+        assert parse_event_journal(lines, keep_fired=2)[1] == ["4", "1"]
+        assert parse_event_journal(lines, keep_fired=0)[1] == []
@@ -0,0 +1,173 @@
+"""Tests for the lookup indexes over cached data."""
+
+import importlib.util
+import os
+
+# Import utils.py directly to avoid pulling in the full ica package
+# (which depends on homeassistant).
+_utils_path = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "custom_components",
+    "ica",
+    "utils.py",
+)
+_spec = importlib.util.spec_from_file_location("ica_utils", _utils_path)
+_utils = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_utils)
+
+ArticleIndex = _utils.ArticleIndex
+ShoppingListIndex = _utils.ShoppingListIndex
+ShoppingListRowMatcher = _utils.ShoppingListRowMatcher
+product_names_match = _utils.product_names_match
+
+
+def _list(list_id, *rows):
+    return {"offlineId": list_id, "rows": list(rows)}
+
+
+# ---------------------------------------------------------------------------
+# ShoppingListIndex
+# ---------------------------------------------------------------------------
+
+
+class TestShoppingListIndex:
+    def test_get_list_and_position(self):
+        a, b = _list("a"), _list("b")
+        index = ShoppingListIndex()
+        index.update([a, b])
+        assert index.get_list("a") is a
+        assert index.get_list("b") is b
+        assert index.position_of("b") == 1
+        assert index.get_list("missing") is None
+        assert index.position_of("missing") == -1
+
+    def test_rows_by_offer(self):
+        r1 = {"offlineId": "1", "offerId": "o1"}
+        r2 = {"offlineId": "2", "offerId": "o1"}
+        index = ShoppingListIndex()
+        index.update([_list("a", r1, r2)])
+        assert index.get_rows_by_offer("a", "o1") == [r1, r2]
+        assert index.get_rows_by_offer("a", None) == []
+        assert index.get_rows_by_offer("b", "o1") == []
+
+    def test_update_only_reindexes_replaced_lists(self):
+        a, b = _list("a"), _list("b")
+        index = ShoppingListIndex()
+        assert index.update([a, b]) == ["a", "b"]
+        assert index.update([a, b]) == []
+
+        b2 = _list("b", {"offlineId": "new", "offerId": "o1"})
+        assert index.update([a, b2]) == ["b"]
+        assert index.get_rows_by_offer("b", "o1") != []
+
+    def test_update_removes_missing_lists(self):
+        index = ShoppingListIndex()
+        index.update([_list("a"), _list("b")])
+        assert index.update([_list("b")]) == ["b", "a"]
+        assert index.get_list("a") is None
+        assert index.position_of("b") == 0
+        assert index.update(None) == ["b"]
+
+
+# ---------------------------------------------------------------------------
+# ArticleIndex
+# ---------------------------------------------------------------------------
+
+
+_ARTICLES = [
+    {"id": 1, "name": "Tomat", "pluralName": "Tomater", "parentId": 1},
+    {"id": 2, "name": "Mjölk", "pluralName": None, "parentId": 2},
+    {"id": 3, "name": "Ägg", "parentId": 3},
+]
+
+
+class TestArticleIndex:
+    def test_lookup_is_case_insensitive(self):
+        index = ArticleIndex()
+        index.update(_ARTICLES)
+        assert index.get_article("mjölk")["id"] == 2
+        assert index.get_article("ÄGG")["id"] == 3
+
+    def test_lookup_by_plural_name(self):
+        index = ArticleIndex()
+        index.update(_ARTICLES)
+        assert index.get_article("tomater")["id"] == 1
+
+    def test_lookup_by_normalized_name(self):
+        index = ArticleIndex()
+        index.update([{"id": 4, "name": "Äpple", "parentId": 4}])
+        assert index.get_article("Äpplen")["id"] == 4
+
+    def test_name_is_not_shadowed_by_earlier_plural_name(self):
+        index = ArticleIndex()
+        index.update(
+            [
+                {"id": 5, "name": "Ost", "pluralName": "Ostar", "parentId": 5},
+                {"id": 6, "name": "Ostar", "parentId": 6},
+            ]
+        )
+        assert index.get_article("Ostar")["id"] == 6
+        assert index.get_article("Ost")["id"] == 5
+
+    def test_lookup_misses(self):
+        index = ArticleIndex()
+        assert index.get_article("Tomat") is None
+        index.update(_ARTICLES)
+        assert index.get_article("Kaffe") is None
+        assert index.get_article(None) is None
+        assert index.get_article("") is None
+
+    def test_update_replaces_index(self):
+        index = ArticleIndex()
+        index.update(_ARTICLES)
+        index.update(None)
+        assert len(index) == 0
+        assert index.get_article("Tomat") is None
+
+
+# ---------------------------------------------------------------------------
+# ShoppingListRowMatcher
+# ---------------------------------------------------------------------------
+
+
+_PERSISTED = [
+    {"offlineId": "a", "productName": "Tomat", "latestChange": "2024-01-01"},
+    {"offlineId": "b", "productName": "Tomater", "latestChange": "2024-03-01"},
+    {"offlineId": "c", "productName": "Mjölk", "latestChange": "2024-02-01"},
+]
+
+
+class TestShoppingListRowMatcher:
+    def test_prefers_offline_id(self):
+        matcher = ShoppingListRowMatcher(_PERSISTED)
+        row, matched_by = matcher.match({"offlineId": "C", "productName": "Tomat"})
+        assert row["offlineId"] == "c"
+        assert matched_by == "offlineId"
+
+    def test_falls_back_to_most_recent_product_name(self):
+        matcher = ShoppingListRowMatcher(_PERSISTED)
+        row, matched_by = matcher.match({"offlineId": "zzz", "productName": "tomat"})
+        assert row["offlineId"] == "b"
+        assert matched_by == "productName"
+
+    def test_no_match(self):
+        matcher = ShoppingListRowMatcher(_PERSISTED)
+        assert matcher.match({"productName": "Kaffe"}) == (None, None)
+        assert matcher.match({}) == (None, None)
+        assert ShoppingListRowMatcher(None).match({"productName": "Tomat"}) == (
+            None,
+            None,
+        )
+
+    def test_agrees_with_linear_scan(self):
+        persisted = sorted(
+            _PERSISTED, key=lambda r: r.get("latestChange", ""), reverse=True
+        )
+        matcher = ShoppingListRowMatcher(_PERSISTED)
+        for name in ("Tomat", "tomater", "Mjölken", "Kaffe", "TOMATERNA"):
+            expected = next(
+                (r for r in persisted if product_names_match(r["productName"], name)),
+                None,
+            )
+            assert matcher.match({"productName": name})[0] is expected
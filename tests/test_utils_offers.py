@@ -0,0 +1,95 @@
+"""Tests for incremental offer ingestion helpers."""
+
+import importlib.util
+import os
+from datetime import datetime, timedelta
+
+# Import utils.py directly to avoid pulling in the full ica package
+# (which depends on homeassistant).
+_utils_path = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "custom_components",
+    "ica",
+    "utils.py",
+)
+_spec = importlib.util.spec_from_file_location("ica_utils", _utils_path)
+_utils = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_utils)
+
+ExpiryIndex = _utils.ExpiryIndex
+get_changed_offer_ids = _utils.get_changed_offer_ids
+
+
+# ---------------------------------------------------------------------------
+# get_changed_offer_ids
+# ---------------------------------------------------------------------------
+
+
+class TestGetChangedOfferIds:
+    def test_new_offers_are_changed(self):
+        store_offers = {"2": {"id": "2"}, "1": {"id": "1"}}
+        assert get_changed_offer_ids(store_offers, {}) == ["1", "2"]
+
+    def test_known_offers_compared_to_previous_store_offer(self):
+        known = {"1": {"id": "1", "name": "Details name", "isUsed": False}}
+        previous = {"1": {"id": "1", "name": "Store name", "isUsed": False}}
+
+        unchanged = {"1": {"id": "1", "name": "Store name", "isUsed": False}}
+        assert get_changed_offer_ids(unchanged, known, previous) == []
+
+        used = {"1": {"id": "1", "name": "Store name", "isUsed": True}}
+        assert get_changed_offer_ids(used, known, previous) == ["1"]
+
+    def test_known_offers_without_previous_compared_to_details(self):
+        known = {"1": {"id": "1", "isUsed": False, "eans": []}}
+        assert get_changed_offer_ids({"1": {"id": "1", "isUsed": False}}, known) == []
+        assert get_changed_offer_ids({"1": {"id": "1", "isUsed": True}}, known) == ["1"]
+
+
+# ---------------------------------------------------------------------------
+# ExpiryIndex
+# ---------------------------------------------------------------------------
+
+
+_NOW = datetime(2024, 6, 1)
+
+
+class TestExpiryIndex:
+    def test_pop_expired_in_due_order(self):
+        index = ExpiryIndex()
+        index.set("b", _NOW - timedelta(days=1))
+        index.set("a", _NOW - timedelta(days=2))
+        index.set("c", _NOW + timedelta(days=1))
+        assert index.pop_expired(_NOW) == ["a", "b"]
+        assert len(index) == 1
+        assert "c" in index
+        assert index.pop_expired(_NOW) == []
+
+    def test_not_expired_when_due_now(self):
+        index = ExpiryIndex()
+        index.set("a", _NOW)
+        assert index.pop_expired(_NOW) == []
+
+    def test_set_replaces_due(self):
+        index = ExpiryIndex()
+        index.set("a", _NOW - timedelta(days=1))
+        index.set("a", _NOW + timedelta(days=1))
+        assert index.pop_expired(_NOW) == []
+        assert index.pop_expired(_NOW + timedelta(days=2)) == ["a"]
+
+    def test_discard_and_none_due(self):
+        index = ExpiryIndex()
+        index.set("a", _NOW - timedelta(days=1))
+        index.set("b", _NOW - timedelta(days=1))
+        index.discard("a")
+        index.set("b", None)
+        assert len(index) == 0
+        assert index.pop_expired(_NOW) == []
+
+    def test_heap_is_compacted(self):
+        index = ExpiryIndex()
+        for day in range(100):
+            index.set("a", _NOW + timedelta(days=day))
+        assert len(index._heap) < 50
+        assert index.pop_expired(_NOW + timedelta(days=200)) == ["a"]
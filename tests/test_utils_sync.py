@@ -0,0 +1,184 @@
+"""Tests for combining IcaShoppingListSync requests."""
+
+import importlib.util
+import os
+
+import pytest
+
+# Import utils.py directly to avoid pulling in the full ica package
+# (which depends on homeassistant).
+_utils_path = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "custom_components",
+    "ica",
+    "utils.py",
+)
+_spec = importlib.util.spec_from_file_location("ica_utils", _utils_path)
+_utils = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_utils)
+
+merge_shopping_list_syncs = _utils.merge_shopping_list_syncs
+
+
+def _row(offline_id, **kwargs):
+    return {"offlineId": offline_id, **kwargs}
+
+
+# ---------------------------------------------------------------------------
+# merge_shopping_list_syncs
+# ---------------------------------------------------------------------------
+
+
+class TestMergeShoppingListSyncs:
+    def test_empty(self):
+        assert merge_shopping_list_syncs([]) is None
+
+    def test_single_sync_is_kept(self):
+        sync = {"offlineId": "L", "changedRows": [_row("a", isStrikedOver=True)]}
+        assert merge_shopping_list_syncs([sync]) == sync
+
+    def test_changes_of_different_rows_are_combined(self):
+        result = merge_shopping_list_syncs(
+            [
+                {"offlineId": "L", "changedRows": [_row("a", isStrikedOver=True)]},
+                {"offlineId": "L", "changedRows": [_row("b", isStrikedOver=True)]},
+            ]
+        )
+        assert [r["offlineId"] for r in result["changedRows"]] == ["a", "b"]
+
+    def test_later_change_wins(self):
+        result = merge_shopping_list_syncs(
+            [
+                {"offlineId": "L", "changedRows": [_row("a", isStrikedOver=True)]},
+                {
+                    "offlineId": "L",
+                    "changedRows": [
+                        _row("a", isStrikedOver=False, productName="Mjölk")
+                    ],
+                },
+            ]
+        )
+        assert result["changedRows"] == [
+            _row("a", isStrikedOver=False, productName="Mjölk")
+        ]
+
+    def test_change_is_folded_into_created_row(self):
+        result = merge_shopping_list_syncs(
+            [
+                {"offlineId": "L", "createdRows": [_row("a", productName="Mjölk")]},
+                {"offlineId": "L", "changedRows": [_row("a", isStrikedOver=True)]},
+            ]
+        )
+        assert "changedRows" not in result
+        assert result["createdRows"] == [
+            _row("a", productName="Mjölk", isStrikedOver=True)
+        ]
+
+    def test_create_then_delete_cancels_out(self):
+        result = merge_shopping_list_syncs(
+            [
+                {"offlineId": "L", "createdRows": [_row("a", productName="Mjölk")]},
+                {"offlineId": "L", "deletedRows": ["a"]},
+            ]
+        )
+        assert result == {"offlineId": "L"}
+
+    def test_delete_drops_earlier_changes(self):
+        result = merge_shopping_list_syncs(
+            [
+                {"offlineId": "L", "changedRows": [_row("a", isStrikedOver=True)]},
+                {"offlineId": "L", "deletedRows": ["a", "b"]},
+                {"offlineId": "L", "deletedRows": ["b"]},
+            ]
+        )
+        assert "changedRows" not in result
+        assert result["deletedRows"] == ["a", "b"]
+
+    def test_list_properties_are_merged(self):
+        result = merge_shopping_list_syncs(
+            [
+                {"offlineId": "L", "changedShoppingListProperties": {"a": 1}},
+                {"offlineId": "L", "changedShoppingListProperties": {"a": 2, "b": 3}},
+            ]
+        )
+        assert result["changedShoppingListProperties"] == {"a": 2, "b": 3}
+
+    def test_inputs_are_not_mutated(self):
+        created = _row("a", productName="Mjölk")
+        merge_shopping_list_syncs(
+            [
+                {"offlineId": "L", "createdRows": [created]},
+                {"offlineId": "L", "changedRows": [_row("a", isStrikedOver=True)]},
+            ]
+        )
+        assert created == _row("a", productName="Mjölk")
+
+    def test_different_lists_are_rejected(self):
+        with pytest.raises(ValueError):
+            merge_shopping_list_syncs([{"offlineId": "L"}, {"offlineId": "M"}])
+
+
+# ---------------------------------------------------------------------------
+# apply_shopping_list_sync
+# ---------------------------------------------------------------------------
+
+apply_shopping_list_sync = _utils.apply_shopping_list_sync
+
+
+class TestApplyShoppingListSync:
+    def _list(self):
+        return {
+            "offlineId": "L",
+            "title": "Handla",
+            "rows": [
+                _row("a", productName="Mjölk", isStrikedOver=False),
+                _row("b", productName="Bröd", isStrikedOver=False),
+            ],
+        }
+
+    def test_changed_row_is_updated(self):
+        result = apply_shopping_list_sync(
+            self._list(),
+            {"offlineId": "L", "changedRows": [_row("a", isStrikedOver=True)]},
+        )
+        assert result["rows"][0] == _row("a", productName="Mjölk", isStrikedOver=True)
+        assert result["title"] == "Handla"
+
+    def test_created_row_is_appended(self):
+        result = apply_shopping_list_sync(
+            self._list(),
+            {"offlineId": "L", "createdRows": [_row("c", productName="Ost")]},
+        )
+        assert [r["offlineId"] for r in result["rows"]] == ["a", "b", "c"]
+
+    def test_deleted_row_is_removed(self):
+        result = apply_shopping_list_sync(
+            self._list(), {"offlineId": "L", "deletedRows": ["b"]}
+        )
+        assert [r["offlineId"] for r in result["rows"]] == ["a"]
+
+    def test_unknown_changed_row_is_ignored(self):
+        result = apply_shopping_list_sync(
+            self._list(),
+            {"offlineId": "L", "changedRows": [_row("x", isStrikedOver=True)]},
+        )
+        assert result["rows"] == self._list()["rows"]
+
+    def test_applying_twice_does_not_duplicate_created_rows(self):
+        sync = {"offlineId": "L", "createdRows": [_row("c", productName="Ost")]}
+        once = apply_shopping_list_sync(self._list(), sync)
+        twice = apply_shopping_list_sync(once, sync)
+        assert twice == once
+
+    def test_input_is_not_mutated(self):
+        shopping_list = self._list()
+        apply_shopping_list_sync(
+            shopping_list,
+            {
+                "offlineId": "L",
+                "changedRows": [_row("a", isStrikedOver=True)],
+                "deletedRows": ["b"],
+            },
+        )
+        assert shopping_list == self._list()
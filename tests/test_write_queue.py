@@ -0,0 +1,102 @@
+"""Tests for the batching of shopping list mutations."""
+
+import asyncio
+import datetime as dt
+
+import pytest
+
+pytest.importorskip("pytest_homeassistant_custom_component")
+
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import (
+    async_fire_time_changed,
+)
+
+from custom_components.ica.write_queue import ShoppingListWriteQueue
+
+
+def _sync(*changed: str) -> dict:
+    return {
+        "offlineId": "L",
+        "changedRows": [
+            {"offlineId": row_id, "isStrikedOver": True} for row_id in changed
+        ],
+    }
+
+
+class _Submitter:
+    def __init__(self, error: Exception | None = None) -> None:
+        self.error = error
+        self.submitted = []
+
+    async def __call__(self, sync):
+        self.submitted.append(sync)
+        if self.error:
+            raise self.error
+        return {"offlineId": sync["offlineId"], "rows": sync["changedRows"]}
+
+
+class TestShoppingListWriteQueue:
+    async def test_syncs_within_window_are_submitted_as_one(self, hass):
+        submit = _Submitter()
+        queue = ShoppingListWriteQueue(hass, submit, 2)
+
+        tasks = [
+            hass.async_create_task(queue.async_enqueue(_sync(row_id)))
+            for row_id in ("a", "b")
+        ]
+        await asyncio.sleep(0)
+        assert submit.submitted == []
+
+        async_fire_time_changed(hass, dt_util.utcnow() + dt.timedelta(seconds=3))
+        first, second = await asyncio.gather(*tasks)
+        assert len(submit.submitted) == 1
+        assert [r["offlineId"] for r in submit.submitted[0]["changedRows"]] == [
+            "a",
+            "b",
+        ]
+        assert first is second
+
+    async def test_submitted_immediately_without_window(self, hass):
+        submit = _Submitter()
+        queue = ShoppingListWriteQueue(hass, submit, 0)
+
+        result = await queue.async_enqueue(_sync("a"))
+        assert result["rows"] == [{"offlineId": "a", "isStrikedOver": True}]
+        assert len(submit.submitted) == 1
+
+    async def test_failure_is_raised_to_every_caller(self, hass):
+        queue = ShoppingListWriteQueue(hass, _Submitter(ValueError("rejected")), 2)
+
+        tasks = [
+            hass.async_create_task(queue.async_enqueue(_sync(row_id)))
+            for row_id in ("a", "b")
+        ]
+        await asyncio.sleep(0)
+        await queue.async_flush()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert [str(result) for result in results] == ["rejected", "rejected"]
+
+    async def test_flush_cancels_the_window(self, hass):
+        submit = _Submitter()
+        queue = ShoppingListWriteQueue(hass, submit, 2)
+
+        task = hass.async_create_task(queue.async_enqueue(_sync("a")))
+        await asyncio.sleep(0)
+        await queue.async_flush()
+        await task
+        assert queue._flush_remover is None
+
+        async_fire_time_changed(hass, dt_util.utcnow() + dt.timedelta(seconds=3))
+        await hass.async_block_till_done()
+        assert len(submit.submitted) == 1
+
+    async def test_shutdown_submits_pending_syncs(self, hass):
+        submit = _Submitter()
+        queue = ShoppingListWriteQueue(hass, submit, 60)
+
+        task = hass.async_create_task(queue.async_enqueue(_sync("a")))
+        await asyncio.sleep(0)
+        await queue.async_shutdown()
+        assert (await task)["rows"][0]["offlineId"] == "a"
+        assert len(submit.submitted) == 1